@@ -0,0 +1,69 @@
+"""
+Compares the database backends: per-query overhead and how many queries they keep in flight.
+
+"latency" runs SELECT 1 sequentially through DatabaseUtility.execute_query and reports the
+mean and p99 round trip, including the pool checkout. "concurrency" starts N queries at once
+that each sleep on the server for --sleep seconds; with no client-side limit they finish in
+about one sleep, so N * sleep / elapsed is the number of queries that actually ran in
+parallel. The psycopg2 backend runs every call in a worker thread and is capped by the size
+of asyncio's default executor; asyncpg is only capped by the pool.
+
+Uses the source database from the .env used by the application; the largest --concurrency
+value has to stay below the server's max_connections.
+
+    python benchmarks/backends.py --queries 5000 --concurrency 10 50 90
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.backends import BACKENDS
+from utils.config import load_config
+from utils.database import DatabaseUtility
+from utils.pool import close_pools
+
+async def measure_latency(db: DatabaseUtility, queries: int):
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        await db.execute_query("SELECT 1")
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.99) - 1]
+
+async def measure_concurrency(db: DatabaseUtility, count: int, sleep: float) -> float:
+    start = time.monotonic()
+    await asyncio.gather(*(db.execute_query("SELECT pg_sleep(%s)", (sleep,)) for _ in range(count)))
+    return time.monotonic() - start
+
+async def benchmark(queries: int, levels, sleep: float) -> None:
+    config = load_config()
+    print(f"{'backend':<10}{'mean ms':>10}{'p99 ms':>10}" + "".join(f"{f'x{n} in flight':>16}" for n in levels))
+    for backend in BACKENDS:
+        db = DatabaseUtility(config['database']['source_db'], {"min_size": 1, "max_size": max(levels)}, backend)
+        try:
+            await db.connect()
+            # Warm up the pool, so opening connections is not measured.
+            await measure_concurrency(db, max(levels), 0)
+            mean, p99 = await measure_latency(db, queries)
+            parallel = []
+            for count in levels:
+                elapsed = await measure_concurrency(db, count, sleep)
+                parallel.append(count * sleep / elapsed)
+            print(f"{backend:<10}{mean * 1000:>10.3f}{p99 * 1000:>10.3f}" + "".join(f"{value:>16.1f}" for value in parallel))
+        finally:
+            await db.disconnect()
+            await close_pools()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=5000, help="sequential queries for the latency test")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 90], help="queries started at once")
+    parser.add_argument("--sleep", type=float, default=0.5, help="server-side seconds per concurrent query")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.queries, args.concurrency, args.sleep))
@@ -0,0 +1,193 @@
+"""
+Checks change data capture (sync.cdc) end to end against the databases of the .env.
+
+The source must run with wal_level = logical and its user needs the REPLICATION attribute.
+Creates two tables on both databases, one of them without a primary key, a publication and
+a slot for them (--slot), and checks:
+
+1. a row inserted into the keyless table after the slot was created, but before the initial
+   sync copies the table, reaches the target exactly once;
+2. an insert, update and delete on the source are applied to the target;
+3. a replicator process that crashes before committing a source transaction on the target
+   leaves the slot's confirmed position where it was, and a restarted replicator applies
+   the transaction;
+4. an update changing the key of a row keeps its unchanged TOAST value;
+5. a truncate on the source empties the target.
+
+The tables, the publication and the slot are dropped afterwards.
+
+    python benchmarks/cdc.py --timeout 30
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from replication import ChangeApplier, LogicalReplicator
+from sync_manager import SyncManager
+from utils.config import get_cdc_settings, load_config
+from utils.database import DatabaseUtility, quote_ident
+from utils.pgoutput import Commit
+from utils.pool import close_pools
+
+TABLE = "bench_cdc"
+KEYLESS_TABLE = "bench_cdc_keyless"
+
+def create_replicator(args) -> LogicalReplicator:
+    config = load_config()
+    config.setdefault("sync", {})["cdc"] = {"enabled": True, "slot_name": args.slot, "publication": args.slot,
+                                            "status_interval": 1, "retry_interval": 1}
+    return LogicalReplicator(config['database']['source_db'], config['database']['target_db'],
+                             {TABLE: TABLE, KEYLESS_TABLE: KEYLESS_TABLE},
+                             get_cdc_settings(config))
+
+def crash(args):
+    """Runs a replicator that exits right before committing the first source transaction with changes."""
+    handle = ChangeApplier.handle
+
+    def crashing_handle(self, message):
+        if isinstance(message, Commit) and self.changes:
+            self._flush()
+            print(f"replicator {os.getpid()}: crashing before committing LSN {message.end_lsn} on the target", flush=True)
+            os._exit(1)
+        return handle(self, message)
+
+    ChangeApplier.handle = crashing_handle
+    asyncio.run(create_replicator(args).run())
+
+async def replicate_until(args, target_db: DatabaseUtility, expected: dict) -> dict:
+    """Runs a replicator until the target table holds the expected rows or the timeout passes."""
+    replicator = create_replicator(args)
+    task = asyncio.create_task(replicator.run())
+    try:
+        deadline = time.monotonic() + args.timeout
+        while True:
+            rows = await target_rows(target_db)
+            if rows == expected or time.monotonic() > deadline:
+                return rows
+            await asyncio.sleep(0.2)
+    finally:
+        replicator.stop()
+        await task
+
+async def target_rows(target_db: DatabaseUtility) -> dict:
+    return {row[0]: row[1] for row in await target_db.execute_query(f"SELECT id, value FROM {TABLE}")}
+
+async def keyless_rows(db: DatabaseUtility) -> list:
+    return [tuple(row) for row in await db.execute_query(f"SELECT id, value FROM {KEYLESS_TABLE} ORDER BY id, value")]
+
+async def initial_sync(source_db: DatabaseUtility, target_db: DatabaseUtility, snapshot: str) -> None:
+    """Copies the keyless table from the snapshot the slot was created with, as the startup sync does."""
+    sync_manager = SyncManager(source_db, target_db, {KEYLESS_TABLE: KEYLESS_TABLE}, table_locks=False)
+    await sync_manager.sync(snapshot)
+
+async def confirmed_lsn(source_db: DatabaseUtility, slot: str) -> str:
+    rows = await source_db.execute_query(
+        "SELECT confirmed_flush_lsn::text FROM pg_catalog.pg_replication_slots WHERE slot_name = %s", (slot,))
+    return rows[0][0]
+
+async def drop_slot(source_db: DatabaseUtility, slot: str) -> None:
+    # The walsender of a stopped replicator may take a moment to release the slot.
+    for _ in range(50):
+        rows = await source_db.execute_query(
+            "SELECT active FROM pg_catalog.pg_replication_slots WHERE slot_name = %s", (slot,))
+        if not rows:
+            return
+        if not rows[0][0]:
+            await source_db.execute_query("SELECT pg_catalog.pg_drop_replication_slot(%s)", (slot,))
+            return
+        await asyncio.sleep(0.2)
+    print(f"slot '{slot}' is still active, drop it with pg_drop_replication_slot")
+
+def check(name: str, actual, expected) -> bool:
+    ok = actual == expected
+    print(f"{'ok' if ok else 'FAILED':<8}{name}" + ("" if ok else f": expected {expected}, got {actual}"))
+    return ok
+
+async def run(args) -> bool:
+    config = load_config()
+    source_db = DatabaseUtility(config['database']['source_db'])
+    target_db = DatabaseUtility(config['database']['target_db'])
+    await source_db.connect()
+    await target_db.connect()
+    results = []
+    try:
+        await drop_slot(source_db, args.slot)
+        await source_db.execute_query(f"DROP PUBLICATION IF EXISTS {quote_ident(args.slot)}")
+        for db in (source_db, target_db):
+            await db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+            await db.execute_query(f"CREATE TABLE {TABLE} (id integer PRIMARY KEY, value text)")
+            await db.execute_query(f"DROP TABLE IF EXISTS {KEYLESS_TABLE}")
+            await db.execute_query(f"CREATE TABLE {KEYLESS_TABLE} (id integer, value text)")
+        await source_db.execute_query(f"INSERT INTO {KEYLESS_TABLE} VALUES (1, 'copied')")
+        with create_replicator(args).initial_snapshot() as snapshot:
+            # Committed after the slot's consistent point, so the stream replays it; a copy
+            # reading a later snapshot would copy it as well and the replay would duplicate it.
+            await source_db.execute_query(f"INSERT INTO {KEYLESS_TABLE} VALUES (2, 'replayed')")
+            await initial_sync(source_db, target_db, snapshot)
+
+        await source_db.execute_query(f"INSERT INTO {TABLE} VALUES (1, 'a'), (2, 'b'), (3, 'c')")
+        await source_db.execute_query(f"UPDATE {TABLE} SET value = 'B' WHERE id = 2")
+        await source_db.execute_query(f"DELETE FROM {TABLE} WHERE id = 3")
+        expected = {1: "a", 2: "B"}
+        results.append(check("insert, update and delete applied", await replicate_until(args, target_db, expected),
+                             expected))
+        # Committed before the changes just checked, so it has been replayed by now.
+        results.append(check("row inserted between slot creation and copy applied once",
+                             await keyless_rows(target_db), [(1, "copied"), (2, "replayed")]))
+
+        before = await confirmed_lsn(source_db, args.slot)
+        await source_db.execute_query(f"INSERT INTO {TABLE} VALUES (4, 'd')")
+        await source_db.execute_query(f"UPDATE {TABLE} SET value = 'A' WHERE id = 1")
+        command = [sys.executable, os.path.abspath(__file__), "--role", "crash", "--slot", args.slot]
+        process = await asyncio.to_thread(subprocess.run, command, timeout=args.timeout)
+        results.append(check("replicator crashed before its target commit", process.returncode, 1))
+        results.append(check("target unchanged after the crash", await target_rows(target_db), expected))
+        results.append(check("slot position not confirmed after the crash", await confirmed_lsn(source_db, args.slot),
+                             before))
+        expected = {1: "A", 2: "B", 4: "d"}
+        results.append(check("changes replayed after the restart", await replicate_until(args, target_db, expected),
+                             expected))
+        results.append(check("slot position confirmed after the target commit",
+                             await confirmed_lsn(source_db, args.slot) != before, True))
+
+        # Large enough to be stored out of line, so the update sends it as an unchanged TOAST value
+        # next to a key-only old tuple.
+        await source_db.execute_query(f"INSERT INTO {TABLE} SELECT 6, string_agg(md5(g::text), '' ORDER BY g) "
+                                      "FROM generate_series(1, 2000) g")
+        await source_db.execute_query(f"UPDATE {TABLE} SET id = 7 WHERE id = 6")
+        large = "".join(hashlib.md5(str(g).encode()).hexdigest() for g in range(1, 2001))
+        expected = {1: "A", 2: "B", 4: "d", 7: large}
+        results.append(check("key change keeps an unchanged TOAST value",
+                             await replicate_until(args, target_db, expected) == expected, True))
+
+        await source_db.execute_query(f"TRUNCATE {TABLE}")
+        await source_db.execute_query(f"INSERT INTO {TABLE} VALUES (5, 'e')")
+        expected = {5: "e"}
+        results.append(check("truncate applied", await replicate_until(args, target_db, expected), expected))
+    finally:
+        await drop_slot(source_db, args.slot)
+        await source_db.execute_query(f"DROP PUBLICATION IF EXISTS {quote_ident(args.slot)}")
+        for db in (source_db, target_db):
+            await db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+            await db.execute_query(f"DROP TABLE IF EXISTS {KEYLESS_TABLE}")
+        await source_db.disconnect()
+        await target_db.disconnect()
+        await close_pools()
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", choices=("check", "crash"), default="check", help=argparse.SUPPRESS)
+    parser.add_argument("--slot", default="pg_db_sync_check", help="name of the slot and publication to create")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for changes to arrive")
+    args = parser.parse_args()
+    if args.role == "crash":
+        crash(args)
+    else:
+        sys.exit(0 if asyncio.run(run(args)) else 1)
@@ -0,0 +1,83 @@
+"""
+Compares the throughput of text and binary COPY transfers.
+
+Creates a wide numeric table and a bytea table on the source database (from the .env used by
+the application), copies each into the target several times per format and reports the best
+run. "binary+decode" additionally decodes and re-encodes every row with the codec registry,
+which is the overhead a transform adds.
+
+    python benchmarks/copy_formats.py --rows 200000 --runs 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from transfer_engine import CopyTransfer
+from utils.config import load_config
+from utils.database import DatabaseUtility
+from utils.pool import close_pools
+
+NUMERIC_COLUMNS = 20
+
+TABLES = {
+    "bench_wide_numeric": (
+        "id bigint PRIMARY KEY, " + ", ".join(f"n{i} numeric(18,6)" for i in range(NUMERIC_COLUMNS)),
+        "SELECT g, " + ", ".join(f"round((random() * 1e9)::numeric, 6)" for _ in range(NUMERIC_COLUMNS))
+        + " FROM generate_series(1, %s) g",
+    ),
+    "bench_bytea": (
+        "id bigint PRIMARY KEY, payload bytea",
+        "SELECT g, decode(repeat(md5(g::text), 64), 'hex') FROM generate_series(1, %s) g",
+    ),
+}
+
+VARIANTS = (("text", "text", None), ("binary", "binary", None), ("binary+decode", "binary", lambda row: row))
+
+async def benchmark(rows: int, runs: int) -> None:
+    config = load_config()
+    source_db = DatabaseUtility(config['database']['source_db'])
+    target_db = DatabaseUtility(config['database']['target_db'])
+    await source_db.connect()
+    await target_db.connect()
+    transfer = CopyTransfer(source_db, target_db)
+    try:
+        for table, (definition, fill) in TABLES.items():
+            await source_db.execute_query(f"DROP TABLE IF EXISTS {table}")
+            await source_db.execute_query(f"CREATE TABLE {table} ({definition})")
+            await source_db.execute_query(f"INSERT INTO {table} {fill}", (rows,))
+            await source_db.execute_query(f"ANALYZE {table}")
+            size = (await source_db.execute_query("SELECT pg_total_relation_size(%s::regclass)", (table,)))[0][0]
+            columns = await source_db.get_table_columns(table)
+            await target_db.execute_query(f"DROP TABLE IF EXISTS {table}")
+            await target_db.create_table(table, columns)
+
+            print(f"\n{table}: {rows} rows, {size / 1024 / 1024:.1f} MB on disk")
+            print(f"{'format':<15}{'seconds':>10}{'rows/s':>12}{'MB/s':>10}{'client CPU s':>14}")
+            for name, copy_format, transform in VARIANTS:
+                best = None
+                for _ in range(runs):
+                    await target_db.truncate_table(table)
+                    wall, cpu = time.monotonic(), time.process_time()
+                    await transfer.transfer(table, table, columns, copy_format=copy_format, transform=transform)
+                    result = (time.monotonic() - wall, time.process_time() - cpu)
+                    best = min(best or result, result)
+                elapsed, cpu = best
+                print(f"{name:<15}{elapsed:>10.2f}{rows / elapsed:>12.0f}{size / elapsed / 1024 / 1024:>10.1f}{cpu:>14.2f}")
+
+            await source_db.execute_query(f"DROP TABLE {table}")
+            await target_db.execute_query(f"DROP TABLE {table}")
+    finally:
+        await source_db.disconnect()
+        await target_db.disconnect()
+        await close_pools()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="rows per table")
+    parser.add_argument("--runs", type=int, default=3, help="runs per format; the best one is reported")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.rows, args.runs))
@@ -0,0 +1,112 @@
+"""
+Runs a distributed sync with worker processes on this machine and checks the result.
+
+Starts --workers worker processes (the same as python src/main.py --worker), runs a sync as
+the coordinator that leaves all copying to them, and compares the row counts of every table
+on source and target afterwards. Tables are split into --chunks chunks regardless of size.
+
+With --crash-after N the first worker exits abruptly right before committing its Nth chunk,
+as if its node died mid-copy. Its lease runs out after --lease seconds and another worker
+copies the chunk again; the row counts show whether it was committed exactly once.
+
+Uses the databases from the .env used by the application.
+
+    python benchmarks/distributed.py --workers 3 --chunks 8 --crash-after 1
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from lease_queue import LeaseQueue
+from main import run_worker, sync_data
+from utils.config import load_config
+from utils.database import DatabaseUtility, quote_ident
+from utils.pool import close_pools
+
+def distributed_config(args, local_worker: bool = False):
+    config = load_config()
+    sync = config.setdefault("sync", {})
+    sync["distributed"] = {"enabled": True, "local_worker": local_worker, "lease_seconds": args.lease,
+                           "heartbeat_interval": args.lease / 3, "poll_interval": 0.2}
+    sync.setdefault("concurrency", {}).update({"chunks_per_table": args.chunks, "chunk_min_bytes": 1})
+    # Every table is copied, so the counts are checked for all of them.
+    sync["change_detection"] = {"enabled": False}
+    return config
+
+def worker(args):
+    if args.crash_after:
+        complete = LeaseQueue.complete
+        completed = []
+
+        async def crashing_complete(self, lease, rows, conn=None):
+            completed.append(lease.id)
+            if len(completed) == args.crash_after:
+                print(f"worker {os.getpid()}: crashing before committing chunk {lease.id}", flush=True)
+                os._exit(1)
+            await complete(self, lease, rows, conn)
+
+        LeaseQueue.complete = crashing_complete
+    asyncio.run(run_worker(distributed_config(args)))
+
+async def row_counts(db_config) -> dict:
+    db = DatabaseUtility(db_config)
+    await db.connect()
+    try:
+        tables = await db.fetch_all_tables()
+        counts = {}
+        for table in tables:
+            if table.startswith("pg_db_sync_"):
+                continue
+            rows = await db.execute_query(f"SELECT count(*) FROM {quote_ident(table)}")
+            counts[table] = rows[0][0]
+        return counts
+    finally:
+        await db.disconnect()
+
+async def coordinate(args) -> None:
+    config = distributed_config(args)
+    start = time.monotonic()
+    await sync_data(config)
+    print(f"distributed sync finished in {time.monotonic() - start:.2f}s")
+    source, target = await row_counts(config['database']['source_db']), await row_counts(config['database']['target_db'])
+    await close_pools()
+    print(f"{'table':<30}{'source':>12}{'target':>12}")
+    for table, count in sorted(source.items()):
+        mark = "" if target.get(table) == count else "  MISMATCH"
+        print(f"{table:<30}{count:>12}{target.get(table, '-'):>12}{mark}")
+
+def main(args):
+    workers = []
+    for number in range(args.workers):
+        command = [sys.executable, os.path.abspath(__file__), "--role", "worker", "--lease", str(args.lease),
+                   "--chunks", str(args.chunks)]
+        if number == 0 and args.crash_after:
+            command += ["--crash-after", str(args.crash_after)]
+        workers.append(subprocess.Popen(command))
+    try:
+        asyncio.run(coordinate(args))
+    finally:
+        for process in workers:
+            if process.poll() is None:
+                process.terminate()
+        for process in workers:
+            process.wait()
+            print(f"worker {process.pid} exited with {process.returncode}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", choices=("coordinator", "worker"), default="coordinator", help=argparse.SUPPRESS)
+    parser.add_argument("--workers", type=int, default=3, help="worker processes to start")
+    parser.add_argument("--chunks", type=int, default=8, help="chunks per table")
+    parser.add_argument("--lease", type=float, default=6, help="lease duration in seconds")
+    parser.add_argument("--crash-after", type=int, default=0, help="crash the first worker before its Nth commit")
+    args = parser.parse_args()
+    if args.role == "worker":
+        worker(args)
+    else:
+        main(args)
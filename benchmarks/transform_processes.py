@@ -0,0 +1,92 @@
+"""
+Compares a transform-heavy sync in the syncing process with the process pool (sync.processes).
+
+Creates a table on the source database (from the .env used by the application) and syncs it
+with a row transform that masks an e-mail column and spends --rounds rounds of pure Python
+work per row, first in the syncing process and then with each --workers number of processes.
+The table is split into --chunks chunks and re-created on the target before every run.
+
+    python benchmarks/transform_processes.py --rows 200000 --workers 2 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from main import sync_data
+from utils.config import load_config
+from utils.database import DatabaseUtility
+from utils.pool import close_pools
+
+TABLE = "bench_transform"
+# The pool processes import the transform by this name; they inherit the environment, and with it the rounds.
+TRANSFORM = "transform_processes:scramble"
+ROUNDS_VARIABLE = "BENCH_TRANSFORM_ROUNDS"
+
+def scramble(row):
+    """Masks the e-mail address and stores a checksum computed in pure Python."""
+    row_id, email, note, _ = row
+    name, _, domain = email.partition("@")
+    masked = f"{name[:2]}***@{domain}"
+    checksum = row_id
+    for _ in range(int(os.environ.get(ROUNDS_VARIABLE, "20"))):
+        for char in note:
+            checksum = (checksum * 31 + ord(char)) % 1000000007
+    return [row_id, masked, note, checksum]
+
+def benchmark_config(args, workers: int = 0):
+    config = load_config()
+    sync = config.setdefault("sync", {})
+    sync["tables"] = [{"source": TABLE, "target": TABLE, "transform": TRANSFORM}]
+    sync.setdefault("concurrency", {}).update({"chunks_per_table": args.chunks, "chunk_min_bytes": 1})
+    sync["change_detection"] = {"enabled": False}
+    sync["processes"] = {"enabled": workers > 0, "workers": workers or 1}
+    return config
+
+async def run(args) -> None:
+    os.environ[ROUNDS_VARIABLE] = str(args.rounds)
+    config = load_config()
+    source_db = DatabaseUtility(config['database']['source_db'])
+    target_db = DatabaseUtility(config['database']['target_db'])
+    await source_db.connect()
+    await target_db.connect()
+    try:
+        await source_db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+        await source_db.execute_query(f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, email text, note text, checksum bigint)")
+        await source_db.execute_query(f"INSERT INTO {TABLE} SELECT g, 'user' || g || '@example.com', md5(g::text), 0 "
+                                      "FROM generate_series(1, %s) g", (args.rows,))
+        await source_db.execute_query(f"ANALYZE {TABLE}")
+
+        print(f"{args.rows} rows, {args.rounds} rounds per row, {args.chunks} chunks")
+        print(f"{'processes':<12}{'seconds':>10}{'rows/s':>12}{'speedup':>10}{'parent CPU s':>14}")
+        baseline = None
+        for workers in [0] + args.workers:
+            await target_db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+            wall, cpu = time.monotonic(), time.process_time()
+            await sync_data(benchmark_config(args, workers), tables=[TABLE])
+            elapsed, cpu = time.monotonic() - wall, time.process_time() - cpu
+            baseline = baseline or elapsed
+            unmasked = await target_db.execute_query(f"SELECT count(*) FROM {TABLE} WHERE email NOT LIKE '%%***@%%'")
+            copied = await target_db.execute_query(f"SELECT count(*) FROM {TABLE}")
+            if copied[0][0] != args.rows or unmasked[0][0]:
+                print(f"run with {workers} processes copied {copied[0][0]} rows, {unmasked[0][0]} not transformed")
+            print(f"{workers or 'none':<12}{elapsed:>10.2f}{args.rows / elapsed:>12.0f}{baseline / elapsed:>10.2f}{cpu:>14.2f}")
+
+        await source_db.execute_query(f"DROP TABLE {TABLE}")
+        await target_db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+    finally:
+        await source_db.disconnect()
+        await target_db.disconnect()
+        await close_pools()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="rows in the table")
+    parser.add_argument("--rounds", type=int, default=20, help="rounds of checksum work per row")
+    parser.add_argument("--chunks", type=int, default=8, help="chunks the table is split into")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4], help="process counts to compare")
+    args = parser.parse_args()
+    asyncio.run(run(args))
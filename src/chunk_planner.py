@@ -0,0 +1,125 @@
+from typing import Dict, List, Optional
+
+from models.chunk import TableChunk
+from utils.database import DatabaseUtility, quote_ident
+from utils.logger import Logger
+
+logger = Logger('chunk_planner')
+
+INTEGER_TYPES = ("smallint", "integer", "bigint")
+
+# TID Range Scans, which let a ctid range read only its own blocks, arrived in PostgreSQL 14.
+TID_RANGE_SCAN_VERSION = 140000
+
+class ChunkPlanner:
+    def __init__(self, source_db: DatabaseUtility):
+        """
+        Splits tables into disjoint chunks that can be copied concurrently.
+
+        Args:
+            source_db (DatabaseUtility): The database the chunks are read from.
+        """
+        self.source_db = source_db
+        self._server_version = None
+
+    async def plan(self, table_name: str, columns: List[Dict], chunk_count: int, pages: int = 0) -> List[TableChunk]:
+        """
+        Splits a table into up to chunk_count ranges of its primary key, or of its physical
+        block numbers when it has none.
+
+        Range bounds come from the pg_stats histogram of the leading primary key column, so
+        skewed keys still yield evenly sized chunks; integer keys without statistics are split
+        evenly between their min and max. Tables without a primary key are split into ctid
+        block ranges on PostgreSQL 14+, where each range is read with a TID Range Scan.
+        Anything else is returned as a single chunk.
+
+        Args:
+            table_name (str): The name of the table.
+            columns (List[Dict]): Column definitions as returned by get_table_columns.
+            chunk_count (int): The desired number of chunks.
+            pages (int, optional): The heap size in blocks (pg_class.relpages). Defaults to 0.
+
+        Returns:
+            List[TableChunk]: The chunks, together covering every row exactly once.
+        """
+        if chunk_count <= 1:
+            return [TableChunk()]
+
+        key_column = leading_key_column(columns)
+        if key_column is None:
+            if pages >= chunk_count and await self._supports_tid_range_scan():
+                chunks = ctid_range_chunks(pages, chunk_count)
+                logger.info(f"Table '{table_name}' has no primary key, split it into {len(chunks)} ctid block ranges")
+                return chunks
+            logger.info(f"Table '{table_name}' has no primary key, copying it as a single stream")
+            return [TableChunk()]
+
+        bounds = await self._key_bounds(table_name, key_column, chunk_count)
+        if not bounds:
+            logger.info(f"No usable bounds for '{table_name}.{key_column['name']}', copying it as a single stream")
+            return [TableChunk()]
+
+        chunks = key_range_chunks(key_column, bounds)
+        logger.info(f"Split table '{table_name}' into {len(chunks)} chunks on '{key_column['name']}'")
+        return chunks
+
+    async def _supports_tid_range_scan(self) -> bool:
+        if self._server_version is None:
+            self._server_version = await self.source_db.get_server_version()
+        return self._server_version >= TID_RANGE_SCAN_VERSION
+
+    async def _key_bounds(self, table_name: str, key_column: Dict, chunk_count: int) -> List[str]:
+        """Returns chunk_count - 1 ascending split points for the key column, as text."""
+        histogram = await self.source_db.get_histogram_bounds(table_name, key_column['name'])
+        if len(histogram) > 2:
+            return histogram_split_points(histogram, chunk_count)
+
+        if key_column['type'] in INTEGER_TYPES:
+            low, high = await self.source_db.get_column_range(table_name, key_column['name'])
+            if low is None:
+                return []
+            # Integer arithmetic: bigint keys above 2**53 do not survive a float step.
+            bounds = [low + (high - low + 1) * i // chunk_count for i in range(1, chunk_count)]
+            return [str(bound) for bound in dict.fromkeys(bounds) if bound > low]
+
+        return []
+
+def leading_key_column(columns: List[Dict]) -> Optional[Dict]:
+    """Returns the first column of the primary key, or None if the table has none."""
+    key_columns = [col for col in columns if col.get('primary_key')]
+    if not key_columns:
+        return None
+    return min(key_columns, key=lambda col: col['primary_key'])
+
+def histogram_split_points(histogram: List[str], chunk_count: int) -> List[str]:
+    """Picks up to chunk_count - 1 distinct split points from sorted histogram bounds."""
+    last = len(histogram) - 1
+    bounds = [histogram[round(i * last / chunk_count)] for i in range(1, chunk_count)]
+    return list(dict.fromkeys(bounds))
+
+def key_range_chunks(key_column: Dict, bounds: List[str]) -> List[TableChunk]:
+    """
+    Builds half-open key ranges from ascending split points; the first and last ranges are
+    unbounded so rows outside the sampled statistics are still covered.
+    """
+    ident = quote_ident(key_column['name'])
+    cast = f"::{key_column['type']}"
+    chunks = [TableChunk(f"{ident} < %s{cast}", (bounds[0],), f"{key_column['name']} < {bounds[0]}")]
+    for low, high in zip(bounds, bounds[1:]):
+        chunks.append(TableChunk(f"{ident} >= %s{cast} AND {ident} < %s{cast}", (low, high),
+                                 f"{low} <= {key_column['name']} < {high}"))
+    chunks.append(TableChunk(f"{ident} >= %s{cast}", (bounds[-1],), f"{key_column['name']} >= {bounds[-1]}"))
+    return chunks
+
+def ctid_range_chunks(pages: int, chunk_count: int) -> List[TableChunk]:
+    """
+    Splits a heap of the given number of blocks into disjoint ctid ranges. The last range
+    is unbounded, so blocks added since relpages was last updated are still covered.
+    """
+    bounds = [round(i * pages / chunk_count) for i in range(1, chunk_count)]
+    bounds = [f"({block},0)" for block in dict.fromkeys(bounds)]
+    chunks = [TableChunk("ctid < %s::tid", (bounds[0],), f"ctid < {bounds[0]}")]
+    for low, high in zip(bounds, bounds[1:]):
+        chunks.append(TableChunk("ctid >= %s::tid AND ctid < %s::tid", (low, high), f"{low} <= ctid < {high}"))
+    chunks.append(TableChunk("ctid >= %s::tid", (bounds[-1],), f"ctid >= {bounds[-1]}"))
+    return chunks
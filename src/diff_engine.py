@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import nullcontext
+from typing import Dict, List
+
+from chunk_planner import histogram_split_points, key_range_chunks, leading_key_column
+from models.chunk import TableChunk
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+
+logger = Logger('diff_engine')
+
+class DiffEngine:
+    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility, fanout: int = 16,
+                 leaf_rows: int = 10000, max_depth: int = 8, slots=None):
+        """
+        Finds the primary key ranges in which a target table differs from its source.
+
+        Both sides of a range are checksummed concurrently; ranges that differ are split into
+        fanout sub-ranges and compared again, like walking down a Merkle tree, until they are
+        small enough to be re-copied. Matching ranges are never transferred.
+
+        Args:
+            source_db (DatabaseUtility): The database to read from.
+            target_db (DatabaseUtility): The database to compare against.
+            fanout (int, optional): The number of sub-ranges a differing range is split into. Defaults to 16.
+            leaf_rows (int, optional): Ranges with at most this many rows are re-copied whole. Defaults to 10000.
+            max_depth (int, optional): The deepest level ranges are split to. Defaults to 8.
+            slots (optional): A callable returning an async context manager held around each
+                comparison, e.g. to cap the connections in use. Defaults to no limit.
+        """
+        self.source_db = source_db
+        self.target_db = target_db
+        self.fanout = max(2, fanout)
+        self.leaf_rows = leaf_rows
+        self.max_depth = max_depth
+        self.slots = slots or nullcontext
+
+    async def changed_ranges(self, source_table: str, target_table: str, columns: List[Dict],
+                             snapshot: str = None) -> List[TableChunk]:
+        """
+        Compares a table on both databases and returns the key ranges that need to be re-copied.
+
+        The returned ranges are disjoint and cover every differing row, including rows that only
+        exist on the target, so replacing them makes the target equal to the source.
+
+        Args:
+            source_table (str): The name of the table to read from.
+            target_table (str): The name of the table to compare against.
+            columns (List[Dict]): Column definitions as returned by get_table_columns; the table
+                needs a primary key.
+            snapshot (str, optional): An exported source snapshot to read from. Defaults to None.
+
+        Returns:
+            List[TableChunk]: The ranges that differ.
+        """
+        key_column = leading_key_column(columns)
+        if key_column is None:
+            raise ValueError(f"Table '{source_table}' has no primary key to compare ranges by")
+        column_names = [col['name'] for col in columns]
+        changed = []
+        compared = {"ranges": 0, "rows": 0, "changed_rows": 0}
+
+        async def _visit(chunk: TableChunk, depth: int):
+            async with self.slots():
+                (source_rows, source_sum), (target_rows, target_sum) = await asyncio.gather(
+                    self.source_db.get_range_checksum(source_table, column_names, chunk.where, chunk.params or None, snapshot),
+                    self.target_db.get_range_checksum(target_table, column_names, chunk.where, chunk.params or None))
+            compared["ranges"] += 1
+            if depth == 0:
+                compared["rows"] = source_rows
+            if source_rows == target_rows and source_sum == target_sum:
+                return
+
+            # A side without rows has nothing to narrow down; neither has a range that is small enough.
+            if (source_rows == 0 or target_rows == 0 or max(source_rows, target_rows) <= self.leaf_rows
+                    or depth >= self.max_depth):
+                changed.append(chunk)
+                compared["changed_rows"] += source_rows
+                return
+
+            children = await self._split(source_table, key_column, chunk, depth, snapshot)
+            if len(children) < 2:
+                changed.append(chunk)
+                compared["changed_rows"] += source_rows
+                return
+            await asyncio.gather(*(_visit(child, depth + 1) for child in children))
+
+        await _visit(TableChunk(), 0)
+        logger.info(f"Compared '{source_table}' with '{target_table}' in {compared['ranges']} range checksums: "
+                    f"{len(changed)} ranges with {compared['changed_rows']} of {compared['rows']} source rows differ")
+        return changed
+
+    async def _split(self, table_name: str, key_column: Dict, chunk: TableChunk, depth: int,
+                     snapshot: str = None) -> List[TableChunk]:
+        """Splits a range into up to fanout sub-ranges of about equal row counts."""
+        bounds = []
+        if depth == 0:
+            # The statistics are free to read and good enough for the first, coarsest level.
+            histogram = await self.source_db.get_histogram_bounds(table_name, key_column['name'])
+            if len(histogram) > 2:
+                bounds = histogram_split_points(histogram, self.fanout)
+        if not bounds:
+            async with self.slots():
+                bounds = await self.source_db.get_key_quantiles(table_name, key_column['name'], self.fanout,
+                                                                chunk.where, chunk.params or None, snapshot)
+        if not bounds:
+            return []
+
+        children = key_range_chunks(key_column, bounds)
+        if not chunk.where:
+            return children
+        return [TableChunk(f"({chunk.where}) AND {child.where}", tuple(chunk.params) + tuple(child.params),
+                           f"{chunk.label}, {child.label}") for child in children]
@@ -0,0 +1,148 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models.progress import SyncProgress
+from utils.logger import Logger
+
+logger = Logger('job_queue')
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue already holds its maximum of waiting jobs."""
+
+class SyncJob:
+    def __init__(self, tables: Optional[List[str]] = None):
+        """
+        One requested sync run and its outcome.
+
+        Args:
+            tables (List[str], optional): The source tables to sync. Defaults to None, every mapped table.
+        """
+        self.id = uuid.uuid4().hex
+        self.tables = sorted(set(tables)) if tables else None
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = SyncProgress()
+
+    def start(self) -> None:
+        """Marks the job as running; called by the job's run once the sync actually begins."""
+        self.status = "running"
+        self.started_at = time.time()
+        self.progress.started_at = self.started_at
+
+    @property
+    def key(self) -> Tuple:
+        """Jobs with the same key do the same work, so a new one is coalesced into a pending one."""
+        return tuple(self.tables) if self.tables else ("*",)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "requested_tables": self.tables,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if self.started_at is not None:
+            data.update(self.progress.to_dict())
+        return data
+
+class JobQueue:
+    def __init__(self, run: Callable[[SyncJob], Awaitable[None]], max_queued: int = 10, history: int = 100):
+        """
+        Runs submitted sync jobs in the background, one at a time, in submission order.
+
+        A job that asks for the same tables as a queued or running one is not queued again;
+        the caller gets the existing job instead, so repeated requests cost one run.
+
+        Args:
+            run (Callable[[SyncJob], Awaitable[None]]): Runs one job, calling job.start() when the sync
+                begins (until then the job is "waiting", e.g. for a scheduled run to finish) and
+                reporting into job.progress; raising marks the job as failed.
+            max_queued (int, optional): The number of jobs that may wait for the worker. Defaults to 10.
+            history (int, optional): The number of finished jobs kept for lookup. Defaults to 100.
+        """
+        self.run = run
+        self.history = history
+        self.jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._queue = asyncio.Queue(max_queued)
+        self._worker = None
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        """Cancels the job in progress and stops the worker; queued jobs are dropped."""
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    def submit(self, tables: Optional[List[str]] = None) -> Tuple[SyncJob, bool]:
+        """
+        Queues a sync of the given tables, or finds the unfinished job already doing it.
+
+        Args:
+            tables (List[str], optional): The source tables to sync. Defaults to every mapped table.
+
+        Returns:
+            Tuple[SyncJob, bool]: The job, and whether it was newly queued.
+
+        Raises:
+            QueueFullError: If the queue is full.
+        """
+        job = SyncJob(tables)
+        for existing in self.jobs.values():
+            if not existing.done and existing.key == job.key:
+                logger.info(f"Coalescing a sync request into job {existing.id} ({existing.status})")
+                return existing, False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self._queue.maxsize} sync jobs are already waiting")
+        self.jobs[job.id] = job
+        self._prune()
+        logger.info(f"Queued sync job {job.id} ({self._queue.qsize()} waiting)")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self.jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "waiting"
+            try:
+                await self.run(job)
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "cancelled"
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(getattr(e, "detail", e))
+                logger.error(f"Sync job {job.id} failed: {job.error}")
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+            if job.started_at is not None:
+                logger.info(f"Sync job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s")
+            else:
+                logger.info(f"Sync job {job.id} {job.status} before it started")
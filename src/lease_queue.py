@@ -0,0 +1,379 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.chunk import TableChunk
+from models.progress import SyncProgress
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+
+logger = Logger('lease_queue')
+
+RUNS_TABLE = "pg_db_sync_runs"
+CHUNKS_TABLE = "pg_db_sync_chunks"
+
+# Runs whose coordinator vanished this long ago are deleted with their chunks.
+STALE_RUN_RETENTION = "1 day"
+
+class LeaseLostError(Exception):
+    """Raised when a worker finishes a chunk whose lease has expired and was taken over."""
+
+class ChunkLease:
+    def __init__(self, row):
+        """
+        A chunk claimed by a worker, as stored in the chunk table.
+
+        Args:
+            row: A row of the chunk table joined with the snapshot of its run.
+        """
+        self.id = row['id']
+        self.run_id = row['run_id']
+        self.attempt = row['attempts']
+        self.source_table = row['source_table']
+        self.target_table = row['target_table']
+        self.columns = json.loads(row['column_defs'])
+        self.chunk = TableChunk(row['where_clause'], json.loads(row['params']), row['label'])
+        self.key_columns = json.loads(row['key_columns']) if row['key_columns'] else None
+        self.replace = row['replace_rows']
+        self.snapshot = row['snapshot']
+
+    def __repr__(self):
+        return f"ChunkLease({self.id}, {self.source_table}, {self.chunk.label}, attempt {self.attempt})"
+
+class LeaseQueue:
+    def __init__(self, target_db: DatabaseUtility, lease_seconds: float = 60, heartbeat_interval: float = 10,
+                 poll_interval: float = 1, max_attempts: int = 3, claim_timeout: float = 300):
+        """
+        A queue of table chunks in control tables on the target database, shared by a
+        coordinator that fills it and workers on any node that copy the chunks.
+
+        Workers claim a chunk with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+        never wait for each other or claim the same chunk, and hold it with a lease that they
+        renew while they copy. A chunk whose lease ran out, because its worker crashed or lost
+        its connection, is claimed again by the next worker until max_attempts is reached.
+        A worker marks its chunk done in the same transaction that commits the chunk's rows,
+        and only while it still holds the lease, so a chunk taken over from a slow worker is
+        never committed twice.
+
+        Runs carry a lease of their own, renewed by the coordinator while it waits; chunks of
+        a run whose coordinator is gone are no longer claimed.
+
+        Args:
+            target_db (DatabaseUtility): The database holding the control tables.
+            lease_seconds (float, optional): How long a lease lasts without a heartbeat. Defaults to 60.
+            heartbeat_interval (float, optional): Seconds between lease renewals. Defaults to 10.
+            poll_interval (float, optional): Seconds between polls for new or finished chunks. Defaults to 1.
+            max_attempts (int, optional): How often a chunk is leased before it fails. Defaults to 3.
+            claim_timeout (float, optional): Seconds a run may have pending chunks while no worker
+                holds or claims any, e.g. when no worker is running, before its tables fail. Defaults to 300.
+        """
+        self.target_db = target_db
+        self.lease_seconds = float(lease_seconds)
+        self.heartbeat_interval = float(heartbeat_interval)
+        self.poll_interval = float(poll_interval)
+        self.max_attempts = max_attempts
+        self.claim_timeout = float(claim_timeout)
+        self._ready = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_tables(self) -> None:
+        """Creates the control tables if they do not exist yet."""
+        async with self._lock:
+            if self._ready:
+                return
+            try:
+                await self._create_tables()
+            except Exception as e:
+                # CREATE TABLE IF NOT EXISTS can still collide with another process creating the same table.
+                logger.debug(f"Retrying control table creation: {e}")
+                await self._create_tables()
+            self._ready = True
+
+    async def _create_tables(self) -> None:
+        await self.target_db.execute_query(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                run_id TEXT PRIMARY KEY,
+                snapshot TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                expires_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+        await self.target_db.execute_query(f"""
+            CREATE TABLE IF NOT EXISTS {CHUNKS_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                run_id TEXT NOT NULL REFERENCES {RUNS_TABLE} (run_id) ON DELETE CASCADE,
+                source_table TEXT NOT NULL,
+                target_table TEXT NOT NULL,
+                column_defs TEXT NOT NULL,
+                where_clause TEXT,
+                params TEXT NOT NULL,
+                label TEXT NOT NULL,
+                key_columns TEXT,
+                replace_rows BOOLEAN NOT NULL DEFAULT false,
+                priority BIGINT NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_expires_at TIMESTAMPTZ,
+                rows_written BIGINT,
+                error TEXT
+            )
+        """)
+        await self.target_db.execute_query(
+            f"CREATE INDEX IF NOT EXISTS {CHUNKS_TABLE}_run_status ON {CHUNKS_TABLE} (run_id, status)")
+
+    async def create_run(self, snapshot: str = None) -> str:
+        """Registers a run reading from an exported source snapshot and returns its id."""
+        await self.ensure_tables()
+        await self.target_db.execute_query(
+            f"DELETE FROM {RUNS_TABLE} WHERE expires_at < now() - interval '{STALE_RUN_RETENTION}'")
+        run_id = uuid.uuid4().hex
+        await self.target_db.execute_query(
+            f"INSERT INTO {RUNS_TABLE} (run_id, snapshot, expires_at) VALUES (%s, %s, now() + %s * interval '1 second')",
+            (run_id, snapshot, self.lease_seconds))
+        return run_id
+
+    async def renew_run(self, run_id: str) -> None:
+        await self.target_db.execute_query(
+            f"UPDATE {RUNS_TABLE} SET expires_at = now() + %s * interval '1 second' WHERE run_id = %s",
+            (self.lease_seconds, run_id))
+
+    async def finish_run(self, run_id: str) -> None:
+        """Deletes a run and its chunks."""
+        await self.target_db.execute_query(f"DELETE FROM {RUNS_TABLE} WHERE run_id = %s", (run_id,))
+
+    async def add_chunks(self, run_id: str, source_table: str, target_table: str, columns: List[Dict],
+                         chunks: List[TableChunk], key_columns: List[str] = None, replace: bool = False,
+                         priority: int = 0) -> None:
+        """Queues the chunks of one table; chunks of larger tables (higher priority) are claimed first."""
+        rows = [{"run_id": run_id, "source_table": source_table, "target_table": target_table,
+                 "column_defs": json.dumps(columns), "where_clause": chunk.where,
+                 "params": json.dumps(list(chunk.params), default=str), "label": chunk.label,
+                 "key_columns": json.dumps(key_columns) if key_columns else None, "replace_rows": replace,
+                 "priority": priority}
+                for chunk in chunks]
+        await self.target_db.insert_data(CHUNKS_TABLE, rows, batch_size=1000)
+
+    async def claim(self, worker: str, run_id: str = None) -> Optional[ChunkLease]:
+        """
+        Leases the next pending chunk, or one whose lease expired, of any live run (or of one run).
+
+        Returns:
+            Optional[ChunkLease]: The claimed chunk, or None if there is nothing to do.
+        """
+        await self.ensure_tables()
+        run_filter = "AND c.run_id = %s" if run_id else ""
+        params = [worker, self.lease_seconds] + ([run_id] if run_id else []) + [self.max_attempts]
+        rows = await self.target_db.execute_returning(f"""
+            UPDATE {CHUNKS_TABLE} c
+            SET status = 'leased', worker = %s, attempts = c.attempts + 1,
+                lease_expires_at = now() + %s * interval '1 second'
+            FROM {RUNS_TABLE} r
+            WHERE r.run_id = c.run_id
+              AND c.id = (
+                SELECT c.id FROM {CHUNKS_TABLE} c
+                JOIN {RUNS_TABLE} r ON r.run_id = c.run_id
+                WHERE r.expires_at > now() {run_filter}
+                  AND (c.status = 'pending' OR (c.status = 'leased' AND c.lease_expires_at < now()))
+                  AND c.attempts < %s
+                ORDER BY c.priority DESC, c.id
+                LIMIT 1
+                FOR UPDATE OF c SKIP LOCKED)
+            RETURNING c.*, r.snapshot
+        """, tuple(params))
+        return ChunkLease(rows[0]) if rows else None
+
+    async def heartbeat(self, lease: ChunkLease) -> bool:
+        """Renews a lease; returns False if it has expired and been taken over."""
+        rows = await self.target_db.execute_returning(f"""
+            UPDATE {CHUNKS_TABLE} SET lease_expires_at = now() + %s * interval '1 second'
+            WHERE id = %s AND attempts = %s AND status = 'leased'
+            RETURNING id
+        """, (self.lease_seconds, lease.id, lease.attempt))
+        return bool(rows)
+
+    async def complete(self, lease: ChunkLease, rows: int, conn=None) -> None:
+        """
+        Marks a chunk done, inside the transaction of conn when given, which then still has to
+        be committed.
+
+        Raises:
+            LeaseLostError: If the lease was taken over by another worker.
+        """
+        done = await self.target_db.execute_returning(f"""
+            UPDATE {CHUNKS_TABLE} SET status = 'done', rows_written = %s, lease_expires_at = NULL, error = NULL
+            WHERE id = %s AND attempts = %s AND status = 'leased'
+            RETURNING id
+        """, (rows, lease.id, lease.attempt), commit=conn is None, conn=conn)
+        if not done:
+            raise LeaseLostError(f"The lease on chunk {lease.id} was lost")
+
+    async def fail(self, lease: ChunkLease, error: Exception) -> None:
+        """Releases a chunk after an error, for another attempt or for good after max_attempts."""
+        await self.target_db.execute_query(f"""
+            UPDATE {CHUNKS_TABLE}
+            SET status = CASE WHEN attempts < %s THEN 'pending' ELSE 'failed' END,
+                lease_expires_at = NULL, error = %s
+            WHERE id = %s AND attempts = %s AND status = 'leased'
+        """, (self.max_attempts, str(error), lease.id, lease.attempt))
+
+    async def poll(self, run_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Renews the run's lease, fails chunks whose last attempt expired, and returns the state
+        of every table of the run.
+
+        Returns:
+            Dict[Tuple[str, str], Dict[str, Any]]: Per (source_table, target_table): "open"
+                chunks (pending or leased), of which "leased", "failed" chunks, the "attempts" (leases)
+                of all chunks so far, "rows" written and the last "error".
+        """
+        await self.renew_run(run_id)
+        await self.target_db.execute_query(f"""
+            UPDATE {CHUNKS_TABLE}
+            SET status = 'failed', error = coalesce(error, 'lease expired') || ' (attempt ' || attempts || ')'
+            WHERE run_id = %s AND status = 'leased' AND lease_expires_at < now() AND attempts >= %s
+        """, (run_id, self.max_attempts))
+        rows = await self.target_db.execute_query(f"""
+            SELECT source_table, target_table,
+                   count(*) FILTER (WHERE status IN ('pending', 'leased')) AS open,
+                   count(*) FILTER (WHERE status = 'leased') AS leased,
+                   coalesce(sum(attempts), 0) AS attempts,
+                   count(*) FILTER (WHERE status = 'failed') AS failed,
+                   coalesce(sum(rows_written) FILTER (WHERE status = 'done'), 0) AS rows_written,
+                   max(error) FILTER (WHERE status = 'failed') AS error
+            FROM {CHUNKS_TABLE}
+            WHERE run_id = %s
+            GROUP BY source_table, target_table
+        """, (run_id,))
+        return {(row['source_table'], row['target_table']): {"open": row['open'], "leased": row['leased'],
+                                                              "attempts": int(row['attempts']), "failed": row['failed'],
+                                                              "rows": int(row['rows_written']), "error": row['error']}
+                for row in rows}
+
+    @asynccontextmanager
+    async def run(self, snapshot: str = None, progress: SyncProgress = None):
+        """Registers a run for the duration of an async with block and yields its DistributedRun."""
+        run_id = await self.create_run(snapshot)
+        distributed_run = DistributedRun(self, run_id, progress)
+        distributed_run.start()
+        logger.info(f"Started distributed run {run_id}")
+        try:
+            yield distributed_run
+        finally:
+            await distributed_run.close()
+            try:
+                await self.finish_run(run_id)
+            except Exception as e:
+                logger.warning(f"Could not delete distributed run {run_id}, it expires on its own: {e}")
+
+class DistributedRun:
+    def __init__(self, queue: LeaseQueue, run_id: str, progress: SyncProgress = None):
+        """
+        The coordinator's side of a run: queues the chunks of each table and waits for the
+        workers to finish them, polling the chunk table once per poll_interval for all tables.
+        When chunks stay pending for the queue's claim_timeout while no worker holds or claims
+        any, the tables waiting on them fail instead of waiting for workers that never come, and
+        so does every table queued afterwards.
+
+        Args:
+            queue (LeaseQueue): The queue the run lives in.
+            run_id (str): The id returned by LeaseQueue.create_run.
+            progress (SyncProgress, optional): Gets the rows of finished chunks. Defaults to None.
+        """
+        self.queue = queue
+        self.run_id = run_id
+        self.progress = progress
+        self._waiters: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._poller = None
+        self._attempts = 0
+        self._last_activity = time.monotonic()
+        self._idle_warned = False
+        self.unclaimed_error = None
+
+    async def copy(self, source_table: str, target_table: str, columns: List[Dict], chunks: List[TableChunk],
+                   key_columns: List[str] = None, replace: bool = False, priority: int = 0) -> int:
+        """
+        Queues the chunks of a table and waits until workers have copied all of them.
+
+        Returns:
+            int: The rows written.
+
+        Raises:
+            Exception: If a chunk failed max_attempts times.
+        """
+        if self.unclaimed_error is not None:
+            raise Exception(self.unclaimed_error)
+        pair = (source_table, target_table)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[pair] = waiter
+        try:
+            await self.queue.add_chunks(self.run_id, source_table, target_table, columns, chunks, key_columns,
+                                        replace, priority)
+            logger.info(f"Queued {len(chunks)} chunks of table '{source_table}' for the workers")
+            # New chunks restart the claim timeout, so a long planning phase does not count against them.
+            self._last_activity = time.monotonic()
+            return await waiter
+        finally:
+            self._waiters.pop(pair, None)
+
+    def start(self) -> None:
+        """Starts polling, which also keeps the run's lease alive."""
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.queue.poll_interval)
+            try:
+                tables = await self.queue.poll(self.run_id)
+            except Exception as e:
+                logger.warning(f"Could not poll distributed run {self.run_id}: {e}")
+                continue
+            self._check_claims(tables)
+            for pair, state in tables.items():
+                table_progress = self.progress.get(pair[0]) if self.progress is not None else None
+                if table_progress is not None and state["rows"] > table_progress.rows:
+                    table_progress.add_rows(state["rows"] - table_progress.rows)
+                waiter = self._waiters.get(pair)
+                if waiter is not None and not waiter.done() and state["open"] and self.unclaimed_error is not None:
+                    waiter.set_exception(Exception(self.unclaimed_error))
+                if waiter is None or waiter.done() or state["open"]:
+                    continue
+                if state["failed"]:
+                    waiter.set_exception(Exception(f"{state['failed']} chunks failed: {state['error']}"))
+                else:
+                    waiter.set_result(state["rows"])
+
+    def _check_claims(self, tables: Dict[Tuple[str, str], Dict[str, Any]]) -> None:
+        """
+        Sets unclaimed_error once the run's pending chunks have gone unclaimed for longer than the
+        claim timeout: no chunk leased, and no lease taken since the last one or since chunks were
+        queued. Warns halfway there.
+        """
+        if self.unclaimed_error is not None:
+            return
+        attempts = sum(state["attempts"] for state in tables.values())
+        now = time.monotonic()
+        busy = any(state["leased"] for state in tables.values()) or not any(state["open"] for state in tables.values())
+        if busy or attempts != self._attempts:
+            self._attempts = attempts
+            self._last_activity = now
+            self._idle_warned = False
+            return
+        idle = now - self._last_activity
+        if idle > self.queue.claim_timeout:
+            self.unclaimed_error = f"No worker claimed a chunk within {self.queue.claim_timeout:.0f}s"
+            logger.error(f"{self.unclaimed_error} in distributed run {self.run_id}, failing its tables")
+        elif idle > self.queue.claim_timeout / 2 and not self._idle_warned:
+            self._idle_warned = True
+            logger.warning(f"No worker has claimed a chunk of distributed run {self.run_id} for {idle:.0f}s; "
+                           f"start workers with 'python src/main.py --worker'")
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
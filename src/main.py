@@ -1,21 +1,99 @@
 import asyncio
-from typing import Dict, List, Tuple
+import signal
+import sys
+from typing import Dict, List, Optional
 
 from fastapi import FastAPI, HTTPException
+from job_queue import JobQueue, QueueFullError, SyncJob
+from lease_queue import LeaseQueue
+from models.progress import SyncProgress
 from utils.database import DatabaseUtility
+from replication import LogicalReplicator
+from scheduler import SyncScheduler
 from sync_manager import SyncManager
-from utils.config import load_config, get_sync_settings
+from sync_worker import SyncWorker
+from utils.config import (load_config, get_sync_settings, get_transfer_method, get_batch_size, get_table_options,
+                          get_pool_settings, get_database_backend, get_concurrency_settings, get_consistent_snapshot,
+                          get_write_mode, get_add_missing_keys, get_diff_settings, get_copy_format,
+                          get_pipeline_settings, get_schema_cache_settings, get_change_detection_settings,
+                          get_cdc_settings, get_sync_interval, get_job_settings, get_table_locking,
+                          get_distributed_settings, get_process_settings)
 from utils.logger import Logger
+from utils.pool import close_pools
+from utils.schema_cache import SchemaCache
 
 app = FastAPI()
 logger = Logger()  # Initialize logger globally
+replication_task = None
+scheduler_task = None
 
-async def sync_data(config: Dict):
+def create_replicator(config: Dict) -> Optional[LogicalReplicator]:
+    """
+    Builds the change data capture stream for the configured databases, or returns None if it is disabled.
+    """
+    cdc_settings = get_cdc_settings(config)
+    if not cdc_settings["enabled"]:
+        return None
+    return LogicalReplicator(config['database']['source_db'], config['database']['target_db'],
+                             get_sync_settings(config), cdc_settings)
+
+def create_schema_cache(config: Dict) -> Optional[SchemaCache]:
+    """Builds the cache of source schema models, or returns None if it is disabled."""
+    cache_settings = get_schema_cache_settings(config)
+    if not cache_settings["enabled"]:
+        return None
+    return SchemaCache(cache_settings["directory"])
+
+def select_tables(table_mapping: Dict[str, str], tables: List[str]) -> Dict[str, str]:
+    """
+    Narrows the table mapping to the given source tables, which must be mapped on their own
+    or covered by "*"; raises ValueError otherwise.
+    """
+    selected = {}
+    for table in tables:
+        if table in table_mapping:
+            selected[table] = table_mapping[table]
+        elif "*" in table_mapping:
+            selected[table] = table
+        else:
+            raise ValueError(f"Table '{table}' is not in the table mapping")
+    return selected
+
+def create_sync_manager(config: Dict, source_db: DatabaseUtility, target_db: DatabaseUtility,
+                        table_mapping: Dict[str, str], progress: SyncProgress = None) -> SyncManager:
+    """Builds a SyncManager with the configured settings for connected databases."""
+    return SyncManager(source_db, target_db, table_mapping,
+                       transfer_method=get_transfer_method(config),
+                       batch_size=get_batch_size(config),
+                       table_options=get_table_options(config),
+                       concurrency=get_concurrency_settings(config),
+                       consistent_snapshot=get_consistent_snapshot(config),
+                       write_mode=get_write_mode(config),
+                       add_missing_keys=get_add_missing_keys(config),
+                       diff_settings=get_diff_settings(config),
+                       copy_format=get_copy_format(config),
+                       pipeline=get_pipeline_settings(config),
+                       schema_cache=create_schema_cache(config),
+                       change_detection=get_change_detection_settings(config),
+                       progress=progress,
+                       table_locks=get_table_locking(config),
+                       distributed=get_distributed_settings(config),
+                       processes=get_process_settings(config))
+
+async def sync_data(config: Dict, progress: SyncProgress = None, tables: List[str] = None, snapshot: str = None):
     """
     Asynchronously synchronizes data between source and target databases.
+
+    Args:
+        config (Dict): The configuration returned by load_config.
+        progress (SyncProgress, optional): Receives the progress of every table. Defaults to None.
+        tables (List[str], optional): The source tables to sync. Defaults to every mapped table.
+        snapshot (str, optional): An exported source snapshot id to read all tables from. Defaults to None.
     """
-    source_db = DatabaseUtility(config['database']['source_db'])
-    target_db = DatabaseUtility(config['database']['target_db'])
+    pool_settings = get_pool_settings(config)
+    backend = get_database_backend(config)
+    source_db = DatabaseUtility(config['database']['source_db'], pool_settings, backend)
+    target_db = DatabaseUtility(config['database']['target_db'], pool_settings, backend)
 
     try:
         logger.info("Connecting to databases...")
@@ -27,10 +105,12 @@ async def sync_data(config: Dict):
         table_mapping = get_sync_settings(config)
         if not table_mapping:
             raise ValueError("Table mapping not found in configuration file")
+        if tables:
+            table_mapping = select_tables(table_mapping, tables)
         logger.debug(f"Table mapping: {table_mapping}")
 
-        sync_manager = SyncManager(source_db, target_db, table_mapping)
-        await sync_manager.sync()
+        sync_manager = create_sync_manager(config, source_db, target_db, table_mapping, progress)
+        await sync_manager.sync(snapshot)
 
     except Exception as e:
         logger.error(f"An error occurred during synchronization: {e}")
@@ -39,24 +119,141 @@ async def sync_data(config: Dict):
         await source_db.disconnect()
         await target_db.disconnect()
 
-@app.get("/sync")
-async def sync_endpoint():
+async def run_job(job: SyncJob):
+    """Runs a queued sync job, in turn with scheduled runs."""
+    async def sync():
+        job.start()
+        await sync_data(load_config(), job.progress, job.tables)
+
+    await app.state.scheduler.run_once(f"job {job.id}", sync)
+
+async def run_worker(config: Dict):
+    """
+    Copies chunks of the distributed runs of any process syncing into the configured target
+    until SIGINT or SIGTERM, then finishes the chunks in progress.
     """
-    Endpoint to trigger data synchronization.
+    settings = get_distributed_settings(config)
+    pool_settings = get_pool_settings(config)
+    backend = get_database_backend(config)
+    source_db = DatabaseUtility(config['database']['source_db'], pool_settings, backend)
+    target_db = DatabaseUtility(config['database']['target_db'], pool_settings, backend)
+    try:
+        await source_db.connect()
+        await target_db.connect()
+        sync_manager = create_sync_manager(config, source_db, target_db, get_sync_settings(config))
+        queue = LeaseQueue(target_db, settings["lease_seconds"], settings["heartbeat_interval"],
+                           settings["poll_interval"], settings["max_attempts"], settings["claim_timeout"])
+        worker = SyncWorker(queue, sync_manager, settings["worker_concurrency"])
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+    finally:
+        await source_db.disconnect()
+        await target_db.disconnect()
+        await close_pools()
+
+@app.get("/sync", status_code=202)
+async def sync_endpoint(tables: Optional[str] = None):
     """
+    Queues a data synchronization and returns its job id without waiting for it. Rejected
+    while change data capture is enabled, as a full sync would race the change stream.
+
+    Args:
+        tables (str, optional): Comma-separated source tables to sync. Defaults to every mapped table.
+    """
+    if replication_task:
+        raise HTTPException(status_code=409, detail="Change data capture is enabled; full syncs only run on startup")
+    requested = [table.strip() for table in tables.split(",") if table.strip()] if tables else None
+    if requested:
+        try:
+            select_tables(get_sync_settings(load_config()), requested)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job, queued = app.state.jobs.submit(requested)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"message": "Data synchronization queued." if queued else "Data synchronization already pending.",
+            "job_id": job.id, "status": job.status, "coalesced": not queued, "status_url": f"/sync/{job.id}"}
+
+@app.get("/sync/{job_id}")
+async def sync_status_endpoint(job_id: str):
+    """
+    Returns the status of a sync job with the progress, rows/s and ETA of each table.
+    """
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown sync job: {job_id}")
+    return job.to_dict()
+
+@app.get("/schedule")
+async def schedule_endpoint():
+    """
+    Returns the sync interval, the run in progress and the duration and outcome of recent runs.
+    """
+    return app.state.scheduler.stats()
+
+@app.on_event("startup")
+async def startup():
+    """
+    Starts the sync schedule, the sync job worker and, if change data capture is enabled, streaming changes from the source.
+
+    The change stream and full syncs are exclusive: with change data capture enabled, no syncs
+    are scheduled and /sync is rejected, as a sync copying a table while its changes are applied
+    could overwrite newer rows with older ones.
+    """
+    global replication_task, scheduler_task
     config = load_config()
-    await sync_data(config)
-    return {"message": "Data synchronization initiated."}
+    replicator = create_replicator(config)
+    interval = get_sync_interval(config)
+    if replicator and interval:
+        logger.warning("Change data capture is enabled, so the sync interval is ignored")
+        interval = None
+    # Every run reloads the configuration, as a manual /sync always did.
+    app.state.scheduler = SyncScheduler(lambda: sync_data(load_config()), interval)
+    if app.state.scheduler.interval:
+        scheduler_task = asyncio.create_task(app.state.scheduler.run())
+    app.state.jobs = JobQueue(run_job, **get_job_settings(config))
+    app.state.jobs.start()
+    if replicator:
+        app.state.replicator = replicator
+        replication_task = asyncio.create_task(replicator.run())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Stops the sync schedule, the sync job worker and the change stream and closes the connection pools shared by all sync runs.
+    """
+    if scheduler_task:
+        app.state.scheduler.stop()
+        await scheduler_task
+    await app.state.jobs.stop()
+    if replication_task:
+        app.state.replicator.stop()
+        await replication_task
+    await close_pools()
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
 if __name__ == "__main__":
-    import uvicorn
-    logger.info("Starting the application...")
     # Load configuration
     config = load_config()
-    # Run the sync on startup
-    asyncio.run(sync_data(config))
+    if "--worker" in sys.argv[1:]:
+        logger.info("Starting a distributed sync worker...")
+        asyncio.run(run_worker(config))
+        sys.exit(0)
+    import uvicorn
+    logger.info("Starting the application...")
+    replicator = create_replicator(config)
+    if replicator:
+        # The initial copy reads the snapshot the slot was created with, so it ends exactly
+        # where the change stream begins.
+        with replicator.initial_snapshot() as snapshot:
+            asyncio.run(sync_data(config, snapshot=snapshot))
+    else:
+        # Run the sync on startup
+        asyncio.run(sync_data(config))
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,16 @@
+class TableChunk:
+    def __init__(self, where=None, params=(), label="full table"):
+        """
+        A slice of a table that can be copied independently of the others.
+
+        Args:
+            where (str, optional): SQL condition selecting the rows of the chunk; None for the whole table.
+            params (tuple, optional): Parameters referenced by the condition.
+            label (str, optional): A human readable description used in logs.
+        """
+        self.where = where
+        self.params = tuple(params)
+        self.label = label
+
+    def __repr__(self):
+        return f"TableChunk({self.label})"
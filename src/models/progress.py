@@ -0,0 +1,143 @@
+import time
+from typing import Dict, Optional
+
+class TableProgress:
+    def __init__(self, source_table, target_table, rows_total=0, total_bytes=0):
+        """
+        The progress of one table within a sync run.
+
+        Rows are counted as they are committed: per batch on the INSERT path and per chunk on
+        the COPY path. While a COPY stream is running, the bytes it has carried so far are read
+        from its BytePipe, so a large single-stream table does not sit at zero until it ends.
+
+        Args:
+            source_table (str): The name of the source table.
+            target_table (str): The name of the target table.
+            rows_total (int, optional): The estimated row count (pg_class.reltuples); 0 or less if unknown.
+            total_bytes (int, optional): The on-disk size including indexes and TOAST, an upper
+                estimate of the bytes to stream, so progress by bytes errs on the slow side.
+        """
+        self.source_table = source_table
+        self.target_table = target_table
+        self.rows_total = max(0, int(rows_total or 0))
+        self.bytes_total = max(0, int(total_bytes or 0))
+        self.status = "pending"
+        self.rows = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._streamed = 0
+        self._pipes = set()
+
+    def start(self) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+
+    def finish(self, error: Exception = None) -> None:
+        self.status = "failed" if error else "succeeded"
+        self.error = str(error) if error else None
+        self.finished_at = time.time()
+
+    def skip(self, status: str = "skipped") -> None:
+        """Marks the table as left out: "skipped" when unchanged, "locked" when another process syncs it."""
+        self.status = status
+
+    def add_rows(self, rows: int) -> None:
+        self.rows += rows
+
+    def watch(self, pipe) -> None:
+        """Counts the bytes of a running COPY stream until unwatch() is called."""
+        self._pipes.add(pipe)
+
+    def unwatch(self, pipe, completed: bool = True) -> None:
+        """Stops watching a COPY stream, keeping its bytes only if it was committed."""
+        self._pipes.discard(pipe)
+        if completed:
+            self._streamed += pipe.bytes
+
+    @property
+    def streamed_bytes(self) -> int:
+        return self._streamed + sum(pipe.bytes for pipe in list(self._pipes))
+
+    def fraction(self) -> Optional[float]:
+        """The estimated share of the table that is done, or None if nothing is known about its size."""
+        if self.status in ("succeeded", "skipped", "locked"):
+            return 1.0
+        estimates = []
+        if self.rows_total:
+            estimates.append(self.rows / self.rows_total)
+        if self.bytes_total:
+            estimates.append(self.streamed_bytes / self.bytes_total)
+        if not estimates:
+            return None
+        # Statistics lag behind the data, so a running table never claims to be complete.
+        return min(max(estimates), 0.99)
+
+    def elapsed(self, now: float = None) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or now or time.time()) - self.started_at
+
+    def to_dict(self, now: float = None) -> Dict:
+        elapsed = self.elapsed(now)
+        fraction = self.fraction()
+        eta = None
+        if self.status == "running" and fraction:
+            eta = elapsed * (1 - fraction) / fraction
+        return {
+            "source_table": self.source_table,
+            "target_table": self.target_table,
+            "status": self.status,
+            "rows": self.rows,
+            "rows_total": self.rows_total or None,
+            "streamed_bytes": self.streamed_bytes,
+            "progress": round(fraction, 4) if fraction is not None else None,
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            "elapsed": round(elapsed, 3),
+            "eta": round(eta, 1) if eta is not None else None,
+            "error": self.error,
+        }
+
+class SyncProgress:
+    def __init__(self):
+        """The progress of every table of a sync run, filled in by SyncManager as the run goes."""
+        self.tables: Dict[str, TableProgress] = {}
+        self.started_at = time.time()
+
+    def add(self, source_table: str, target_table: str, size: Dict[str, int] = None) -> TableProgress:
+        size = size or {}
+        table = TableProgress(source_table, target_table, size.get("rows", 0), size.get("bytes", 0))
+        self.tables[source_table] = table
+        return table
+
+    def get(self, source_table: str) -> Optional[TableProgress]:
+        return self.tables.get(source_table)
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the per-table progress and the totals of the run: the rows written, the rows/s
+        since the run started and the ETA, extrapolated from the tables that are not done yet.
+        """
+        now = time.time()
+        tables = [table.to_dict(now) for table in self.tables.values()]
+        counts = {}
+        for table in tables:
+            counts[table["status"]] = counts.get(table["status"], 0) + 1
+        rows = sum(table["rows"] for table in tables)
+        elapsed = now - self.started_at
+        rate = rows / elapsed if elapsed > 0 else 0
+        remaining = sum(max(0, (table.rows_total or 0) - table.rows) for table in self.tables.values()
+                        if table.status in ("pending", "running"))
+        eta = None
+        if not remaining and not counts.get("pending") and not counts.get("running"):
+            eta = 0.0
+        elif rate > 0 and remaining:
+            eta = remaining / rate
+        return {
+            "tables_by_status": counts,
+            "rows": rows,
+            "streamed_bytes": sum(table["streamed_bytes"] for table in tables),
+            "rows_per_second": round(rate, 1),
+            "eta": round(eta, 1) if eta is not None else None,
+            "tables": tables,
+        }
@@ -0,0 +1,92 @@
+from typing import Dict, List, Optional
+
+class TableSchema:
+    def __init__(self, name, columns, foreign_keys=(), indexes=(), rows=0, total_bytes=0, pages=0):
+        """
+        The catalog description of one table.
+
+        Args:
+            name (str): The name of the table.
+            columns (list): Column definitions in the format of DatabaseUtility.get_table_columns
+                ('name', 'type', 'type_oid', 'primary_key'), plus 'not_null'.
+            foreign_keys (list, optional): Dicts with 'name', 'columns', 'referenced_schema',
+                'referenced_table' and 'referenced_columns'.
+            indexes (list, optional): Dicts with 'name', 'columns', 'unique', 'primary' and
+                'definition' (the CREATE INDEX statement).
+            rows (int, optional): The estimated row count (pg_class.reltuples).
+            total_bytes (int, optional): The on-disk size including indexes and TOAST.
+            pages (int, optional): The heap size in blocks (pg_class.relpages).
+        """
+        self.name = name
+        self.columns = list(columns)
+        self.foreign_keys = list(foreign_keys)
+        self.indexes = list(indexes)
+        self.rows = rows
+        self.total_bytes = total_bytes
+        self.pages = pages
+
+    @property
+    def primary_key(self) -> List[str]:
+        """The primary key column names, in key order."""
+        key_columns = sorted((col for col in self.columns if col.get('primary_key')), key=lambda col: col['primary_key'])
+        return [col['name'] for col in key_columns]
+
+    def size(self) -> Dict[str, int]:
+        """The size statistics in the format of DatabaseUtility.get_table_sizes."""
+        return {"rows": self.rows, "bytes": self.total_bytes, "pages": self.pages}
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "columns": self.columns, "foreign_keys": self.foreign_keys, "indexes": self.indexes,
+                "rows": self.rows, "total_bytes": self.total_bytes, "pages": self.pages}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TableSchema":
+        return cls(**data)
+
+    def __repr__(self):
+        return f"TableSchema({self.name}, {len(self.columns)} columns)"
+
+class SchemaModel:
+    def __init__(self, schema="public", tables=()):
+        """
+        The tables of one database schema, loaded in bulk by DatabaseUtility.introspect_schema.
+
+        Args:
+            schema (str, optional): The name of the schema.
+            tables (iterable, optional): The TableSchema of every table.
+        """
+        self.schema = schema
+        self.tables = {table.name: table for table in tables}
+
+    def get(self, name: str) -> Optional[TableSchema]:
+        return self.tables.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tables
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def table_names(self) -> List[str]:
+        return list(self.tables)
+
+    def sizes(self) -> Dict[str, Dict[str, int]]:
+        """The size statistics of every table, in the format of DatabaseUtility.get_table_sizes."""
+        return {name: table.size() for name, table in self.tables.items()}
+
+    def update_sizes(self, sizes: Dict[str, Dict[str, int]]) -> None:
+        """Replaces the size statistics with fresh ones from DatabaseUtility.get_table_sizes."""
+        for name, size in sizes.items():
+            table = self.tables.get(name)
+            if table is not None:
+                table.rows, table.total_bytes, table.pages = size["rows"], size["bytes"], size["pages"]
+
+    def to_dict(self) -> Dict:
+        return {"schema": self.schema, "tables": [table.to_dict() for table in self.tables.values()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SchemaModel":
+        return cls(data["schema"], [TableSchema.from_dict(table) for table in data["tables"]])
+
+    def __repr__(self):
+        return f"SchemaModel({self.schema}, {len(self.tables)} tables)"
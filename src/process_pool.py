@@ -0,0 +1,200 @@
+import asyncio
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+from models.chunk import TableChunk
+from models.progress import SyncProgress, TableProgress
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+from utils.pool import close_pools
+
+logger = Logger('process_pool')
+
+# State of a pool process, set up once by _init_process and used by every chunk it copies.
+_process = {}
+
+class RemoteStream:
+    """Stands in for the BytePipe of a chunk copied in another process, so TableProgress can watch it."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.rows = 0
+
+class ChunkProcessPool:
+    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility, settings: Dict[str, Any],
+                 workers: int = None, report_interval: float = 0.5):
+        """
+        Copies table chunks in spawned worker processes, so row-level Python work such as
+        transforms runs on several cores instead of sharing the GIL of the syncing process.
+
+        Every process connects to both databases with the same configuration, pool settings and
+        backend, and copies one chunk at a time with SyncManager.sync_chunk of its own
+        SyncManager, which is built from settings. Processes are spawned rather than forked, so
+        no connection of the parent is ever shared. While a chunk is copied, its process reports
+        the rows and bytes so far every report_interval seconds, and the parent shows them in
+        the table's progress; the rows, bytes, wall time and CPU time of each chunk are returned
+        with its result and summed up in stats().
+
+        Args:
+            source_db (DatabaseUtility): The source database of the parent, whose settings the processes use.
+            target_db (DatabaseUtility): The target database of the parent.
+            settings (Dict[str, Any]): Keyword arguments of the SyncManager built in each process.
+            workers (int, optional): The number of processes. Defaults to the number of CPUs.
+            report_interval (float, optional): Seconds between progress reports. Defaults to 0.5.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.report_interval = report_interval
+        context = multiprocessing.get_context("spawn")
+        self.updates = context.Queue()
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_process,
+            initargs=(database_settings(source_db), database_settings(target_db), settings, self.updates,
+                      report_interval))
+        self.metrics = {"chunks": 0, "rows": 0, "bytes": 0, "seconds": 0.0, "cpu_seconds": 0.0}
+        self.pids = set()
+        self._streams: Dict[str, RemoteStream] = {}
+        self._progress: Dict[str, TableProgress] = {}
+        self._reader = None
+        self._started = time.monotonic()
+
+    def start(self) -> None:
+        """Starts applying the progress reports of the processes."""
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read_updates())
+
+    async def copy(self, source_table: str, target_table: str, columns: List[Dict], chunk: TableChunk,
+                   key_columns: List[str] = None, replace: bool = False, snapshot: str = None,
+                   progress: TableProgress = None) -> int:
+        """
+        Copies one chunk in a pool process, see SyncManager.sync_chunk.
+
+        Returns:
+            int: The rows written.
+        """
+        token = uuid.uuid4().hex
+        stream = RemoteStream()
+        self._streams[token] = stream
+        if progress is not None:
+            self._progress[token] = progress
+            progress.watch(stream)
+        completed = False
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _copy_chunk, token, source_table, target_table, columns, chunk, key_columns, replace,
+                snapshot)
+            completed = True
+        finally:
+            self._streams.pop(token, None)
+            self._progress.pop(token, None)
+            if progress is not None:
+                progress.unwatch(stream, completed)
+        if progress is not None:
+            stream.bytes = result["bytes"]
+            progress.add_rows(result["rows"] - stream.rows)
+        self.metrics["chunks"] += 1
+        for key in ("rows", "bytes", "seconds", "cpu_seconds"):
+            self.metrics[key] += result[key]
+        self.pids.add(result["pid"])
+        return result["rows"]
+
+    async def _read_updates(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.apply_updates()
+
+    def apply_updates(self) -> None:
+        """Applies the progress reports received so far to the chunks still running."""
+        while True:
+            try:
+                token, rows, streamed = self.updates.get_nowait()
+            except queue.Empty:
+                return
+            stream = self._streams.get(token)
+            if stream is None:
+                continue
+            progress = self._progress.get(token)
+            if progress is not None and rows > stream.rows:
+                progress.add_rows(rows - stream.rows)
+            stream.rows = max(stream.rows, rows)
+            stream.bytes = streamed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the totals of the chunks copied so far: "chunks", "rows", "bytes", the summed
+        wall "seconds" and "cpu_seconds" of the processes, and the "processes" that copied any.
+        """
+        return {**self.metrics, "processes": len(self.pids)}
+
+    async def close(self) -> None:
+        """Waits for the processes to finish their chunks and shuts them down."""
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.updates.close()
+        stats = self.stats()
+        if stats["chunks"]:
+            elapsed = time.monotonic() - self._started
+            logger.info(f"Process pool copied {stats['chunks']} chunks ({stats['rows']} rows) in "
+                        f"{stats['processes']} processes: {stats['cpu_seconds']:.2f}s CPU in {stats['seconds']:.2f}s "
+                        f"of chunk time, {stats['cpu_seconds'] / elapsed if elapsed > 0 else 0:.1f} cores busy on average")
+
+def database_settings(db: DatabaseUtility) -> Dict[str, Any]:
+    """Returns what a process needs to open its own connections like db's: config, pool settings and backend."""
+    return {"db_config": db.db_config, "pool_settings": db.pool_settings, "backend": db.backend.name}
+
+def _init_process(source: Dict[str, Any], target: Dict[str, Any], settings: Dict[str, Any], updates,
+                  report_interval: float) -> None:
+    # Imported here, as sync_manager imports this module.
+    from sync_manager import SyncManager
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    source_db = DatabaseUtility(source["db_config"], source["pool_settings"], source["backend"])
+    target_db = DatabaseUtility(target["db_config"], target["pool_settings"], target["backend"])
+    loop.run_until_complete(source_db.connect())
+    loop.run_until_complete(target_db.connect())
+    _process.update(loop=loop, sync_manager=SyncManager(source_db, target_db, {}, **settings), updates=updates,
+                    report_interval=report_interval)
+    # Runs when the pool shuts the process down, which skips atexit handlers.
+    multiprocessing.util.Finalize(None, _close_process, exitpriority=10)
+
+def _close_process() -> None:
+    _process["loop"].run_until_complete(close_pools())
+    _process["loop"].close()
+
+def _copy_chunk(token: str, source_table: str, target_table: str, columns: List[Dict], chunk: TableChunk,
+                key_columns: List[str], replace: bool, snapshot: str) -> Dict[str, Any]:
+    sync_manager = _process["sync_manager"]
+    sync_manager.progress = SyncProgress()
+    progress = sync_manager.progress.add(source_table, target_table)
+
+    async def _report():
+        while True:
+            await asyncio.sleep(_process["report_interval"])
+            _process["updates"].put((token, progress.rows, progress.streamed_bytes))
+
+    async def _copy():
+        reporter = asyncio.create_task(_report())
+        try:
+            return await sync_manager.sync_chunk(source_table, target_table, columns, chunk, key_columns, replace,
+                                                 snapshot)
+        finally:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+
+    start, cpu_start = time.monotonic(), time.process_time()
+    try:
+        rows = _process["loop"].run_until_complete(_copy())
+    except Exception as e:
+        # Driver errors do not always survive pickling back to the parent, their message does.
+        raise Exception(f"{type(e).__name__}: {e}") from None
+    return {"rows": rows, "bytes": progress.streamed_bytes, "seconds": time.monotonic() - start,
+            "cpu_seconds": time.process_time() - cpu_start, "pid": os.getpid()}
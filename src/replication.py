@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import select
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extras
+from utils.database import connection_params, on_conflict_clause, quote_ident
+from utils.logger import Logger
+from utils.pgoutput import Begin, Change, Commit, PgOutputDecoder, Relation, Truncate, UNCHANGED_TOAST
+
+logger = Logger('replication')
+
+class ChangeApplier:
+    def __init__(self, target_conn, table_mapping: Dict[str, str], batch_size: int = 1000):
+        """
+        Applies decoded pgoutput changes to the target, one target transaction per source transaction.
+
+        Statements are buffered and executed in groups of batch_size; nothing is committed
+        before the source transaction's Commit message arrives.
+
+        Args:
+            target_conn: A psycopg2 connection to the target database.
+            table_mapping (Dict[str, str]): Source to target table names; "*" replicates every table.
+            batch_size (int, optional): Statements buffered before they are sent. Defaults to 1000.
+        """
+        self.target_conn = target_conn
+        self.table_mapping = table_mapping
+        self.batch_size = batch_size
+        self.relations: Dict[int, Relation] = {}
+        self.pending: List[Tuple[str, Tuple]] = []
+        self.changes = 0
+
+    def handle(self, message) -> Optional[int]:
+        """
+        Processes one decoded message.
+
+        Returns:
+            Optional[int]: The end LSN of a source transaction once it is committed on the target,
+                which is then safe to confirm to the server.
+        """
+        if isinstance(message, Relation):
+            self.relations[message.relid] = message
+        elif isinstance(message, Begin):
+            self.changes = 0
+        elif isinstance(message, Change):
+            relation = self.relations[message.relid]
+            target_table = self.target_table(relation)
+            if target_table:
+                self.pending.extend(self._statements(relation, target_table, message))
+                self.changes += 1
+                if len(self.pending) >= self.batch_size:
+                    self._flush()
+        elif isinstance(message, Truncate):
+            for relid in message.relids:
+                target_table = self.target_table(self.relations[relid])
+                if target_table:
+                    self.pending.append((f"TRUNCATE TABLE {quote_ident(target_table)}", ()))
+        elif isinstance(message, Commit):
+            self._flush()
+            self.target_conn.commit()
+            if self.changes:
+                logger.debug(f"Applied transaction with {self.changes} changes up to LSN {message.end_lsn}")
+            return message.end_lsn
+        return None
+
+    def rollback(self) -> None:
+        self.pending.clear()
+        self.target_conn.rollback()
+
+    def target_table(self, relation: Relation) -> Optional[str]:
+        if relation.namespace != "public":
+            return None
+        if relation.name in self.table_mapping:
+            return self.table_mapping[relation.name]
+        if "*" in self.table_mapping:
+            return relation.name
+        return None
+
+    def _flush(self) -> None:
+        with self.target_conn.cursor() as cursor:
+            for query, group in itertools.groupby(self.pending, key=lambda statement: statement[0]):
+                psycopg2.extras.execute_batch(cursor, query, [params for _, params in group])
+        self.pending.clear()
+
+    def _statements(self, relation: Relation, target_table: str, change: Change) -> List[Tuple[str, Tuple]]:
+        table = quote_ident(target_table)
+        if change.kind == "delete":
+            return [self._delete(relation, table, change.old_tuple)]
+        if change.kind == "update" and relation.replica_identity == "n":
+            logger.warning(f"Skipping update on '{relation.name}', which has REPLICA IDENTITY NOTHING")
+            return []
+
+        # Only a full old row (REPLICA IDENTITY FULL) holds the values of unchanged TOAST columns;
+        # the non-key columns of a key-only old tuple are sent as null.
+        full_old_tuple = change.old_tuple if change.old_tuple is not None and not change.old_key_only else None
+        columns, values, unchanged = [], [], False
+        for index, (column, (kind, value)) in enumerate(zip(relation.columns, change.new_tuple)):
+            if kind == UNCHANGED_TOAST:
+                if full_old_tuple is None or full_old_tuple[index][0] == UNCHANGED_TOAST:
+                    # Left out, so the target keeps the value it already has.
+                    unchanged = True
+                    continue
+                value = full_old_tuple[index][1]
+            columns.append(column['name'])
+            values.append(value)
+
+        if change.kind == "update" and (unchanged or change.old_key_only):
+            # Rewritten in place: an INSERT replacing the row would lose the values that were not
+            # sent, or fail on NOT NULL columns. A changed key is set along with the other columns.
+            match_tuple = change.old_tuple if change.old_tuple is not None else change.new_tuple
+            return [self._update(relation, table, columns, values, match_tuple)]
+
+        statements = []
+        if change.kind == "update" and change.old_tuple is not None:
+            # The full old row, sent with REPLICA IDENTITY FULL; every new value is known.
+            statements.append(self._delete(relation, table, change.old_tuple))
+        key_columns = relation.key_columns if relation.replica_identity in ("d", "i") else []
+        query = (f"INSERT INTO {table} ({', '.join(quote_ident(col) for col in columns)}) "
+                 f"VALUES ({', '.join(['%s'] * len(columns))})")
+        if key_columns:
+            query += " " + on_conflict_clause(columns, key_columns)
+        statements.append((query, tuple(values)))
+        return statements
+
+    def _update(self, relation: Relation, table: str, columns: List[str], values: List, match_tuple) -> Tuple[str, Tuple]:
+        condition, match_values = self._match(relation, table, match_tuple)
+        assignments = ", ".join(f"{quote_ident(col)} = %s" for col in columns)
+        return f"UPDATE {table} SET {assignments} WHERE {condition}", tuple(values) + match_values
+
+    def _delete(self, relation: Relation, table: str, old_tuple) -> Tuple[str, Tuple]:
+        condition, values = self._match(relation, table, old_tuple)
+        return f"DELETE FROM {table} WHERE {condition}", values
+
+    def _match(self, relation: Relation, table: str, row_tuple) -> Tuple[str, Tuple]:
+        """Builds a condition matching the target row of a tuple by the table's replica identity."""
+        conditions, values = [], []
+        for column, (kind, value) in zip(relation.columns, row_tuple):
+            if relation.replica_identity == "f":
+                if kind == UNCHANGED_TOAST:
+                    continue
+                conditions.append(f"{quote_ident(column['name'])} IS NOT DISTINCT FROM %s")
+                values.append(value)
+            elif column['key']:
+                conditions.append(f"{quote_ident(column['name'])} = %s")
+                values.append(value)
+        # A single row, in case the target holds duplicates of a keyless row.
+        return f"ctid = (SELECT ctid FROM {table} WHERE {' AND '.join(conditions)} LIMIT 1)", tuple(values)
+
+class LogicalReplicator:
+    def __init__(self, source_config: Dict[str, Any], target_config: Dict[str, Any],
+                 table_mapping: Dict[str, str], settings: Dict[str, Any]):
+        """
+        Continuously replicates changes from the source to the target by decoding a logical
+        replication slot with the pgoutput plugin.
+
+        The slot's confirmed position only advances after the target committed the
+        corresponding source transaction, so a crash replays changes instead of losing them.
+        The source needs wal_level=logical.
+
+        Args:
+            source_config (Dict[str, Any]): The parsed source database URL.
+            target_config (Dict[str, Any]): The parsed target database URL.
+            table_mapping (Dict[str, str]): Source to target table names, as from get_sync_settings.
+            settings (Dict[str, Any]): The sync.cdc settings (slot_name, publication,
+                create_publication, batch_size, status_interval, retry_interval).
+        """
+        self.source_params = connection_params(source_config)
+        self.target_params = connection_params(target_config)
+        self.table_mapping = table_mapping
+        self.slot_name = settings["slot_name"]
+        self.publication = settings["publication"]
+        self.create_publication = settings["create_publication"]
+        self.batch_size = settings["batch_size"]
+        self.status_interval = settings["status_interval"]
+        self.retry_interval = settings["retry_interval"]
+        self._stop = threading.Event()
+
+    def ensure_slot(self) -> None:
+        """
+        Creates the publication and the replication slot if they do not exist yet, e.g. when
+        the slot was dropped while the application runs. At startup initial_snapshot() creates
+        them instead.
+        """
+        conn = psycopg2.connect(**self.source_params)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                self._ensure_publication(cursor)
+                cursor.execute("SELECT 1 FROM pg_catalog.pg_replication_slots WHERE slot_name = %s", (self.slot_name,))
+                if not cursor.fetchone():
+                    cursor.execute("SELECT pg_catalog.pg_create_logical_replication_slot(%s, 'pgoutput')", (self.slot_name,))
+                    logger.info(f"Created logical replication slot '{self.slot_name}'")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def initial_snapshot(self) -> Iterator[Optional[str]]:
+        """
+        Creates the publication and the replication slot, and yields the id of the snapshot
+        exported at the slot's consistent point for the initial full sync to read from.
+
+        The copy then holds exactly the transactions committed before the point the stream
+        starts at, so no change is both copied and replayed, which would duplicate rows of
+        tables without a primary key. An existing slot is dropped and created again, as the
+        initial sync copies the tables anew. The snapshot is valid until the with block exits.
+
+        Yields:
+            Optional[str]: The snapshot id, or None if the slot is in use by another process,
+                which leaves the slot alone.
+        """
+        conn = psycopg2.connect(**self.source_params)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                self._ensure_publication(cursor)
+                cursor.execute("SELECT active FROM pg_catalog.pg_replication_slots WHERE slot_name = %s",
+                               (self.slot_name,))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    logger.warning(f"Replication slot '{self.slot_name}' is in use by another process, the initial "
+                                   f"sync reads its own snapshot and changes it copies may be replayed")
+                    yield None
+                    return
+                if row:
+                    cursor.execute("SELECT pg_catalog.pg_drop_replication_slot(%s)", (self.slot_name,))
+                    logger.info(f"Dropped replication slot '{self.slot_name}', it is created again for the initial sync")
+        finally:
+            conn.close()
+
+        # The snapshot stays valid until the replication connection runs another command or closes.
+        replication_conn = psycopg2.connect(connection_factory=psycopg2.extras.LogicalReplicationConnection,
+                                            **self.source_params)
+        try:
+            cursor = replication_conn.cursor()
+            # PostgreSQL 15 replaced the EXPORT_SNAPSHOT keyword with an option list.
+            option = "(SNAPSHOT 'export')" if replication_conn.server_version >= 150000 else "EXPORT_SNAPSHOT"
+            cursor.execute(f"CREATE_REPLICATION_SLOT {quote_ident(self.slot_name)} LOGICAL pgoutput {option}")
+            _, consistent_point, snapshot, _ = cursor.fetchone()
+            logger.info(f"Created logical replication slot '{self.slot_name}' at {consistent_point} "
+                        f"with snapshot {snapshot}")
+            yield snapshot
+        finally:
+            replication_conn.close()
+
+    def _ensure_publication(self, cursor) -> None:
+        cursor.execute("SELECT 1 FROM pg_catalog.pg_publication WHERE pubname = %s", (self.publication,))
+        if cursor.fetchone():
+            return
+        if not self.create_publication:
+            raise Exception(f"Publication '{self.publication}' does not exist")
+        if "*" in self.table_mapping:
+            tables = "ALL TABLES"
+        else:
+            tables = "TABLE " + ", ".join(quote_ident(table) for table in self.table_mapping)
+        cursor.execute(f"CREATE PUBLICATION {quote_ident(self.publication)} FOR {tables}")
+        logger.info(f"Created publication '{self.publication}' for {tables}")
+
+    async def run(self) -> None:
+        """Streams changes until stop() is called, reconnecting after errors."""
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                await asyncio.to_thread(self.ensure_slot)
+                await asyncio.to_thread(self._stream)
+            except Exception as e:
+                logger.error(f"Replication stream failed, retrying in {self.retry_interval}s: {e}")
+                await asyncio.to_thread(self._stop.wait, self.retry_interval)
+        logger.info("Replication stopped.")
+
+    def stop(self) -> None:
+        """Asks the stream to finish after the message it is currently applying."""
+        self._stop.set()
+
+    def _stream(self) -> None:
+        replication_conn = psycopg2.connect(connection_factory=psycopg2.extras.LogicalReplicationConnection,
+                                            **self.source_params)
+        target_conn = psycopg2.connect(**self.target_params)
+        try:
+            cursor = replication_conn.cursor()
+            cursor.start_replication(slot_name=self.slot_name, decode=False, status_interval=self.status_interval,
+                                     options={"proto_version": "1", "publication_names": self.publication})
+            logger.info(f"Streaming changes from slot '{self.slot_name}'")
+
+            decoder = PgOutputDecoder()
+            applier = ChangeApplier(target_conn, self.table_mapping, self.batch_size)
+            last_feedback = time.monotonic()
+            try:
+                while not self._stop.is_set():
+                    message = cursor.read_message()
+                    if message is None:
+                        if time.monotonic() - last_feedback >= self.status_interval:
+                            cursor.send_feedback()
+                            last_feedback = time.monotonic()
+                        select.select([cursor], [], [], 1.0)
+                        continue
+
+                    flushed_lsn = applier.handle(decoder.decode(message.payload))
+                    if flushed_lsn:
+                        # Only now that the target committed may the server discard this WAL. The
+                        # position is sent with the next status update, every status_interval.
+                        cursor.send_feedback(flush_lsn=flushed_lsn)
+                        last_feedback = time.monotonic()
+                # Confirms what was applied before disconnecting, so a restart does not replay it.
+                cursor.send_feedback(force=True)
+            except Exception:
+                applier.rollback()
+                raise
+        finally:
+            replication_conn.close()
+            target_conn.close()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.logger import Logger
+
+logger = Logger('scheduler')
+
+class SyncScheduler:
+    def __init__(self, sync: Callable[[], Awaitable[None]], interval: Optional[float] = None, history: int = 100):
+        """
+        Runs syncs on a fixed interval and on demand, never more than one at a time.
+
+        Ticks are aligned to the start time, so a run's duration does not shift the schedule.
+        A tick that comes due while a run is in progress (a manual one, or a scheduled one
+        that overran the interval) is skipped rather than queued, so an overrunning sync is
+        followed by at most one run, not a burst of catch-up runs.
+
+        Args:
+            sync (Callable[[], Awaitable[None]]): Runs one sync; raising marks the run as failed.
+            interval (float, optional): Seconds between scheduled runs; None disables the schedule
+                and only run_once() starts syncs.
+            history (int, optional): The number of finished runs kept for stats(). Defaults to 100.
+        """
+        self.sync = sync
+        self.interval = interval
+        self.runs = deque(maxlen=history)
+        self.skipped_ticks = 0
+        self.current = None
+        self._lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+
+    async def run_once(self, trigger: str = "manual", sync: Callable[[], Awaitable[None]] = None) -> Dict:
+        """
+        Runs a sync, waiting for a run in progress to finish first.
+
+        Args:
+            trigger (str, optional): What started the run, recorded with it. Defaults to "manual".
+            sync (Callable[[], Awaitable[None]], optional): Runs this sync instead of the scheduled one,
+                e.g. with different tables. Defaults to None.
+
+        Returns:
+            Dict: The record of the run; see stats().
+        """
+        async with self._lock:
+            record = {"trigger": trigger, "started_at": time.time(), "duration": None, "status": "running", "error": None}
+            self.current = record
+            start = time.monotonic()
+            try:
+                await (sync or self.sync)()
+                record["status"] = "succeeded"
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = str(getattr(e, "detail", e))
+                raise
+            finally:
+                record["duration"] = time.monotonic() - start
+                self.current = None
+                self.runs.append(record)
+                self._check_duration(record)
+            return record
+
+    def _check_duration(self, record: Dict) -> None:
+        logger.info(f"Sync run ({record['trigger']}) {record['status']} in {record['duration']:.2f}s")
+        if self.interval and record["duration"] > self.interval:
+            logger.warning(f"Sync run took {record['duration']:.2f}s, longer than the {self.interval:g}s interval; "
+                           f"ticks due meanwhile are skipped")
+        elif self.interval and record["duration"] > 0.8 * self.interval:
+            logger.warning(f"Sync run took {record['duration']:.2f}s, {record['duration'] / self.interval:.0%} "
+                           f"of the {self.interval:g}s interval")
+
+    async def run(self) -> None:
+        """Starts a sync on every tick until stop() is called. The first tick is one interval away."""
+        if not self.interval:
+            return
+        self._stop.clear()
+        start = time.monotonic()
+        tick = 1
+        logger.info(f"Scheduling a sync every {self.interval:g}s")
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), start + tick * self.interval - time.monotonic())
+                break
+            except asyncio.TimeoutError:
+                pass
+            if self._lock.locked():
+                self.skipped_ticks += 1
+                logger.warning("Skipping a scheduled sync, the previous run is still in progress")
+            else:
+                try:
+                    await self.run_once("schedule")
+                except Exception as e:
+                    logger.error(f"Scheduled sync failed: {e}")
+            # Ticks that came due during the run are coalesced into the first future tick.
+            next_tick = int((time.monotonic() - start) / self.interval) + 1
+            if next_tick > tick + 1:
+                self.skipped_ticks += next_tick - tick - 1
+                logger.warning(f"Coalesced {next_tick - tick - 1} scheduled syncs missed during an overrunning run")
+            tick = max(tick + 1, next_tick)
+        logger.info("Scheduler stopped.")
+
+    def stop(self) -> None:
+        """Stops scheduling new runs; a run in progress is not interrupted."""
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        """
+        Returns the interval, the run in progress, the skipped ticks and the finished runs (most
+        recent last) with their trigger, start time, duration in seconds, status and error,
+        plus the average and longest duration.
+        """
+        durations: List[float] = [run["duration"] for run in self.runs]
+        return {
+            "interval": self.interval,
+            "running": dict(self.current) if self.current else None,
+            "skipped_ticks": self.skipped_ticks,
+            "average_duration": sum(durations) / len(durations) if durations else None,
+            "max_duration": max(durations) if durations else None,
+            "runs": list(self.runs),
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Tuple
+
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+
+logger = Logger('sync_locks')
+
+class SyncLocks:
+    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility):
+        """
+        Claims tables for one sync run with PostgreSQL advisory locks on the target, so processes
+        syncing the same source into the same target (uvicorn workers, replicas) split the
+        tables between them instead of copying each one several times.
+
+        Each lock is keyed by the source/target database pair and the table pair. Locks are
+        taken with pg_try_advisory_lock on a connection held for the whole run and released
+        with unlock() as soon as their table is done, so a run holds at most one lock per
+        table in progress; a table synced by one process is skipped by the others while it
+        runs. Whatever is still held is released when the run ends, and a crashed process
+        loses its connection, and with it its locks.
+
+        Args:
+            source_db (DatabaseUtility): The database the tables are read from.
+            target_db (DatabaseUtility): The database holding the locks.
+        """
+        self.target_db = target_db
+        self.namespace = lock_id(f"pg_db_sync:{database_identity(source_db)}->{database_identity(target_db)}")
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def session(self):
+        """Holds the connection that owns the run's locks, releasing any still held on exit."""
+        async with self.target_db.connection() as conn:
+            self._conn = conn
+            try:
+                yield self
+            finally:
+                self._conn = None
+                try:
+                    await self.target_db.advisory_unlock_all(conn)
+                except Exception as e:
+                    logger.warning(f"Could not release the table locks, they are freed when the connection closes: {e}")
+
+    def key(self, source_table: str, target_table: str) -> Tuple[int, int]:
+        return self.namespace, lock_id(f"{source_table}->{target_table}")
+
+    async def try_lock(self, source_table: str, target_table: str) -> bool:
+        """
+        Claims a table pair for this run.
+
+        Returns:
+            bool: True if the table is ours to sync (or no session is open); False if another
+                process holds it.
+        """
+        if self._conn is None:
+            return True
+        # The session's connection is shared by every worker of the run, but runs one query at a time.
+        async with self._lock:
+            return await self.target_db.try_advisory_lock(self.key(source_table, target_table), self._conn)
+
+    async def unlock(self, source_table: str, target_table: str) -> None:
+        """Releases the claim on a table pair taken with try_lock(); a no-op if no session is open."""
+        if self._conn is None:
+            return
+        async with self._lock:
+            await self.target_db.advisory_unlock(self.key(source_table, target_table), self._conn)
+
+def database_identity(db: DatabaseUtility) -> str:
+    config = db.db_config
+    return f"{config.get('host')}:{config.get('port')}/{config.get('dbname')}"
+
+def lock_id(name: str) -> int:
+    """Maps a name to a signed 32-bit integer that is the same in every process, unlike hash()."""
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:4], "big", signed=True)
@@ -1,47 +1,704 @@
-from typing import List, Tuple, Dict
+import asyncio
+import heapq
+import time
+from collections import deque
+from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Dict
 from utils.logger import Logger
-from utils.database import DatabaseUtility
+from utils.database import DatabaseUtility, primary_key_columns, quote_ident
+from utils.batch_queue import BatchQueue
+from utils.schema_cache import SchemaCache
+from utils.state_store import StateStore
+from transfer_engine import CopyTransfer, load_transform
+from chunk_planner import ChunkPlanner
+from lease_queue import LeaseQueue
+from process_pool import ChunkProcessPool
+from sync_locks import SyncLocks
+from sync_worker import SyncWorker
+from diff_engine import DiffEngine
+from models.chunk import TableChunk
+from models.progress import SyncProgress
+from models.schema import SchemaModel
 
 logger = Logger('sync_manager')
 
 class SyncManager:
-    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility, table_mapping: Dict[str, str]):
+    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility, table_mapping: Dict[str, str], *,
+                 transfer_method: str = "copy", batch_size: int = 1000, table_options: Dict[str, Dict] = None,
+                 concurrency: Dict[str, int] = None, consistent_snapshot: bool = True, write_mode: str = "upsert",
+                 add_missing_keys: bool = False, diff_settings: Dict[str, int] = None, copy_format: str = "text",
+                 pipeline: Dict[str, int] = None, schema_cache: SchemaCache = None, change_detection: Dict = None,
+                 progress: SyncProgress = None, table_locks: bool = True, distributed: Dict = None,
+                 processes: Dict = None):
         self.source_db = source_db
         self.target_db = target_db
         self.table_mapping = table_mapping
+        self.transfer_method = transfer_method
+        self.batch_size = batch_size
+        self.table_options = table_options or {}
+        self.copy_transfer = CopyTransfer(source_db, target_db)
+        self.chunk_planner = ChunkPlanner(source_db)
+        self.state_store = StateStore(target_db)
+        self.table_sizes = {}
+        self.schema = None
+        self.schema_cache = schema_cache
+        self.change_detection = change_detection or {}
+        self.progress = progress or SyncProgress()
+        self.locks = SyncLocks(source_db, target_db) if table_locks else None
+        self.distributed = distributed or {}
+        self.lease_queue = None
+        if self.distributed.get("enabled"):
+            self.lease_queue = LeaseQueue(target_db, self.distributed.get("lease_seconds", 60),
+                                          self.distributed.get("heartbeat_interval", 10),
+                                          self.distributed.get("poll_interval", 1), self.distributed.get("max_attempts", 3),
+                                          self.distributed.get("claim_timeout", 300))
+        self.distributed_run = None
+        self.processes = processes or {}
+        self.process_pool = None
+        self.transforms = {}
+        self.consistent_snapshot = consistent_snapshot
+        self.write_mode = write_mode
+        self.add_missing_keys = add_missing_keys
+        self.copy_format = copy_format
+        self.pipeline = pipeline or {}
+        self.snapshot = None
+        self.stored_counters = {}
+
+        concurrency = concurrency or {}
+        self.max_parallel_tables = concurrency.get("tables", 4)
+        self.chunks_per_table = concurrency.get("chunks_per_table", 1)
+        self.chunk_min_bytes = concurrency.get("chunk_min_bytes", 64 * 1024 * 1024)
+        source_connections = concurrency.get("source_connections", self.max_parallel_tables)
+        target_connections = concurrency.get("target_connections", self.max_parallel_tables)
+        if source_db.pool is not None and source_db.pool is target_db.pool:
+            # A transfer holds a target connection while it waits for a source connection;
+            # on a shared pool more transfers than half its size could deadlock.
+            limit = max(1, source_db.pool.max_size // 2)
+            source_connections = min(source_connections, limit)
+            target_connections = min(target_connections, limit)
+        self.source_slots = asyncio.Semaphore(source_connections)
+        self.target_slots = asyncio.Semaphore(target_connections)
+        self.diff_engine = DiffEngine(source_db, target_db, slots=self.connection_slots, **(diff_settings or {}))
         logger.debug(f"SyncManager initialized")
 
-    async def sync(self):
+    async def sync(self, snapshot: str = None):
+        """
+        Syncs every mapped table. With snapshot, an exported snapshot id such as the one a
+        replication slot was created with, all tables are read from it; otherwise from a
+        snapshot exported for the run when consistent_snapshot is set.
+        """
+        self.schema = await self.load_schema()
+        mapped_tables = await self.resolve_tables()
+        # Read before the snapshot is taken, so writes racing with the run move the counters
+        # past the stored ones and are picked up by the next run.
+        tables, counters = await self.skip_unchanged(mapped_tables)
+        if self.schema is not None:
+            sizes = self.schema.sizes()
+        else:
+            try:
+                sizes = await self.source_db.get_table_sizes()
+            except Exception as e:
+                logger.warning(f"Could not fetch table sizes, keeping catalog order: {e}")
+                sizes = {}
+        self.table_sizes = sizes
+        for source_table, target_table in mapped_tables:
+            self.progress.add(source_table, target_table, sizes.get(source_table))
+        for source_table, _ in set(mapped_tables) - set(tables):
+            self.progress.get(source_table).skip()
+
+        # Longest-processing-time-first: dispatching the largest tables first keeps one big
+        # table from starting last and stretching the whole run.
+        table_bytes = {source: sizes.get(source, {}).get("bytes", 0) for source, _ in tables}
+        tables.sort(key=lambda table: table_bytes[table[0]], reverse=True)
+        workers = min(self.max_parallel_tables, len(tables)) or 1
+        projected_bytes = projected_makespan(list(table_bytes.values()), workers)
+        logger.info(f"Syncing {len(tables)} tables ({_format_bytes(sum(table_bytes.values()))}), "
+                    f"up to {workers} at a time; largest worker load {_format_bytes(projected_bytes)}")
+
+        pending = deque(tables)
+        durations = {}
+        failed = []
+        locked = []
+
+        async def _worker():
+            while pending:
+                source_table, target_table = pending.popleft()
+                table_progress = self.progress.get(source_table)
+                start = time.monotonic()
+                claimed = synced = False
+                try:
+                    # A claim that fails (e.g. the lock connection broke) fails this table
+                    # instead of the worker, which would abandon the rest of the queue.
+                    if self.locks is not None:
+                        claimed = await self.claim_table(source_table, target_table, counters)
+                        if not claimed:
+                            locked.append(source_table)
+                            table_progress.skip("locked")
+                            continue
+                    table_progress.start()
+                    await self.sync_table(source_table, target_table)
+                    table_progress.finish()
+                    synced = True
+                except Exception as e:
+                    logger.error(f"Error syncing table '{source_table}': {e}")
+                    failed.append(source_table)
+                    table_progress.finish(e)
+                durations[source_table] = time.monotonic() - start
+                await self.finish_table(source_table, target_table, counters if synced else {}, claimed)
+
+        start = time.monotonic()
+        async with AsyncExitStack() as stack:
+            if self.locks is not None:
+                try:
+                    await stack.enter_async_context(self.locks.session())
+                except Exception as e:
+                    logger.warning(f"Could not open a session for table locks, other processes may sync the same tables: {e}")
+            if snapshot is not None:
+                self.snapshot = snapshot
+                logger.info(f"Reading all tables from snapshot {snapshot}")
+            elif self.consistent_snapshot:
+                # Every reader imports the same snapshot, so the parallel run is as consistent
+                # (e.g. across foreign keys) as reading all tables in one transaction.
+                try:
+                    self.snapshot = await stack.enter_async_context(self.source_db.exported_snapshot())
+                    logger.info(f"Reading all tables from exported snapshot {self.snapshot}")
+                except Exception as e:
+                    logger.warning(f"Could not export a source snapshot, tables are read at different points in time: {e}")
+            if self.lease_queue is not None:
+                try:
+                    self.distributed_run = await stack.enter_async_context(self.lease_queue.run(self.snapshot, self.progress))
+                    if self.distributed.get("local_worker", True):
+                        await stack.enter_async_context(self.local_worker(self.distributed_run.run_id))
+                except Exception as e:
+                    logger.warning(f"Could not start a distributed run, copying every table in this process: {e}")
+            if self.processes.get("enabled") and self.distributed_run is None:
+                try:
+                    self.process_pool = await stack.enter_async_context(self.local_processes())
+                except Exception as e:
+                    logger.warning(f"Could not start the process pool, copying every table in this process: {e}")
+            # Distributed runs queue the chunks of up to concurrency.tables tables at once as well:
+            # each table holds its advisory lock until its chunks are done, and the target's lock
+            # table has to fit them.
+            try:
+                await asyncio.gather(*(_worker() for _ in range(workers)))
+            finally:
+                self.snapshot = None
+                self.distributed_run = None
+                self.process_pool = None
+            actual = time.monotonic() - start
+
+            if locked:
+                logger.info(f"Left {len(locked)} tables to other processes: {locked}")
+            # The counters of synced tables were stored as each one finished (see finish_table),
+            # and those of failed or locked tables are not stored; left are the unchanged tables.
+            run_tables = set(tables)
+            unchanged = {pair: value for pair, value in counters.items() if pair not in run_tables}
+            try:
+                await self.state_store.set_change_counters(unchanged)
+            except Exception as e:
+                logger.warning(f"Could not store table modification counters: {e}")
+
+        busy = sum(durations.values())
+        if busy > 0 and sum(table_bytes.values()) > 0:
+            throughput = sum(table_bytes.values()) / busy
+            logger.info(f"Makespan: projected {projected_bytes / throughput:.2f}s at the observed "
+                        f"{_format_bytes(throughput)}/s per table, actual {actual:.2f}s")
+        else:
+            logger.info(f"Makespan: actual {actual:.2f}s")
+
+        if failed:
+            raise Exception(f"Failed to sync {len(failed)} of {len(tables)} tables: {failed}")
+
+    @asynccontextmanager
+    async def local_worker(self, run_id: str):
+        """Copies chunks of a distributed run in this process too, for as long as the async with block lasts."""
+        worker = SyncWorker(self.lease_queue, self, self.distributed.get("worker_concurrency", self.max_parallel_tables),
+                            run_id)
+        task = asyncio.create_task(worker.run())
+        try:
+            yield worker
+        finally:
+            worker.stop()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @asynccontextmanager
+    async def local_processes(self):
+        """Copies chunks in a pool of worker processes, for as long as the async with block lasts."""
+        settings = {"transfer_method": self.transfer_method, "batch_size": self.batch_size,
+                    "table_options": self.table_options, "copy_format": self.copy_format, "pipeline": self.pipeline,
+                    "table_locks": False}
+        pool = ChunkProcessPool(self.source_db, self.target_db, settings, self.processes.get("workers"),
+                                self.processes.get("report_interval", 0.5))
+        pool.start()
+        logger.info(f"Copying chunks in up to {pool.workers} processes")
+        try:
+            yield pool
+        finally:
+            await pool.close()
+
+    async def load_schema(self) -> Optional[SchemaModel]:
+        """
+        Introspects the source tables of the run with one bulk catalog query, or takes them
+        from the schema cache while the source schema is unchanged: the whole schema when "*"
+        is mapped, only the mapped tables otherwise. Returns None if that fails, in which case
+        every table is looked up on its own.
+        """
+        tables = None if "*" in self.table_mapping else list(self.table_mapping)
+        try:
+            if self.schema_cache is not None:
+                return await self.schema_cache.load(self.source_db, tables=tables)
+            return await self.source_db.introspect_schema(tables=tables)
+        except Exception as e:
+            logger.warning(f"Could not introspect the source schema, falling back to per-table queries: {e}")
+            return None
+
+    async def skip_unchanged(self, tables: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], Dict]:
+        """
+        Leaves out the tables whose source modification counters (see
+        DatabaseUtility.get_modification_counters) have not moved since their last successful
+        sync, unless that was verify_every runs ago or the target table is missing.
+
+        Returns:
+            Tuple[List[Tuple[str, str]], Dict]: The table pairs to sync, and the counters to
+                store for every pair once the run has finished.
+        """
+        if not self.change_detection.get("enabled"):
+            return tables, {}
+        try:
+            current = await self.source_db.get_modification_counters()
+            stored = await self.state_store.get_change_counters()
+            self.stored_counters = stored
+            target_tables = set(await self.target_db.fetch_all_tables())
+        except Exception as e:
+            logger.warning(f"Could not read table modification counters, syncing every table: {e}")
+            return tables, {}
+
+        verify_every = self.change_detection.get("verify_every", 10)
+        pending, counters = [], {}
+        for source_table, target_table in tables:
+            signature = current.get(source_table)
+            previous_signature, skipped_runs = stored.get((source_table, target_table), (None, 0))
+            if (signature is not None and signature == previous_signature and skipped_runs + 1 < verify_every
+                    and target_table in target_tables):
+                counters[(source_table, target_table)] = (signature, skipped_runs + 1)
+                continue
+            pending.append((source_table, target_table))
+            if signature is not None:
+                counters[(source_table, target_table)] = (signature, 0)
+        if len(pending) < len(tables):
+            logger.info(f"Skipping {len(tables) - len(pending)} of {len(tables)} tables without source changes "
+                        f"since their last sync")
+        return pending, counters
+
+    async def claim_table(self, source_table: str, target_table: str, counters: Dict) -> bool:
+        """
+        Takes the advisory lock of a table pair until finish_table(). Returns False if another process
+        holds it, or has released it after syncing the table during this run at the source
+        state this run saw (its counters now hold this run's signature), which makes syncing it
+        again redundant.
+        """
+        if not await self.locks.try_lock(source_table, target_table):
+            logger.info(f"Skipping table '{source_table}', another process is syncing it into '{target_table}'")
+            return False
+        if await self.synced_elsewhere(source_table, target_table, counters):
+            await self.locks.unlock(source_table, target_table)
+            return False
+        return True
+
+    async def synced_elsewhere(self, source_table: str, target_table: str, counters: Dict) -> bool:
+        """Returns whether another process synced a table during this run at the source state this run saw."""
+        pair = (source_table, target_table)
+        if pair not in counters:
+            return False
+        synced = (counters[pair][0], 0)
+        if self.stored_counters.get(pair) == synced:
+            return False
+        try:
+            stored = await self.state_store.get_change_counter(source_table, target_table)
+        except Exception as e:
+            logger.warning(f"Could not read the modification counters of table '{source_table}': {e}")
+            return False
+        if stored == synced:
+            logger.info(f"Skipping table '{source_table}', another process synced it into '{target_table}' during this run")
+            return True
+        return False
+
+    async def finish_table(self, source_table: str, target_table: str, counters: Dict, claimed: bool) -> None:
+        """
+        Stores the modification counters of a synced table, if it is in counters, and then
+        releases its lock, so a process claiming the table afterwards sees that it has been
+        synced at this source state (see claim_table).
+        """
+        pair = (source_table, target_table)
+        try:
+            if pair in counters:
+                await self.state_store.set_change_counters({pair: counters[pair]})
+        except Exception as e:
+            logger.warning(f"Could not store the modification counters of table '{source_table}': {e}")
+        finally:
+            if claimed:
+                try:
+                    await self.locks.unlock(source_table, target_table)
+                except Exception as e:
+                    logger.warning(f"Could not release the lock of table '{source_table}', it is released when the run ends: {e}")
+
+    async def resolve_tables(self) -> List[Tuple[str, str]]:
+        """Expands the table mapping into (source_table, target_table) pairs."""
+        tables = []
         for source_table, target_table in self.table_mapping.items():
             if source_table == "*":
                 logger.debug(f"Syncing all tables")
-                all_tables = await self.source_db.fetch_all_tables()
+                # An empty model falls back to fetch_all_tables, which also looks outside the schema.
+                all_tables = self.schema.table_names() if self.schema else await self.source_db.fetch_all_tables()
                 logger.debug(f"Tables found: {all_tables}")
                 for table in all_tables:
-                    await self.sync_table(table)
+                    if table in self.table_mapping:
+                        # Synced through its own mapping entry
+                        continue
+                    tables.append((table, table))
             else:
                 logger.debug(f"Syncing table: {source_table}")
+                tables.append((source_table, target_table))
+        return tables
+
+    @asynccontextmanager
+    async def connection_slots(self):
+        """Holds one source and one target connection slot, capping the load on either database."""
+        async with self.source_slots:
+            async with self.target_slots:
+                yield
+
+    def get_table_option(self, table: str, key: str, default=None):
+        """Returns a per-table option, falling back to the "*" entry and then to the default."""
+        for entry in (table, "*"):
+            options = self.table_options.get(entry, {})
+            if key in options:
+                return options[key]
+        return default
+
+    def get_transform(self, table: str) -> Optional[Callable[[List[Any]], Optional[List[Any]]]]:
+        """Returns the row transform of a table (the "transform" option, "module:function"), or None."""
+        path = self.get_table_option(table, "transform")
+        if not path:
+            return None
+        if path not in self.transforms:
+            self.transforms[path] = load_transform(path)
+        return self.transforms[path]
     
     async def sync_table(self, source_table: str, target_table: str = None):
         if not target_table:
             target_table = source_table
         
-        try: 
-            source_columns = await self.source_db.get_table_columns(source_table)
-        except Exception as e:
-            logger.error(f"Error fetching columns: {e}")
-        
+        table_schema = self.schema.get(source_table) if self.schema is not None else None
+        if table_schema is not None:
+            source_columns = table_schema.columns
+        else:
+            try:
+                source_columns = await self.source_db.get_table_columns(source_table)
+            except Exception as e:
+                logger.error(f"Error fetching columns: {e}")
+                raise
+
+        # Nothing can be copied into a table that could not be created, so the table fails here.
         try:
             await self.target_db.create_table(target_table, source_columns)
         except Exception as e:
             logger.error(f"Error creating table: {e}")
+            raise
+
+        key_columns = primary_key_columns(source_columns)
+        watermark_column = self.get_table_option(source_table, "watermark_column")
+        write_mode = self.get_table_option(source_table, "write_mode", self.write_mode)
+        if (key_columns and (watermark_column or write_mode in ("upsert", "diff"))
+                and not await self.target_db.has_unique_key(target_table, key_columns)):
+            # Tables created before primary keys were copied along have none; rows cannot be
+            # matched by key (ON CONFLICT fails), and earlier appends may have duplicated them.
+            if self.add_missing_keys:
+                logger.warning(f"Table '{target_table}' has no unique key on {key_columns}, reloading it and adding one")
+                await self.reload_table(source_table, target_table, source_columns, key_columns)
+                return
+            # Reloading would drop the rows only the target has and change its schema, so that is
+            # left to the user (sync.add_missing_keys).
+            if watermark_column:
+                # Appending the changed rows would duplicate every updated one.
+                message = (f"Table '{target_table}' has no unique key on {key_columns} to upsert incremental rows "
+                           f"by; add one or set sync.add_missing_keys to reload the table and add it")
+                logger.error(message)
+                raise ValueError(message)
+            if write_mode == "upsert":
+                logger.warning(f"Table '{target_table}' has no unique key on {key_columns} to upsert by, appending "
+                               f"rows instead; add one or set sync.add_missing_keys to reload the table and add it")
+                write_mode = "append"
+            # Diff mode replaces whole key ranges and needs no key on the target.
+
+        if watermark_column and not key_columns:
+            # Rows moving past the watermark could not be matched by key, and appending them
+            # would duplicate every updated row.
+            logger.warning(f"Table '{source_table}' has no primary key for incremental sync, reloading it instead")
+            await self.reload_table(source_table, target_table, source_columns)
+            return
+        if watermark_column:
+            if any(col['name'] == watermark_column for col in source_columns):
+                await self.sync_table_incremental(source_table, target_table, source_columns, watermark_column)
+                return
+            logger.warning(f"Table '{source_table}' has no watermark column '{watermark_column}', running a full sync")
+
+        if write_mode == "diff" and key_columns:
+            await self.sync_table_diff(source_table, target_table, source_columns)
+            return
+        if write_mode in ("upsert", "diff") and not key_columns:
+            # Without a key rows cannot be matched, so the table is reloaded from scratch.
+            logger.info(f"Table '{source_table}' has no primary key, replacing its contents")
+            await self.reload_table(source_table, target_table, source_columns)
+            return
+
+        chunks = await self.plan_chunks(source_table, source_columns)
+        await self.copy_chunks(source_table, target_table, source_columns, chunks,
+                               key_columns if write_mode in ("upsert", "diff") else None)
+
+    async def reload_table(self, source_table: str, target_table: str, columns: List[Dict],
+                           key_columns: List[str] = None) -> None:
+        """
+        Replaces the contents of a table: its chunks are copied into a load table, whose rows
+        then replace the target's in one transaction, so a failed or interrupted copy leaves
+        the previous contents in place. With key_columns, the unique key the target lacks is
+        added in the same transaction.
+        """
+        load_table = await self.target_db.create_load_table(target_table)
+        try:
+            chunks = await self.plan_chunks(source_table, columns)
+            await self.copy_chunks(source_table, load_table, columns, chunks)
+            await self.target_db.replace_table_rows(target_table, load_table, [col['name'] for col in columns],
+                                                    key_columns)
+        finally:
+            try:
+                await self.target_db.drop_table(load_table)
+            except Exception as e:
+                logger.warning(f"Could not drop load table '{load_table}': {e}")
+
+    async def sync_table_incremental(self, source_table: str, target_table: str, columns: List[Dict], watermark_column: str):
+        """
+        Copies only the rows whose watermark column moved past the high-water mark stored by
+        the previous run, upserting them by primary key, and then stores the new mark. The
+        table needs a primary key.
+
+        The upper bound is read before copying (from the run's snapshot when there is one), so
+        rows changing during the copy are picked up again by the next run instead of being lost.
+        """
+        column_type = next(col['type'] for col in columns if col['name'] == watermark_column)
+        low = await self.state_store.get_watermark(source_table, target_table, watermark_column)
+        high = await self.source_db.get_max_value(source_table, watermark_column, self.snapshot)
+        if high is None or high == low:
+            logger.info(f"No new rows in table '{source_table}' past {watermark_column} = {low}")
+            return
+
+        ident = quote_ident(watermark_column)
+        cast = f"::{column_type}"
+        if low is None:
+            chunk = TableChunk(f"{ident} <= %s{cast}", (high,), f"{watermark_column} <= {high}")
+        else:
+            chunk = TableChunk(f"{ident} > %s{cast} AND {ident} <= %s{cast}", (low, high),
+                               f"{low} < {watermark_column} <= {high}")
+
+        rows = sum(await self.copy_chunks(source_table, target_table, columns, [chunk], primary_key_columns(columns)))
+
+        await self.state_store.set_watermark(source_table, target_table, watermark_column, high)
+        logger.info(f"Upserted {rows} rows into '{target_table}' ({chunk.label})")
+
+    async def sync_table_diff(self, source_table: str, target_table: str, columns: List[Dict]):
+        """
+        Re-copies only the primary key ranges whose checksums differ between source and target,
+        replacing the target rows of each range so deleted rows are removed as well.
+        """
+        ranges = await self.diff_engine.changed_ranges(source_table, target_table, columns, self.snapshot)
+        if not ranges:
+            logger.info(f"Table '{target_table}' already matches '{source_table}'")
+            return
+        results = await self.copy_chunks(source_table, target_table, columns, ranges, replace=True)
+        logger.info(f"Re-copied {sum(results)} rows in {len(ranges)} ranges of '{source_table}' into '{target_table}'")
 
+    async def plan_chunks(self, source_table: str, columns: List[Dict]) -> List[TableChunk]:
+        """Splits large tables into primary key or ctid ranges that are copied concurrently."""
+        chunk_count = int(self.get_table_option(source_table, "parallel_chunks", self.chunks_per_table))
+        table_size = self.table_sizes.get(source_table, {})
+        chunk_count = min(chunk_count, max(1, table_size.get("bytes", 0) // self.chunk_min_bytes))
         try:
-            source_data =await self.source_db.fetch_table_data(source_table)
+            return await self.chunk_planner.plan(source_table, columns, chunk_count, table_size.get("pages", 0))
         except Exception as e:
-            logger.error(f"Error fetching data: {e}")
+            logger.warning(f"Error planning chunks for table '{source_table}', copying it as a single stream: {e}")
+            return [TableChunk()]
+
+    async def copy_chunks(self, source_table: str, target_table: str, columns: List[Dict], chunks: List[TableChunk],
+                          key_columns: List[str] = None, replace: bool = False) -> List[int]:
+        """
+        Copies chunks of a table concurrently with sync_chunk, or hands them to the workers of
+        the distributed run, and returns the rows written per chunk (in total for a distributed
+        run). Raises the first error once every chunk has finished.
+        """
+        if self.distributed_run is not None:
+            priority = self.table_sizes.get(source_table, {}).get("bytes", 0)
+            return [await self.distributed_run.copy(source_table, target_table, columns, chunks, key_columns, replace,
+                                                    priority)]
+        copy = self.sync_chunk
+        if self.process_pool is not None and self.get_table_option(source_table, "processes", True):
+            copy = self.copy_in_process
+        results = await asyncio.gather(*(copy(source_table, target_table, columns, chunk, key_columns, replace,
+                                              self.snapshot)
+                                         for chunk in chunks), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        return results
+
+    async def copy_in_process(self, source_table: str, target_table: str, columns: List[Dict], chunk: TableChunk,
+                              key_columns: List[str] = None, replace: bool = False, snapshot: str = None) -> int:
+        """Copies one chunk like sync_chunk, in a process of the process pool and within the connection caps."""
+        async with self.connection_slots():
+            return await self.process_pool.copy(source_table, target_table, columns, chunk, key_columns, replace,
+                                                snapshot, self.progress.get(source_table))
+
+    async def sync_chunk(self, source_table: str, target_table: str, columns: List[Dict], chunk: TableChunk,
+                         key_columns: List[str] = None, replace: bool = False, snapshot: str = None,
+                         on_complete: Callable[[Any, int], Awaitable[None]] = None) -> int:
+        """
+        Copies one chunk of a table, upserting by key_columns when given or replacing the chunk's
+        target rows with replace, and returns the number of rows written. Falls back to batched
+        INSERTs when COPY is disabled or fails. Tables with a transform are always copied with
+        binary COPY, which the transform needs, and never fall back.
+
+        on_complete is called with the target connection and the row count inside the COPY
+        transaction, right before it commits, and can veto the commit by raising. With
+        on_complete, the INSERT path writes the whole chunk in one transaction as well instead
+        of committing per batch, and a failed COPY is raised instead of falling back, as the
+        caller (a leased chunk) retries it.
+        """
+        transform = self.get_transform(source_table)
+        if self.transfer_method == "copy" or transform is not None:
+            copy_format = "binary" if transform else self.get_table_option(source_table, "copy_format", self.copy_format)
+            vetoed = []
+
+            async def _complete(conn, rows):
+                try:
+                    await on_complete(conn, rows)
+                except Exception:
+                    vetoed.append(True)
+                    raise
+
+            try:
+                async with self.connection_slots():
+                    return await self.copy_transfer.transfer(source_table, target_table, columns, chunk, snapshot,
+                                                             key_columns, replace, copy_format, transform,
+                                                             progress=self.progress.get(source_table),
+                                                             on_complete=_complete if on_complete else None)
+            except Exception as e:
+                # A vetoed commit is not a transfer failure, and INSERTs would skip the transform,
+                # so neither is retried with INSERTs. Neither is a leased chunk: its INSERTs would
+                # commit batch by batch before on_complete could check that the lease is still held,
+                # so a worker that lost the lease would write the rows next to its successor.
+                if vetoed or transform is not None or on_complete is not None:
+                    raise
+                logger.warning(f"COPY transfer failed for table '{source_table}' ({chunk.label}), falling back to INSERT: {e}")
 
         try:
-            await self.target_db.insert_data(target_table, source_data)
+            batch_size = int(self.get_table_option(source_table, "batch_size", self.batch_size))
+            async with self.connection_slots():
+                if on_complete is None:
+                    if replace:
+                        await self.target_db.delete_rows(target_table, chunk.where, chunk.params or None)
+                    return await self.pipe_batches(source_table, target_table, columns, chunk, batch_size,
+                                                   key_columns, snapshot)
+                # A leased chunk commits its rows in the transaction that marks it done, so a worker
+                # that lost the lease, or an attempt that failed midway, leaves no rows behind.
+                async with self.target_db.connection() as conn:
+                    try:
+                        if replace:
+                            await self.target_db.delete_rows(target_table, chunk.where, chunk.params or None,
+                                                             commit=False, conn=conn)
+                        rows = await self.pipe_batches(source_table, target_table, columns, chunk, batch_size,
+                                                       key_columns, snapshot, conn)
+                        await on_complete(conn, rows)
+                        await self.target_db.commit(conn)
+                    except BaseException:
+                        await self.target_db.rollback(conn)
+                        raise
+                    return rows
         except Exception as e:
-            logger.error(f"Error inserting data: {e}")
+            logger.error(f"Error streaming data: {e}")
+            raise
+
+    async def pipe_batches(self, source_table: str, target_table: str, columns: List[Dict], chunk: TableChunk,
+                           batch_size: int, key_columns: List[str] = None, snapshot: str = None, conn=None) -> int:
+        """
+        Streams one chunk through batched INSERTs with the fetch and the write overlapping. Each
+        batch is committed on its own, unless conn is given: then all of them are left in its
+        transaction. The given columns are read by name, as on the COPY path, so the INSERTs
+        do not depend on the column order of the source table.
+
+        A reader task fills a BatchQueue bounded by sync.pipeline's max_rows and max_bytes while
+        the writer drains it, so both databases stay busy and the wall time approaches the
+        slower of the two sides instead of their sum.
+        """
+        column_names = [col['name'] for col in columns]
+        queue = BatchQueue(self.pipeline.get("max_rows", 4 * batch_size), self.pipeline.get("max_bytes", 64 * 1024 * 1024))
+        busy = {"read": 0.0, "write": 0.0}
+
+        async def _read():
+            try:
+                # aclosing releases the source cursor and connection even when the reader is cancelled.
+                async with aclosing(self.source_db.stream_table_data(source_table, batch_size, column_names,
+                                                                     chunk.where, chunk.params or None,
+                                                                     snapshot=snapshot)) as batches:
+                    start = time.monotonic()
+                    async for batch in batches:
+                        busy["read"] += time.monotonic() - start
+                        await queue.put(batch)
+                        start = time.monotonic()
+            except Exception as e:
+                await queue.close(e)
+                raise
+            await queue.close()
+
+        start = time.monotonic()
+        reader = asyncio.create_task(_read())
+        table_progress = self.progress.get(source_table)
+        rows = 0
+        try:
+            while (batch := await queue.get()) is not None:
+                write_start = time.monotonic()
+                written = await self.target_db.insert_data(target_table, batch, batch_size, conflict_columns=key_columns,
+                                                           commit=conn is None, conn=conn)
+                busy["write"] += time.monotonic() - write_start
+                rows += written
+                if table_progress is not None:
+                    table_progress.add_rows(written)
+            await reader
+        except BaseException:
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            raise
+        logger.info(f"Streamed {rows} rows from '{source_table}' ({chunk.label}) into '{target_table}': read "
+                    f"{busy['read']:.2f}s, write {busy['write']:.2f}s, wall {time.monotonic() - start:.2f}s")
+        return rows
+
+def projected_makespan(sizes: List[int], workers: int) -> int:
+    """
+    Simulates longest-processing-time-first scheduling of jobs over a number of workers.
+
+    Args:
+        sizes (List[int]): The cost of each job, e.g. table sizes in bytes.
+        workers (int): The number of jobs that run at the same time.
+
+    Returns:
+        int: The load of the busiest worker, in the unit of sizes.
+    """
+    loads = [0] * max(1, workers)
+    for size in sorted(sizes, reverse=True):
+        heapq.heapreplace(loads, loads[0] + size)
+    return max(loads)
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
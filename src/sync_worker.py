@@ -0,0 +1,105 @@
+import asyncio
+import os
+import socket
+import uuid
+from typing import TYPE_CHECKING
+
+from lease_queue import ChunkLease, LeaseLostError, LeaseQueue
+from utils.logger import Logger
+
+if TYPE_CHECKING:
+    from sync_manager import SyncManager
+
+logger = Logger('sync_worker')
+
+class SyncWorker:
+    def __init__(self, queue: LeaseQueue, sync_manager: "SyncManager", concurrency: int = 4, run_id: str = None):
+        """
+        Claims chunks from a LeaseQueue and copies them, on any node that can reach both databases.
+
+        Each chunk is copied with SyncManager.sync_chunk from the exported snapshot of its run,
+        while a heartbeat renews its lease. The chunk is marked done inside the transaction that
+        commits its rows, which fails (rolling the rows back) if the lease was lost meanwhile.
+        Failed chunks are released for another attempt.
+
+        Args:
+            queue (LeaseQueue): The queue to take chunks from.
+            sync_manager (SyncManager): Copies the chunks; its connection limits apply.
+            concurrency (int, optional): The number of chunks copied at once. Defaults to 4.
+            run_id (str, optional): Only take chunks of this run. Defaults to None, any live run.
+        """
+        self.queue = queue
+        self.sync_manager = sync_manager
+        self.concurrency = concurrency
+        self.run_id = run_id
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.chunks_done = 0
+        self._stop = asyncio.Event()
+
+    async def run(self) -> None:
+        """Copies chunks until stop() is called, then waits for the chunks in progress."""
+        self._stop.clear()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        logger.info(f"Worker {self.worker_id} waiting for chunks")
+        try:
+            while not self._stop.is_set():
+                await slots.acquire()
+                try:
+                    lease = await self.queue.claim(self.worker_id, self.run_id)
+                except Exception as e:
+                    logger.warning(f"Could not claim a chunk: {e}")
+                    lease = None
+                if lease is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(self._stop.wait(), self.queue.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self.process(lease))
+                tasks.add(task)
+                task.add_done_callback(lambda task: (tasks.discard(task), slots.release()))
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Worker {self.worker_id} stopped after {self.chunks_done} chunks")
+
+    def stop(self) -> None:
+        """Stops claiming chunks; the chunks in progress are finished."""
+        self._stop.set()
+
+    async def process(self, lease: ChunkLease) -> None:
+        """Copies one leased chunk, renewing the lease until it is done."""
+        logger.info(f"Copying chunk {lease.id} of table '{lease.source_table}' ({lease.chunk.label}), "
+                    f"attempt {lease.attempt}")
+        heartbeat = asyncio.create_task(self._heartbeat(lease))
+
+        async def _complete(conn, rows):
+            await self.queue.complete(lease, rows, conn)
+
+        try:
+            await self.sync_manager.sync_chunk(lease.source_table, lease.target_table, lease.columns, lease.chunk,
+                                               lease.key_columns, lease.replace, lease.snapshot, _complete)
+            self.chunks_done += 1
+        except LeaseLostError as e:
+            logger.warning(f"Discarded chunk {lease.id} of table '{lease.source_table}': {e}")
+        except Exception as e:
+            logger.error(f"Chunk {lease.id} of table '{lease.source_table}' failed: {e}")
+            try:
+                await self.queue.fail(lease, e)
+            except Exception as fail_error:
+                logger.warning(f"Could not release chunk {lease.id}, it is re-leased when its lease expires: {fail_error}")
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _heartbeat(self, lease: ChunkLease) -> None:
+        while True:
+            await asyncio.sleep(self.queue.heartbeat_interval)
+            try:
+                if not await self.queue.heartbeat(lease):
+                    logger.warning(f"Lost the lease on chunk {lease.id}, its rows will not be committed")
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew the lease on chunk {lease.id}: {e}")
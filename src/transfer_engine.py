@@ -0,0 +1,162 @@
+import asyncio
+import importlib
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from models.chunk import TableChunk
+from models.progress import TableProgress
+from utils.byte_pipe import BytePipe
+from utils.copy_codecs import BinaryCopyTransformer
+from utils.database import DatabaseUtility, quote_ident
+from utils.logger import Logger
+
+logger = Logger('transfer_engine')
+
+# The drivers hand COPY TO STDOUT data over one row or message at a time; it is queued in blocks of this size.
+PIPE_CHUNK_SIZE = 1024 * 1024
+# Blocks in flight between the source and the target, bounding the memory of a transfer.
+PIPE_MAX_CHUNKS = 8
+
+class CopyTransfer:
+    def __init__(self, source_db: DatabaseUtility, target_db: DatabaseUtility):
+        """
+        Streams table data from the source to the target database with COPY on both ends.
+
+        The source runs COPY (SELECT ...) TO STDOUT and the target runs COPY ... FROM STDIN;
+        the raw COPY stream is passed between them through a bounded queue of byte blocks
+        (BytePipe), so rows are never parsed or adapted in Python.
+
+        Args:
+            source_db (DatabaseUtility): The database to read from.
+            target_db (DatabaseUtility): The database to write to.
+        """
+        self.source_db = source_db
+        self.target_db = target_db
+
+    async def transfer(self, source_table: str, target_table: str, columns: List[Dict[str, str]], chunk: TableChunk = None,
+                       snapshot: str = None, key_columns: List[str] = None, replace: bool = False,
+                       copy_format: str = "text", transform: Callable[[List[Any]], Optional[List[Any]]] = None,
+                       progress: TableProgress = None, on_complete: Callable[[Any, int], Awaitable[None]] = None) -> int:
+        """
+        Copies every row of the source table, or of one chunk of it, into the target table.
+
+        With key_columns the rows are upserted: the stream is copied into a temporary staging
+        table, which is then merged into the target table with a single set-based statement,
+        so repeated runs are idempotent and still load at COPY speed. With replace the target
+        rows of the chunk are deleted first instead, in the same transaction, so rows that no
+        longer exist on the source disappear as well.
+
+        The stream is passed through untouched in either COPY format. Only with a transform,
+        which needs the binary format, is every row decoded with the codecs of its column
+        types, handed to the transform and re-encoded.
+
+        The target transaction is only committed when both sides of the stream finished
+        cleanly; on any failure it is rolled back and the error is re-raised.
+
+        Args:
+            source_table (str): The name of the table to read from.
+            target_table (str): The name of the table to write to.
+            columns (List[Dict[str, str]]): Column definitions as returned by get_table_columns.
+            chunk (TableChunk, optional): The slice of the table to copy. Defaults to the whole table.
+            snapshot (str, optional): An exported source snapshot to read from. Defaults to None.
+            key_columns (List[str], optional): Key columns to upsert by. Defaults to a plain append.
+            replace (bool, optional): Whether to delete the chunk's target rows before loading. Defaults to False.
+            copy_format (str, optional): The COPY format, "text" or "binary". Defaults to "text".
+            transform (Callable, optional): Called with each decoded row; returns the row to write,
+                or None to skip it. Defaults to None.
+            progress (TableProgress, optional): Shows the bytes streamed so far and gets the rows
+                copied once they are committed. Defaults to None.
+            on_complete (Callable, optional): Called with the target connection and the row count
+                right before the commit, in the same transaction; raising rolls the chunk back.
+                Defaults to None.
+
+        Returns:
+            int: The number of rows copied into (or updated in) the target table.
+        """
+        column_names = [col['name'] for col in columns]
+        if transform and copy_format != "binary":
+            raise ValueError("Transforms need the binary COPY format")
+        select_list = ", ".join(quote_ident(name) for name in column_names)
+        query = f"SELECT {select_list} FROM {quote_ident(source_table)}"
+        chunk = chunk or TableChunk()
+        if chunk.where:
+            query += f" WHERE {chunk.where}"
+
+        async def _produce(pipe):
+            try:
+                return await self.source_db.copy_out(query, pipe, chunk.params or None, snapshot, copy_format=copy_format)
+            finally:
+                # Ends the stream for the target if the source failed before finishing it.
+                pipe.abort()
+
+        async def _consume(pipe, target_conn, load_table):
+            try:
+                return await self.target_db.copy_in(load_table, column_names, pipe, commit=False, conn=target_conn,
+                                                    copy_format=copy_format)
+            finally:
+                # Closing the read end unblocks the producer if the target gave up early.
+                pipe.close_reader()
+
+        logger.info(f"Copying table '{source_table}' ({chunk.label}) into '{target_table}' ({copy_format} format)")
+        start = time.monotonic()
+        async with self.target_db.connection() as target_conn:
+            load_table = target_table
+            if replace:
+                await self.target_db.delete_rows(target_table, chunk.where, chunk.params or None,
+                                                 commit=False, conn=target_conn)
+            if key_columns:
+                load_table = await self.target_db.create_staging_table(target_table, target_conn)
+            transformer = BinaryCopyTransformer([col.get('type_oid') for col in columns], transform) if transform else None
+            pipe = BytePipe(PIPE_MAX_CHUNKS, PIPE_CHUNK_SIZE, transformer)
+            if progress is not None:
+                progress.watch(pipe)
+            try:
+                produced, consumed = await asyncio.gather(_produce(pipe), _consume(pipe, target_conn, load_table),
+                                                          return_exceptions=True)
+
+                error = next((result for result in (consumed, produced) if isinstance(result, BaseException)), None)
+                if error is not None:
+                    await self.target_db.rollback(target_conn)
+                    raise error
+
+                try:
+                    if key_columns:
+                        consumed = await self.target_db.merge_staging_table(load_table, target_table, column_names,
+                                                                            key_columns, target_conn)
+                    if on_complete is not None:
+                        await on_complete(target_conn, consumed)
+                    await self.target_db.commit(target_conn)
+                except Exception:
+                    await self.target_db.rollback(target_conn)
+                    raise
+            except BaseException:
+                if progress is not None:
+                    progress.unwatch(pipe, completed=False)
+                raise
+        if progress is not None:
+            progress.unwatch(pipe)
+            progress.add_rows(consumed)
+        elapsed = time.monotonic() - start
+        rate = consumed / elapsed if elapsed > 0 else 0
+        byte_rate = pipe.bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0
+        logger.info(f"Copied {consumed} rows from '{source_table}' ({chunk.label}) into '{target_table}' in {elapsed:.2f}s "
+                    f"({rate:.0f} rows/s, {byte_rate:.1f} MB/s)")
+        return consumed
+
+def load_transform(path: str) -> Callable[[List[Any]], Optional[List[Any]]]:
+    """
+    Imports a row transform given as "module:function", e.g. "transforms:mask_emails".
+
+    Transforms are configured by name rather than passed around as objects, so every process
+    copying chunks of the table can import the same function.
+
+    Raises:
+        ValueError: If the path is malformed or does not name a callable.
+    """
+    module_name, _, name = path.partition(":")
+    if not module_name or not name:
+        raise ValueError(f"Invalid transform '{path}', expected 'module:function'")
+    transform = getattr(importlib.import_module(module_name), name, None)
+    if not callable(transform):
+        raise ValueError(f"Transform '{path}' is not a function")
+    return transform
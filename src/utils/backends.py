@@ -0,0 +1,370 @@
+import asyncio
+import re
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extras
+from utils.byte_pipe import BytePipe
+
+class DatabaseBackend(ABC):
+    """
+    The driver operations DatabaseUtility is built on.
+
+    Every method takes a connection checked out of the backend's pool (see utils.pool). Queries
+    use psycopg2's %s placeholders whatever the driver, and like psycopg2 the first statement
+    on a connection opens a transaction that lasts until commit() or rollback(). Rows can be
+    read by position and by column name.
+    """
+
+    name = None
+
+    @abstractmethod
+    async def fetch(self, conn, query: str, params: Sequence = None, snapshot: str = None,
+                    settings: Dict[str, str] = None) -> List:
+        """
+        Runs a query and returns all its rows. With a snapshot the query runs in a read-only
+        transaction importing that exported snapshot, which is rolled back afterwards. Settings
+        (name to value) are applied like SET LOCAL, so they last until the transaction ends.
+        """
+
+    @abstractmethod
+    async def execute(self, conn, query: str, params: Sequence = None) -> int:
+        """Runs a statement and returns the number of rows it affected."""
+
+    @abstractmethod
+    async def execute_values(self, conn, query: str, rows: List[Sequence]) -> int:
+        """Runs a statement containing a single "VALUES %s" once for all rows."""
+
+    @abstractmethod
+    async def commit(self, conn) -> None:
+        """Commits the connection's open transaction, if any."""
+
+    @abstractmethod
+    async def rollback(self, conn) -> None:
+        """Rolls back the connection's open transaction, if any."""
+
+    @abstractmethod
+    async def server_version(self, conn) -> int:
+        """Returns the server version as an integer, e.g. 140005 for 14.5."""
+
+    @abstractmethod
+    async def export_snapshot(self, conn) -> str:
+        """Opens a REPEATABLE READ transaction and returns its pg_export_snapshot() id."""
+
+    @abstractmethod
+    async def copy_out(self, conn, query: str, params: Sequence, pipe: BytePipe, snapshot: str = None,
+                       copy_format: str = "text") -> int:
+        """Runs COPY (query) TO STDOUT into the pipe, finishes the pipe and returns the row count."""
+
+    @abstractmethod
+    async def copy_in(self, conn, table_name: str, columns: List[str], pipe: BytePipe,
+                      copy_format: str = "text") -> int:
+        """Runs COPY table (columns) FROM STDIN from the pipe and returns the row count."""
+
+    @abstractmethod
+    def stream(self, conn, query: str, params: Sequence = None, batch_size: int = 1000,
+               snapshot: str = None) -> AsyncIterator[List]:
+        """Yields the rows of a query in batches through a server-side cursor, in its own read transaction."""
+
+# set_config(..., true) is SET LOCAL with bind parameters.
+_SET_LOCAL = "SELECT set_config(%s, %s, true)"
+
+def _set_local(cursor, settings: Dict[str, str]) -> None:
+    """Applies settings until the end of the current transaction."""
+    for name, value in (settings or {}).items():
+        cursor.execute(_SET_LOCAL, (name, value))
+
+def _set_snapshot(cursor, snapshot: str) -> None:
+    """Makes the transaction that is about to start read from an exported snapshot."""
+    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+
+async def _run_in_own_thread(func, *args):
+    """
+    Runs a blocking call in a thread of its own instead of the default executor.
+
+    A COPY end blocks for the whole stream, waiting on the other end of its BytePipe. In the
+    shared executor, whose width is min(32, CPUs + 4), enough consumers could occupy every
+    thread while the producers they wait for sit in its queue, deadlocking the run, and
+    long streams would leave no threads for short queries. The number of COPY threads is
+    bounded by the connection caps of the sync instead.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _resolve(result, error):
+        if not future.done():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _target():
+        try:
+            result, error = func(*args), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_resolve, result, error)
+        except RuntimeError:
+            # The loop was closed while the call ran; nobody is waiting for it any more.
+            pass
+
+    threading.Thread(target=_target, name=f"copy-{getattr(func, '__name__', 'call')}", daemon=True).start()
+    return await future
+
+class Psycopg2Backend(DatabaseBackend):
+    """
+    Runs the blocking psycopg2 driver in worker threads (asyncio.to_thread), one thread per
+    call in flight, so concurrency is capped by the default executor's width. COPY streams,
+    which block for as long as they run, get threads of their own (_run_in_own_thread).
+    """
+
+    name = "psycopg2"
+
+    async def fetch(self, conn, query: str, params: Sequence = None, snapshot: str = None,
+                    settings: Dict[str, str] = None) -> List:
+        def _fetch(conn):
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                if not snapshot:
+                    _set_local(cursor, settings)
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
+                try:
+                    _set_snapshot(cursor, snapshot)
+                    _set_local(cursor, settings)
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
+                finally:
+                    conn.rollback()
+
+        return await asyncio.to_thread(_fetch, conn)
+
+    async def execute(self, conn, query: str, params: Sequence = None) -> int:
+        def _execute(conn):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount
+
+        return await asyncio.to_thread(_execute, conn)
+
+    async def execute_values(self, conn, query: str, rows: List[Sequence]) -> int:
+        def _execute_values(conn):
+            with conn.cursor() as cursor:
+                psycopg2.extras.execute_values(cursor, query, rows, page_size=len(rows))
+                return len(rows)
+
+        return await asyncio.to_thread(_execute_values, conn)
+
+    async def commit(self, conn) -> None:
+        await asyncio.to_thread(conn.commit)
+
+    async def rollback(self, conn) -> None:
+        await asyncio.to_thread(conn.rollback)
+
+    async def server_version(self, conn) -> int:
+        return conn.server_version
+
+    async def export_snapshot(self, conn) -> str:
+        def _export(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute("SELECT pg_export_snapshot()")
+                return cursor.fetchone()[0]
+
+        return await asyncio.to_thread(_export, conn)
+
+    async def copy_out(self, conn, query: str, params: Sequence, pipe: BytePipe, snapshot: str = None,
+                       copy_format: str = "text") -> int:
+        def _copy_out(conn):
+            with conn.cursor() as cursor:
+                if snapshot:
+                    _set_snapshot(cursor, snapshot)
+                # COPY takes no bind parameters, so they are interpolated client-side.
+                copy_query = cursor.mogrify(f"COPY ({query}) TO STDOUT (FORMAT {copy_format})", params).decode()
+                cursor.copy_expert(copy_query, pipe.writer)
+                pipe.finish()
+                return cursor.rowcount
+
+        return await _run_in_own_thread(_copy_out, conn)
+
+    async def copy_in(self, conn, table_name: str, columns: List[str], pipe: BytePipe,
+                      copy_format: str = "text") -> int:
+        column_names = ", ".join(_quote_ident(col) for col in columns)
+        query = f"COPY {_quote_ident(table_name)} ({column_names}) FROM STDIN (FORMAT {copy_format})"
+
+        def _copy_in(conn):
+            with conn.cursor() as cursor:
+                cursor.copy_expert(query, pipe.reader)
+                return cursor.rowcount
+
+        return await _run_in_own_thread(_copy_in, conn)
+
+    async def stream(self, conn, query: str, params: Sequence = None, batch_size: int = 1000,
+                     snapshot: str = None) -> AsyncIterator[List]:
+        def _open(conn):
+            if snapshot:
+                with conn.cursor() as cursor:
+                    _set_snapshot(cursor, snapshot)
+            cursor = conn.cursor(name=f"pg_db_sync_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.DictCursor)
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            return cursor
+
+        def _close(conn, cursor):
+            try:
+                cursor.close()
+            finally:
+                # The named cursor lived in its own read-only transaction.
+                conn.rollback()
+
+        cursor = await asyncio.to_thread(_open, conn)
+        try:
+            while True:
+                rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            await asyncio.to_thread(_close, conn, cursor)
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+_COMMAND_STATUS_ROWS = re.compile(r"(\d+)$")
+
+def to_dollar_params(query: str, params: Sequence = None) -> Tuple[str, Tuple]:
+    """
+    Rewrites psycopg2 placeholders (%s, %%) into asyncpg's $1, $2, ...
+
+    psycopg2 sends parameters as untyped literals that the server casts to whatever the query
+    expects; asyncpg binds them with a type. String parameters are therefore passed as $n::text,
+    which the queries cast explicitly where needed (e.g. %s::integer for a key range bound).
+    """
+    if params is None:
+        return query, ()
+    params = tuple(params)
+    position = 0
+
+    def _replace(match):
+        nonlocal position
+        if match.group() == "%%":
+            return "%"
+        position += 1
+        return f"${position}::text" if isinstance(params[position - 1], str) else f"${position}"
+
+    return _PLACEHOLDER.sub(_replace, query), params
+
+def _rowcount(status: str) -> int:
+    match = _COMMAND_STATUS_ROWS.search(status or "")
+    return int(match.group(1)) if match else -1
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+class AsyncpgBackend(DatabaseBackend):
+    """
+    Talks to the server through asyncpg's native asyncio protocol: no worker threads, no
+    executor limit, and values are exchanged in the binary protocol.
+    """
+
+    name = "asyncpg"
+
+    async def _begin_snapshot(self, conn, snapshot: str) -> None:
+        await conn.begin(isolation="repeatable_read", readonly=True)
+        # Utility statements take no bind parameters.
+        await conn.raw.execute(f"SET TRANSACTION SNAPSHOT {_quote_literal(snapshot)}")
+
+    async def _set_local(self, conn, settings: Dict[str, str]) -> None:
+        for name, value in (settings or {}).items():
+            query, args = to_dollar_params(_SET_LOCAL, (name, value))
+            await conn.raw.execute(query, *args)
+
+    async def fetch(self, conn, query: str, params: Sequence = None, snapshot: str = None,
+                    settings: Dict[str, str] = None) -> List:
+        query, args = to_dollar_params(query, params)
+        if not snapshot:
+            await conn.begin()
+            await self._set_local(conn, settings)
+            return await conn.raw.fetch(query, *args)
+        try:
+            await self._begin_snapshot(conn, snapshot)
+            await self._set_local(conn, settings)
+            return await conn.raw.fetch(query, *args)
+        finally:
+            await conn.rollback()
+
+    async def execute(self, conn, query: str, params: Sequence = None) -> int:
+        query, args = to_dollar_params(query, params)
+        await conn.begin()
+        return _rowcount(await conn.raw.execute(query, *args))
+
+    async def execute_values(self, conn, query: str, rows: List[Sequence]) -> int:
+        if not rows:
+            return 0
+        placeholders = ", ".join(f"${i}" for i in range(1, len(rows[0]) + 1))
+        query = query.replace("VALUES %s", f"VALUES ({placeholders})", 1)
+        await conn.begin()
+        # executemany pipelines the rows through one prepared statement.
+        await conn.raw.executemany(query, [tuple(row) for row in rows])
+        return len(rows)
+
+    async def commit(self, conn) -> None:
+        await conn.commit()
+
+    async def rollback(self, conn) -> None:
+        await conn.rollback()
+
+    async def server_version(self, conn) -> int:
+        version = conn.raw.get_server_version()
+        return version.major * 10000 + version.minor
+
+    async def export_snapshot(self, conn) -> str:
+        await conn.begin(isolation="repeatable_read", readonly=True)
+        return await conn.raw.fetchval("SELECT pg_export_snapshot()")
+
+    async def copy_out(self, conn, query: str, params: Sequence, pipe: BytePipe, snapshot: str = None,
+                       copy_format: str = "text") -> int:
+        query, args = to_dollar_params(query, params)
+        if snapshot:
+            await self._begin_snapshot(conn, snapshot)
+        else:
+            await conn.begin()
+        status = await conn.raw.copy_from_query(query, *args, output=pipe.awrite, format=copy_format)
+        await pipe.afinish()
+        return _rowcount(status)
+
+    async def copy_in(self, conn, table_name: str, columns: List[str], pipe: BytePipe,
+                      copy_format: str = "text") -> int:
+        await conn.begin()
+        status = await conn.raw.copy_to_table(table_name, source=pipe.chunks(), columns=columns, format=copy_format)
+        return _rowcount(status)
+
+    async def stream(self, conn, query: str, params: Sequence = None, batch_size: int = 1000,
+                     snapshot: str = None) -> AsyncIterator[List]:
+        query, args = to_dollar_params(query, params)
+        try:
+            if snapshot:
+                await self._begin_snapshot(conn, snapshot)
+            else:
+                await conn.begin(readonly=True)
+            cursor = await conn.raw.cursor(query, *args)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            await conn.rollback()
+
+BACKENDS = {backend.name: backend for backend in (Psycopg2Backend, AsyncpgBackend)}
+
+def get_backend(name: str) -> DatabaseBackend:
+    """Returns the backend registered under a name ("psycopg2" or "asyncpg")."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown database backend: {name}")
+    return BACKENDS[name]()
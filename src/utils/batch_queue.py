@@ -0,0 +1,71 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional
+
+class BatchQueue:
+    def __init__(self, max_rows: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        """
+        An asyncio queue of row batches bounded by the rows and bytes it holds, not by the
+        number of batches, so memory stays bounded whatever the batch size or row width.
+
+        A batch is always accepted into an empty queue, even when it alone exceeds a limit,
+        so the producer cannot stall on a single oversized batch.
+
+        Args:
+            max_rows (int, optional): The number of queued rows at which put() waits. Defaults to 10000.
+            max_bytes (int, optional): The estimated queued size at which put() waits. Defaults to 64 MB.
+        """
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.bytes = 0
+        self._batches = deque()
+        self._condition = asyncio.Condition()
+        self._closed = False
+        self._error = None
+
+    async def put(self, batch: List[Dict]) -> None:
+        """Waits until there is room for the batch, then queues it."""
+        size = estimate_size(batch)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._closed or not self._batches or
+                                           (self.rows + len(batch) <= self.max_rows and self.bytes + size <= self.max_bytes))
+            if self._closed:
+                raise Exception("The batch queue was closed")
+            self._batches.append((batch, size))
+            self.rows += len(batch)
+            self.bytes += size
+            self._condition.notify_all()
+
+    async def get(self) -> Optional[List[Dict]]:
+        """Returns the next batch, or None once the queue is closed and drained."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._batches or self._closed)
+            if self._error is not None:
+                raise self._error
+            if not self._batches:
+                return None
+            batch, size = self._batches.popleft()
+            self.rows -= len(batch)
+            self.bytes -= size
+            self._condition.notify_all()
+            return batch
+
+    async def close(self, error: BaseException = None) -> None:
+        """
+        Marks the end of the stream. With an error the consumer gets it raised instead of the
+        remaining batches; a blocked producer is released either way.
+        """
+        async with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+def estimate_size(batch: List[Dict]) -> int:
+    """Estimates the memory of a batch from its first row, counting text and bytes by length."""
+    if not batch:
+        return 0
+    row = batch[0]
+    values = row.values() if isinstance(row, dict) else row
+    row_size = sum(len(value) if isinstance(value, (str, bytes, bytearray, memoryview)) else 8 for value in values)
+    return row_size * len(batch)
@@ -0,0 +1,210 @@
+import asyncio
+import io
+import queue
+import threading
+from typing import AsyncIterator, Callable
+
+class BytePipe:
+    def __init__(self, max_chunks: int = 8, chunk_size: int = 1024 * 1024, transform=None):
+        """
+        Hands a byte stream from one side of a transfer to the other through a bounded queue of chunks.
+
+        Either end can be driven from a worker thread (writer / reader, file objects as used by
+        psycopg2's copy_expert) or from the event loop (awrite / afinish / chunks, as used by
+        asyncpg). Loop-side ends never block a thread: they wait on futures that the other end
+        resolves with call_soon_threadsafe whenever the queue or the state of the pipe changes.
+        Small writes are gathered into chunk_size blocks before they are queued, and
+        the reader gets whole blocks. The bytes are never parsed, and at most max_chunks blocks
+        are in flight, so a slow target throttles the source instead of growing memory.
+
+        Args:
+            max_chunks (int, optional): The number of blocks the queue holds. Defaults to 8.
+            chunk_size (int, optional): The size of a block in bytes. Defaults to 1 MB.
+            transform (optional): An object with feed(bytes) -> bytes and finish() -> bytes that
+                rewrites the stream on its way through, e.g. a BinaryCopyTransformer.
+        """
+        self.chunk_size = chunk_size
+        self.bytes = 0
+        self._transform = transform
+        self._chunks = queue.Queue(max_chunks)
+        self._reader_closed = threading.Event()
+        self._writer_closed = threading.Event()
+        self._pending = bytearray()
+        self._waiters = []
+        self._waiters_lock = threading.Lock()
+        self.writer = io.BufferedWriter(_PipeWriter(self), buffer_size=chunk_size)
+        self.reader = _PipeReader(self)
+
+    def _put(self, chunk: bytes) -> None:
+        """Queues a block, blocking while the queue is full."""
+        if self._transform is not None:
+            chunk = self._transform.feed(chunk)
+        if not chunk:
+            return
+        while True:
+            if self._reader_closed.is_set():
+                raise BrokenPipeError("The reading end of the pipe was closed")
+            try:
+                self._chunks.put(chunk, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.bytes += len(chunk)
+        self._notify()
+
+    async def _aput(self, chunk: bytes) -> None:
+        """Queues a block from the event loop, waiting without a thread while the queue is full."""
+        if self._transform is not None:
+            # Rewriting a block is CPU work that always finishes, so it may use the default executor.
+            chunk = await asyncio.to_thread(self._transform.feed, chunk)
+        if not chunk:
+            return
+        while True:
+            if self._reader_closed.is_set():
+                raise BrokenPipeError("The reading end of the pipe was closed")
+            try:
+                self._chunks.put_nowait(chunk)
+                break
+            except queue.Full:
+                await self._wait(lambda: self._chunks.full() and not self._reader_closed.is_set())
+        self.bytes += len(chunk)
+        self._notify()
+
+    def _end(self) -> None:
+        try:
+            if self._transform is not None:
+                tail = self._transform.finish()
+                self._transform = None
+                self._put(tail)
+        finally:
+            self._writer_closed.set()
+            self._notify()
+
+    def _notify(self) -> None:
+        """Wakes the loop-side ends waiting for the queue or the state of the pipe to change."""
+        with self._waiters_lock:
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            try:
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # The loop was closed; nothing is waiting on it any more.
+                pass
+
+    async def _wait(self, blocked: Callable[[], bool]) -> None:
+        """Waits on the event loop until blocked() is false."""
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = loop.create_future()
+            with self._waiters_lock:
+                self._waiters.append(waiter)
+            # Checked after registering, so a change made in between wakes the waiter instead of being missed.
+            if not blocked():
+                return
+            await waiter
+
+    def finish(self) -> None:
+        """Flushes the thread-side writer and marks the end of the stream; blocks while the queue is full."""
+        self.writer.close()
+
+    async def awrite(self, data: bytes) -> None:
+        """Writes from the event loop; waits for room in the queue without blocking the loop."""
+        self._pending += data
+        if len(self._pending) >= self.chunk_size:
+            chunk = bytes(self._pending)
+            self._pending.clear()
+            await self._aput(chunk)
+
+    async def afinish(self) -> None:
+        """Flushes what awrite() buffered and marks the end of the stream."""
+        try:
+            if self._pending:
+                chunk = bytes(self._pending)
+                self._pending.clear()
+                await self._aput(chunk)
+            if self._transform is not None:
+                tail = self._transform.finish()
+                self._transform = None
+                await self._aput(tail)
+        finally:
+            self._writer_closed.set()
+            self._notify()
+
+    def abort(self) -> None:
+        """
+        Marks the end of the stream without flushing, e.g. when the writer failed before it
+        started; a no-op once the stream was finished.
+        """
+        self._writer_closed.set()
+        self._notify()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yields the queued blocks to the event loop until the end of the stream."""
+        reader = self.reader
+        while not reader._eof:
+            try:
+                chunk = self._chunks.get_nowait()
+            except queue.Empty:
+                # The writer queues its last block before it sets the flag, so an empty queue
+                # after the flag really is the end.
+                if self._reader_closed.is_set() or (self._writer_closed.is_set() and self._chunks.empty()):
+                    reader._eof = True
+                else:
+                    await self._wait(lambda: self._chunks.empty() and not self._writer_closed.is_set()
+                                     and not self._reader_closed.is_set())
+                continue
+            self._notify()
+            yield chunk
+
+    def close_reader(self) -> None:
+        """Abandons the stream; the writer fails with BrokenPipeError on its next block."""
+        self.reader.close()
+
+class _PipeWriter(io.RawIOBase):
+    def __init__(self, pipe: BytePipe):
+        self._pipe = pipe
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        # The buffer is reused by BufferedWriter, so the block has to be copied out of it.
+        self._pipe._put(bytes(data))
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._pipe._end()
+            except BrokenPipeError:
+                pass
+        super().close()
+
+class _PipeReader:
+    def __init__(self, pipe: BytePipe):
+        self._pipe = pipe
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        """Returns the next block, which may be longer than size, or b"" at the end of the stream."""
+        pipe = self._pipe
+        while not self._eof:
+            try:
+                chunk = pipe._chunks.get(timeout=0.1)
+                pipe._notify()
+                return chunk
+            except queue.Empty:
+                # The writer queues its last block before it sets the flag, so an empty queue
+                # after the flag really is the end.
+                if pipe._reader_closed.is_set() or (pipe._writer_closed.is_set() and pipe._chunks.empty()):
+                    self._eof = True
+        return b""
+
+    def close(self) -> None:
+        self._eof = True
+        self._pipe._reader_closed.set()
+        self._pipe._notify()
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
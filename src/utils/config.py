@@ -1,6 +1,6 @@
 import json
 import os
-from typing import Dict
+from typing import Dict, Optional
 import psycopg2.extensions
 
 def load_config(config_path: str = "config.json") -> Dict:
@@ -47,3 +47,292 @@ def get_sync_settings(config: Dict) -> Dict[str, str]:
             if source_table and target_table:
                 table_mapping[source_table] = target_table
     return table_mapping
+
+def get_table_options(config: Dict) -> Dict[str, Dict]:
+    """
+    Extracts per-table options from the table mapping, keyed by source table.
+
+    Every key of a table entry besides "source" and "target" is treated as an option,
+    e.g. {"source": "orders", "target": "orders", "batch_size": 5000}. Options on the
+    "*" entry apply to every table that has no entry of its own.
+    """
+    table_options = {}
+    sync_config = config.get("sync")
+    if sync_config:
+        for table_info in sync_config.get("tables", []):
+            source_table = table_info.get("source")
+            if source_table:
+                table_options[source_table] = {
+                    key: value for key, value in table_info.items() if key not in ("source", "target")
+                }
+    return table_options
+
+def get_batch_size(config: Dict) -> int:
+    """Returns the number of rows read and written per batch (sync.batch_size)."""
+    batch_size = int(config.get("sync", {}).get("batch_size", 1000))
+    if batch_size <= 0:
+        raise ValueError(f"Invalid batch size: {batch_size}")
+    return batch_size
+
+def get_pool_settings(config: Dict) -> Dict:
+    """
+    Returns the connection pool settings (sync.pool), e.g.
+    {"min_size": 1, "max_size": 10, "max_lifetime": 3600, "health_check_interval": 30}.
+    """
+    pool_config = config.get("sync", {}).get("pool", {})
+    allowed = ("min_size", "max_size", "max_lifetime", "health_check_interval")
+    unknown = set(pool_config) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {sorted(unknown)}")
+    return dict(pool_config)
+
+def get_database_backend(config: Dict) -> str:
+    """
+    Returns the database driver (sync.backend): "psycopg2" (default), run in worker threads,
+    or "asyncpg", a native asyncio driver.
+    """
+    backend = config.get("sync", {}).get("backend", "psycopg2")
+    if backend not in ("psycopg2", "asyncpg"):
+        raise ValueError(f"Unknown database backend: {backend}")
+    return backend
+
+def get_concurrency_settings(config: Dict) -> Dict[str, int]:
+    """
+    Returns the parallelism limits (sync.concurrency): "tables" synced at once and the
+    maximum number of concurrent transfers per database ("source_connections",
+    "target_connections"), which default to the table limit. Tables larger than
+    "chunk_min_bytes" are split into up to "chunks_per_table" key ranges copied in parallel.
+    """
+    concurrency = dict(config.get("sync", {}).get("concurrency", {}))
+    concurrency.setdefault("tables", 4)
+    concurrency.setdefault("source_connections", concurrency["tables"])
+    concurrency.setdefault("target_connections", concurrency["tables"])
+    concurrency.setdefault("chunks_per_table", 1)
+    concurrency.setdefault("chunk_min_bytes", 64 * 1024 * 1024)
+    for key, value in concurrency.items():
+        if int(value) < 1:
+            raise ValueError(f"Invalid concurrency limit for {key}: {value}")
+        concurrency[key] = int(value)
+    return concurrency
+
+def get_consistent_snapshot(config: Dict) -> bool:
+    """Returns whether all readers share one exported source snapshot (sync.consistent_snapshot)."""
+    return bool(config.get("sync", {}).get("consistent_snapshot", True))
+
+def get_table_locking(config: Dict) -> bool:
+    """
+    Returns whether tables are claimed with advisory locks on the target (sync.table_locks), so
+    concurrent processes split them instead of syncing each one several times.
+    """
+    return bool(config.get("sync", {}).get("table_locks", True))
+
+def get_write_mode(config: Dict) -> str:
+    """
+    Returns how rows are written (sync.write_mode): "upsert" (default) merges them by primary
+    key, replacing keyless tables, so repeated syncs are idempotent; "diff" compares key range
+    checksums first and only re-copies the ranges that differ; "append" only inserts.
+    """
+    write_mode = config.get("sync", {}).get("write_mode", "upsert")
+    if write_mode not in ("upsert", "diff", "append"):
+        raise ValueError(f"Unknown write mode: {write_mode}")
+    return write_mode
+
+def get_add_missing_keys(config: Dict) -> bool:
+    """
+    Returns whether target tables lacking a unique key on the source's primary key are reloaded
+    and given one (sync.add_missing_keys). Off by default, as the reload drops rows that only
+    exist on the target and the key changes the user's schema.
+    """
+    return bool(config.get("sync", {}).get("add_missing_keys", False))
+
+def get_diff_settings(config: Dict) -> Dict[str, int]:
+    """
+    Returns the settings of the "diff" write mode (sync.diff): differing key ranges are split
+    into "fanout" sub-ranges until they hold at most "leaf_rows" rows or "max_depth" is reached.
+    """
+    diff = dict(config.get("sync", {}).get("diff", {}))
+    allowed = ("fanout", "leaf_rows", "max_depth")
+    unknown = set(diff) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown diff settings: {sorted(unknown)}")
+    for key, value in diff.items():
+        if int(value) < 1:
+            raise ValueError(f"Invalid diff setting for {key}: {value}")
+        diff[key] = int(value)
+    return diff
+
+def get_copy_format(config: Dict) -> str:
+    """
+    Returns the COPY format (sync.copy_format): "text" (default) or "binary", which skips
+    formatting and parsing values on both servers but needs identical column types.
+    """
+    copy_format = config.get("sync", {}).get("copy_format", "text")
+    if copy_format not in ("text", "binary"):
+        raise ValueError(f"Unknown COPY format: {copy_format}")
+    return copy_format
+
+def get_pipeline_settings(config: Dict) -> Dict[str, int]:
+    """
+    Returns the limits of the batch queue between fetching and writing on the INSERT path
+    (sync.pipeline): "max_rows" (default four batches) and "max_bytes" (default 64 MB).
+    """
+    pipeline = dict(config.get("sync", {}).get("pipeline", {}))
+    unknown = set(pipeline) - {"max_rows", "max_bytes"}
+    if unknown:
+        raise ValueError(f"Unknown pipeline settings: {sorted(unknown)}")
+    for key, value in pipeline.items():
+        if int(value) < 1:
+            raise ValueError(f"Invalid pipeline limit for {key}: {value}")
+        pipeline[key] = int(value)
+    return pipeline
+
+def get_schema_cache_settings(config: Dict) -> Dict:
+    """
+    Returns the schema cache settings (sync.schema_cache): "enabled" (default True) and
+    "directory" for the cache files, relative to the project root (default ".cache/schema";
+    null keeps the cache in memory only).
+    """
+    cache_config = config.get("sync", {}).get("schema_cache", {})
+    unknown = set(cache_config) - {"enabled", "directory"}
+    if unknown:
+        raise ValueError(f"Unknown schema cache settings: {sorted(unknown)}")
+    directory = cache_config.get("directory", os.path.join(".cache", "schema"))
+    if directory:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        directory = os.path.join(project_root, directory)
+    return {"enabled": bool(cache_config.get("enabled", True)), "directory": directory}
+
+def get_change_detection_settings(config: Dict) -> Dict:
+    """
+    Returns the settings for skipping unchanged tables (sync.change_detection): "enabled"
+    (default True) and "verify_every" (default 10), the number of runs after which a table
+    is synced even though its source counters did not move.
+    """
+    detection = config.get("sync", {}).get("change_detection", {})
+    unknown = set(detection) - {"enabled", "verify_every"}
+    if unknown:
+        raise ValueError(f"Unknown change detection settings: {sorted(unknown)}")
+    verify_every = int(detection.get("verify_every", 10))
+    if verify_every < 1:
+        raise ValueError(f"Invalid change detection interval: {verify_every}")
+    return {"enabled": bool(detection.get("enabled", True)), "verify_every": verify_every}
+
+def get_sync_interval(config: Dict) -> Optional[float]:
+    """
+    Returns the seconds between scheduled syncs (sync.sync_interval, overridden by the
+    SYNC_INTERVAL environment variable), e.g. 60, "90s", "5m" or "1h". Returns None when no
+    interval is set or it is 0 or "off", which disables scheduled syncs.
+    """
+    interval = os.getenv("SYNC_INTERVAL") or config.get("sync", {}).get("sync_interval")
+    if interval is None or str(interval).strip().lower() in ("", "0", "off"):
+        return None
+    value = str(interval).strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    except ValueError:
+        raise ValueError(f"Invalid sync interval: {interval}")
+    if seconds < 0:
+        raise ValueError(f"Invalid sync interval: {interval}")
+    return seconds or None
+
+def get_job_settings(config: Dict) -> Dict[str, int]:
+    """
+    Returns the limits of the background sync job queue (sync.jobs): "max_queued" jobs waiting
+    to run (default 10) and the "history" of finished jobs kept for status lookups (default 100).
+    """
+    jobs = config.get("sync", {}).get("jobs", {})
+    unknown = set(jobs) - {"max_queued", "history"}
+    if unknown:
+        raise ValueError(f"Unknown job settings: {sorted(unknown)}")
+    settings = {"max_queued": int(jobs.get("max_queued", 10)), "history": int(jobs.get("history", 100))}
+    for key, value in settings.items():
+        if value < 1:
+            raise ValueError(f"Invalid job setting for {key}: {value}")
+    return settings
+
+def get_distributed_settings(config: Dict) -> Dict:
+    """
+    Returns the settings of distributed runs (sync.distributed). When "enabled", a sync queues
+    the chunks of its tables in a lease table on the target for worker processes
+    (python src/main.py --worker). A lease lasts "lease_seconds" (default 60) and is renewed
+    every "heartbeat_interval" seconds (default 10); workers look for chunks every
+    "poll_interval" seconds (default 1) and a chunk fails after "max_attempts" leases (default 3).
+    A run whose pending chunks no worker claims for "claim_timeout" seconds (default 300) fails.
+    With "local_worker" (default True) the process running the sync copies chunks as well;
+    each worker copies up to "worker_concurrency" chunks at once (default concurrency.tables).
+    """
+    distributed = dict(config.get("sync", {}).get("distributed", {}))
+    allowed = ("enabled", "lease_seconds", "heartbeat_interval", "poll_interval", "max_attempts", "local_worker",
+               "worker_concurrency", "claim_timeout")
+    unknown = set(distributed) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown distributed settings: {sorted(unknown)}")
+    settings = {
+        "enabled": bool(distributed.get("enabled", False)),
+        "local_worker": bool(distributed.get("local_worker", True)),
+        "lease_seconds": float(distributed.get("lease_seconds", 60)),
+        "heartbeat_interval": float(distributed.get("heartbeat_interval", 10)),
+        "poll_interval": float(distributed.get("poll_interval", 1)),
+        "max_attempts": int(distributed.get("max_attempts", 3)),
+        "claim_timeout": float(distributed.get("claim_timeout", 300)),
+        "worker_concurrency": int(distributed.get("worker_concurrency", get_concurrency_settings(config)["tables"])),
+    }
+    for key in ("lease_seconds", "heartbeat_interval", "poll_interval", "max_attempts", "worker_concurrency",
+                "claim_timeout"):
+        if settings[key] <= 0:
+            raise ValueError(f"Invalid distributed setting for {key}: {settings[key]}")
+    if settings["heartbeat_interval"] >= settings["lease_seconds"]:
+        raise ValueError("The heartbeat interval must be shorter than the lease")
+    return settings
+
+def get_process_settings(config: Dict) -> Dict:
+    """
+    Returns the settings of the process pool (sync.processes). When "enabled", chunks are
+    copied in up to "workers" spawned processes (default: the number of CPUs), each with its
+    own connections, so row transforms run on several cores; the table option "processes":
+    false keeps a table in the syncing process. Processes report progress every
+    "report_interval" seconds (default 0.5).
+    """
+    processes = config.get("sync", {}).get("processes", {})
+    unknown = set(processes) - {"enabled", "workers", "report_interval"}
+    if unknown:
+        raise ValueError(f"Unknown process settings: {sorted(unknown)}")
+    settings = {
+        "enabled": bool(processes.get("enabled", False)),
+        "workers": int(processes.get("workers", os.cpu_count() or 1)),
+        "report_interval": float(processes.get("report_interval", 0.5)),
+    }
+    for key in ("workers", "report_interval"):
+        if settings[key] <= 0:
+            raise ValueError(f"Invalid process setting for {key}: {settings[key]}")
+    return settings
+
+def get_transfer_method(config: Dict) -> str:
+    """Returns the configured transfer method: "copy" (default) or the legacy "insert" path."""
+    method = config.get("sync", {}).get("transfer_method", "copy")
+    if method not in ("copy", "insert"):
+        raise ValueError(f"Unknown transfer method: {method}")
+    return method
+
+def get_cdc_settings(config: Dict) -> Dict:
+    """
+    Returns the change data capture settings (sync.cdc). When "enabled", changes are streamed
+    continuously from the logical replication slot "slot_name" through the publication
+    "publication", which is created for the synced tables if missing and "create_publication"
+    is set. Changes are applied in batches of "batch_size" (defaulting to
+    sync.batch_size) and the server is sent a status update every "status_interval" seconds.
+    """
+    cdc = dict(config.get("sync", {}).get("cdc", {}))
+    cdc.setdefault("enabled", False)
+    cdc.setdefault("slot_name", "pg_db_sync")
+    cdc.setdefault("publication", "pg_db_sync")
+    cdc.setdefault("create_publication", True)
+    cdc.setdefault("batch_size", get_batch_size(config))
+    cdc.setdefault("status_interval", 10)
+    cdc.setdefault("retry_interval", 5)
+    for key in ("batch_size", "status_interval", "retry_interval"):
+        if int(cdc[key]) < 1:
+            raise ValueError(f"Invalid CDC setting for {key}: {cdc[key]}")
+        cdc[key] = int(cdc[key])
+    return cdc
@@ -0,0 +1,262 @@
+import datetime
+import decimal
+import struct
+import uuid
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+# Every binary COPY stream starts with this signature, a flags word and a header extension length.
+BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+BINARY_HEADER = BINARY_SIGNATURE + struct.pack("!ii", 0, 0)
+BINARY_TRAILER = b"\xff\xff"
+
+POSTGRES_EPOCH = datetime.datetime(2000, 1, 1)
+POSTGRES_EPOCH_DATE = POSTGRES_EPOCH.date()
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+# Exact scaling of numerics, whatever their number of digits.
+_NUMERIC_CONTEXT = decimal.Context(prec=decimal.MAX_PREC)
+_INT16 = struct.Struct("!h")
+_INT32 = struct.Struct("!i")
+
+class RawValue(bytes):
+    """The undecoded binary representation of a value whose type has no codec; encoded back as is."""
+
+class Codec:
+    def __init__(self, decode: Callable[[bytes], Any], encode: Callable[[Any], bytes]):
+        """
+        Converts values of one type between the binary COPY representation and Python.
+
+        Args:
+            decode (Callable[[bytes], Any]): Turns the field bytes into a Python value.
+            encode (Callable[[Any], bytes]): Turns a Python value back into field bytes.
+        """
+        self.decode = decode
+        self.encode = encode
+
+CODECS: Dict[int, Codec] = {}
+
+def register_codec(type_oid: int, decode: Callable[[bytes], Any], encode: Callable[[Any], bytes]) -> None:
+    """Registers (or replaces) the codec for a type OID, e.g. for an extension type."""
+    CODECS[type_oid] = Codec(decode, encode)
+
+def get_codec(type_oid: Optional[int]) -> Optional[Codec]:
+    """Returns the codec for a type OID, or None when values of the type are kept as RawValue."""
+    return CODECS.get(type_oid)
+
+def _struct_codec(fmt: str) -> Codec:
+    packer = struct.Struct(fmt)
+    return Codec(lambda data: packer.unpack(data)[0], packer.pack)
+
+def _decode_text(data: bytes) -> str:
+    return data.decode()
+
+def _encode_text(value: str) -> bytes:
+    return value.encode()
+
+def _decode_numeric(data: bytes):
+    ndigits, weight, sign, dscale = struct.unpack_from("!hhHh", data)
+    if sign == 0xC000:
+        return Decimal("NaN")
+    if sign in (0xD000, 0xF000):
+        # Infinities exist since PostgreSQL 14.
+        return Decimal("Infinity") if sign == 0xD000 else Decimal("-Infinity")
+    value = 0
+    for digit in struct.unpack_from(f"!{ndigits}h", data, 8):
+        value = value * 10000 + digit
+    # The digits are base 10000, the first one weighted 10000 ** weight; rescale to dscale
+    # decimal places (padding digits beyond it are always zero).
+    exponent = 4 * (weight - ndigits + 1)
+    if exponent + dscale >= 0:
+        value *= 10 ** (exponent + dscale)
+    else:
+        value //= 10 ** -(exponent + dscale)
+    result = Decimal(value).scaleb(-dscale, _NUMERIC_CONTEXT)
+    return result.copy_negate() if sign == 0x4000 else result
+
+def _encode_numeric(value) -> bytes:
+    value = Decimal(value)
+    if value.is_nan():
+        return struct.pack("!hhHh", 0, 0, 0xC000, 0)
+    if value.is_infinite():
+        return struct.pack("!hhHh", 0, 0, 0xF000 if value.is_signed() else 0xD000, 0)
+    sign, _, exponent = value.as_tuple()
+    dscale = max(0, -exponent)
+    integer = int(value.copy_abs().scaleb(-exponent, _NUMERIC_CONTEXT))
+    # Align the exponent to a base 10000 digit boundary.
+    remainder = exponent % 4
+    integer *= 10 ** remainder
+    exponent -= remainder
+    groups = []
+    while integer:
+        integer, group = divmod(integer, 10000)
+        groups.append(group)
+    groups.reverse()
+    weight = len(groups) - 1 + exponent // 4 if groups else 0
+    while groups and groups[-1] == 0:
+        groups.pop()
+    # Zero has no sign in PostgreSQL.
+    sign = sign if groups else 0
+    return struct.pack(f"!hhHh{len(groups)}h", len(groups), weight, 0x4000 if sign else 0, dscale, *groups)
+
+def _decode_timestamp(data: bytes):
+    micros, = struct.unpack("!q", data)
+    if micros in (_INT64_MIN, _INT64_MAX):
+        return RawValue(data)
+    return POSTGRES_EPOCH + datetime.timedelta(microseconds=micros)
+
+def _encode_timestamp(value: datetime.datetime) -> bytes:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = value - POSTGRES_EPOCH
+    return struct.pack("!q", (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+def _decode_timestamptz(data: bytes):
+    value = _decode_timestamp(data)
+    return value if isinstance(value, RawValue) else value.replace(tzinfo=datetime.timezone.utc)
+
+def _decode_date(data: bytes):
+    days, = struct.unpack("!i", data)
+    if days in (-2 ** 31, 2 ** 31 - 1):
+        return RawValue(data)
+    return POSTGRES_EPOCH_DATE + datetime.timedelta(days=days)
+
+def _encode_date(value: datetime.date) -> bytes:
+    return struct.pack("!i", (value - POSTGRES_EPOCH_DATE).days)
+
+def _decode_jsonb(data: bytes) -> str:
+    # A version byte (1) precedes the JSON text.
+    return data[1:].decode()
+
+def _encode_jsonb(value: str) -> bytes:
+    return b"\x01" + value.encode()
+
+register_codec(16, lambda data: data == b"\x01", lambda value: b"\x01" if value else b"\x00")  # bool
+register_codec(17, bytes, bytes)  # bytea
+for _oid, _fmt in ((20, "!q"), (21, "!h"), (23, "!i"), (26, "!I"), (700, "!f"), (701, "!d")):
+    CODECS[_oid] = _struct_codec(_fmt)  # int8, int2, int4, oid, float4, float8
+for _oid in (25, 114, 1042, 1043):
+    register_codec(_oid, _decode_text, _encode_text)  # text, json, bpchar, varchar
+register_codec(1082, _decode_date, _encode_date)
+register_codec(1114, _decode_timestamp, _encode_timestamp)
+register_codec(1184, _decode_timestamptz, _encode_timestamp)
+register_codec(1700, _decode_numeric, _encode_numeric)
+register_codec(2950, lambda data: uuid.UUID(bytes=data), lambda value: value.bytes)
+register_codec(3802, _decode_jsonb, _encode_jsonb)
+
+class BinaryCopyDecoder:
+    def __init__(self, type_oids: List[Optional[int]]):
+        """
+        Incrementally splits a binary COPY stream into rows of Python values.
+
+        The stream can be fed in pieces of any size; fields of types without a codec are
+        returned as RawValue, so they survive a decode/encode round trip unchanged.
+
+        Args:
+            type_oids (List[Optional[int]]): The type OID of every column, in stream order.
+        """
+        self.codecs = [get_codec(oid) for oid in type_oids]
+        self._buffer = bytearray()
+        self._header_read = False
+        self.finished = False
+
+    def feed(self, data: bytes) -> List[List[Any]]:
+        """Adds the next piece of the stream and returns the rows it completed."""
+        self._buffer += data
+        offset = 0
+        if not self._header_read:
+            if len(self._buffer) < len(BINARY_HEADER):
+                return []
+            if not self._buffer.startswith(BINARY_SIGNATURE):
+                raise ValueError("Not a binary COPY stream")
+            extension, = _INT32.unpack_from(self._buffer, len(BINARY_SIGNATURE) + 4)
+            if len(self._buffer) < len(BINARY_HEADER) + extension:
+                return []
+            offset = len(BINARY_HEADER) + extension
+            self._header_read = True
+
+        rows = []
+        while not self.finished and len(self._buffer) - offset >= 2:
+            field_count, = _INT16.unpack_from(self._buffer, offset)
+            if field_count == -1:
+                self.finished = True
+                offset += 2
+                break
+            row, end = self._parse_row(offset + 2, field_count)
+            if row is None:
+                break
+            rows.append(row)
+            offset = end
+        del self._buffer[:offset]
+        return rows
+
+    def _parse_row(self, offset: int, field_count: int):
+        """Decodes one tuple starting at offset, or returns (None, offset) if it is incomplete."""
+        buffer = self._buffer
+        size = len(buffer)
+        fields = []
+        for _ in range(field_count):
+            if size - offset < 4:
+                return None, offset
+            length, = _INT32.unpack_from(buffer, offset)
+            offset += 4
+            if length == -1:
+                fields.append(None)
+                continue
+            if size - offset < length:
+                return None, offset
+            fields.append(bytes(buffer[offset:offset + length]))
+            offset += length
+        # Only decode once the whole tuple is there, so a split tuple is not decoded twice.
+        row = [None if data is None else codec.decode(data) if codec else RawValue(data)
+               for data, codec in zip(fields, self.codecs)]
+        return row, offset
+
+def encode_binary_row(row: List[Any], type_oids: List[Optional[int]]) -> bytes:
+    """Encodes a row of Python values (or RawValue fields) as one binary COPY tuple."""
+    parts = [_INT16.pack(len(row))]
+    for value, oid in zip(row, type_oids):
+        if value is None:
+            parts.append(b"\xff\xff\xff\xff")
+            continue
+        if isinstance(value, RawValue):
+            data = bytes(value)
+        else:
+            codec = get_codec(oid)
+            if codec is None:
+                raise ValueError(f"No binary codec for type OID {oid}")
+            data = codec.encode(value)
+        parts.append(_INT32.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+class BinaryCopyTransformer:
+    def __init__(self, type_oids: List[Optional[int]], transform: Callable[[List[Any]], Optional[List[Any]]]):
+        """
+        Rewrites a binary COPY stream row by row: every row is decoded, passed through transform
+        and re-encoded. Used as the transform of a BytePipe.
+
+        Args:
+            type_oids (List[Optional[int]]): The type OID of every column, in stream order.
+            transform (Callable): Called with each decoded row; returns the row to write, which
+                must have the same column types, or None to drop it.
+        """
+        self.type_oids = type_oids
+        self.transform = transform
+        self._decoder = BinaryCopyDecoder(type_oids)
+        self._header_written = False
+
+    def feed(self, data: bytes) -> bytes:
+        """Consumes the next piece of the input stream and returns the output it completed."""
+        parts = []
+        if not self._header_written:
+            parts.append(BINARY_HEADER)
+            self._header_written = True
+        for row in self._decoder.feed(data):
+            row = self.transform(row)
+            if row is not None:
+                parts.append(encode_binary_row(row, self.type_oids))
+        return b"".join(parts)
+
+    def finish(self) -> bytes:
+        """Returns the end of the output stream, which is only written for a complete input stream."""
+        return BINARY_TRAILER if self._decoder.finished else b""
@@ -1,75 +1,419 @@
-import asyncio
-import psycopg2
-import psycopg2.extras
-from typing import List, Dict, Any, Tuple
+import json
+import time
+import uuid
+from contextlib import aclosing, asynccontextmanager
+from typing import List, Dict, Any, Tuple, AsyncIterator, Optional
+from models.schema import SchemaModel, TableSchema
+from utils.backends import get_backend
+from utils.byte_pipe import BytePipe
 from utils.logger import Logger
+from utils.pool import get_pool
 
 logger = Logger("db_utils")
 
+# Pinned for checksums and split points, which compare the text form of rows across two
+# servers: these settings change how timestamps, intervals and floats are rendered.
+RENDER_SETTINGS = {"TimeZone": "UTC", "DateStyle": "ISO, YMD", "IntervalStyle": "postgres", "extra_float_digits": "3"}
+
+def connection_params(db_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Picks the psycopg2.connect keyword arguments out of a parsed database URL."""
+    return {
+        "dbname": db_config["dbname"],
+        "user": db_config["user"],
+        "password": db_config["password"],
+        "host": db_config["host"],
+        "port": db_config["port"],
+    }
+
+def quote_ident(name: str) -> str:
+    """Quotes an SQL identifier (table or column name) for safe interpolation."""
+    return '"' + name.replace('"', '""') + '"'
+
+def primary_key_columns(columns: List[Dict]) -> List[str]:
+    """Returns the names of the primary key columns, in key order, from get_table_columns output."""
+    key_columns = sorted((col for col in columns if col.get('primary_key')), key=lambda col: col['primary_key'])
+    return [col['name'] for col in key_columns]
+
+def on_conflict_clause(columns: List[str], key_columns: List[str]) -> str:
+    """Builds an ON CONFLICT clause that overwrites every non-key column of an existing row."""
+    conflict_target = ", ".join(quote_ident(col) for col in key_columns)
+    updates = [f"{quote_ident(col)} = EXCLUDED.{quote_ident(col)}" for col in columns if col not in key_columns]
+    if not updates:
+        return f"ON CONFLICT ({conflict_target}) DO NOTHING"
+    return f"ON CONFLICT ({conflict_target}) DO UPDATE SET {', '.join(updates)}"
+
 class DatabaseUtility:
-    def __init__(self, db_config: Dict[str, Any]):
+    def __init__(self, db_config: Dict[str, Any], pool_settings: Dict[str, Any] = None, backend: str = "psycopg2"):
         """
         Initializes the DatabaseUtility with database connection details.
 
         Args:
             db_config (Dict[str, Any]): A dictionary containing database connection parameters.
+            pool_settings (Dict[str, Any], optional): ConnectionPool settings (min_size, max_size,
+                max_lifetime, health_check_interval). Defaults to the pool defaults.
+            backend (str, optional): The driver, "psycopg2" (blocking, run in worker threads) or
+                "asyncpg" (native asyncio). Defaults to "psycopg2".
         """
         self.db_config = db_config
-        self.connection = None
+        self.pool_settings = pool_settings or {}
+        self.backend = get_backend(backend)
+        self.pool = None
 
     async def connect(self) -> None:
-        """Establishes a connection to the database."""
+        """Attaches to the process-wide connection pool for the database, creating it if needed."""
         try:
-            connection_params = {
-                "dbname": self.db_config["dbname"],
-                "user": self.db_config["user"],
-                "password": self.db_config["password"],
-                "host": self.db_config["host"],
-                "port": self.db_config["port"],
-            }
-            self.connection = await asyncio.to_thread(psycopg2.connect, **connection_params)
-            logger.info(f"Connected to database: {self.db_config['dbname']} on {self.db_config['host']}")
-            logger.debug(f"Connection: {self.connection}")
+            self.pool = await get_pool(connection_params(self.db_config), self.backend.name, **self.pool_settings)
+            logger.info(f"Connected to database: {self.db_config['dbname']} on {self.db_config['host']} "
+                        f"({self.backend.name})")
+            logger.debug(f"Connection pool: {self.pool.stats()}")
 
         except Exception as e:
             logger.error(f"Error connecting to database: {e}")
             raise
 
     async def disconnect(self) -> None:
-        """Closes the database connection."""
-        if self.connection:
-            await asyncio.to_thread(self.connection.close)
-            logger.info("Database connection closed.")
+        """Detaches from the connection pool. The pool itself stays open for later sync runs."""
+        if self.pool:
+            logger.debug(f"Connection pool: {self.pool.stats()}")
+            self.pool = None
+            logger.info("Database connection released.")
+
+    def connection(self):
+        """
+        Checks a connection out of the pool for the duration of an async with block.
 
-    async def execute_query(self, query: str, params: Tuple = None) -> List[Dict]:
+        Methods accepting a conn argument run on that connection instead of checking out
+        their own, which lets callers group several calls into one transaction.
+        """
+        if not self.pool:
+            raise Exception("Database connection is not established.")
+        return self.pool.connection()
+
+    async def _run(self, func, *args, conn=None):
+        """
+        Runs a coroutine function taking a connection as its first argument, e.g. a backend method.
+
+        Args:
+            func: The function to run, called as func(conn, *args).
+            conn (optional): The connection to use. Defaults to one checked out of the pool.
+        """
+        if conn is not None:
+            return await func(conn, *args)
+        async with self.connection() as conn:
+            return await func(conn, *args)
+
+    async def get_server_version(self) -> int:
+        """Returns the server version as an integer, e.g. 140005 for 14.5."""
+        return await self._run(self.backend.server_version)
+
+    async def execute_query(self, query: str, params: Tuple = None, conn=None) -> List[Dict]:
         """
         Executes a SQL query and returns the results.
 
         Args:
             query (str): The SQL query to execute.
             params (Tuple, optional): Parameters to pass to the query. Defaults to None.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool.
 
         Returns:
             List[Dict]: A list of dictionaries representing the query results.
         """
-        if not self.connection:
-            raise Exception("Database connection is not established.")
+        async def _execute(conn):
+            try:
+                if query.lstrip().lower().startswith("select"):
+                    return await self.backend.fetch(conn, query, params)
+                else:
+                    await self.backend.execute(conn, query, params)
+                    await self.backend.commit(conn)
+                    return []
+            except Exception as e:
+                logger.error(f"Error executing query: {query} with params: {params}. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+
+        return await self._run(_execute, conn=conn)
+
+    async def execute_returning(self, query: str, params: Tuple = None, commit: bool = True, conn=None) -> List:
+        """
+        Runs a data-modifying statement with a RETURNING clause and returns the rows it returned.
+
+        Args:
+            query (str): The statement to run.
+            params (Tuple, optional): Parameters to pass to the statement. Defaults to None.
+            commit (bool, optional): Whether to commit right away. Defaults to True; pass False to
+                leave the transaction of conn open.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool.
+
+        Returns:
+            List: The returned rows.
+        """
+        async def _execute(conn):
+            try:
+                rows = await self.backend.fetch(conn, query, params)
+                if commit:
+                    await self.backend.commit(conn)
+                return rows
+            except Exception as e:
+                logger.error(f"Error executing query: {query} with params: {params}. Error: {e}")
+                if commit:
+                    await self.backend.rollback(conn)
+                raise
+
+        return await self._run(_execute, conn=conn)
+
+    async def commit(self, conn) -> None:
+        """Commits the current transaction on a checked out connection."""
+        await self.backend.commit(conn)
+
+    async def rollback(self, conn) -> None:
+        """Rolls back the current transaction on a checked out connection."""
+        await self.backend.rollback(conn)
+
+    @asynccontextmanager
+    async def exported_snapshot(self):
+        """
+        Opens a REPEATABLE READ transaction and yields its pg_export_snapshot() id.
+
+        The transaction, and with it a pooled connection, stays open until the async with
+        block exits, so other connections can import the snapshot for that long.
+        """
+        async with self.connection() as conn:
+            snapshot = await self.backend.export_snapshot(conn)
+            logger.debug(f"Exported snapshot {snapshot}")
+            try:
+                yield snapshot
+            finally:
+                await self.backend.rollback(conn)
+
+    async def try_advisory_lock(self, key: Tuple[int, int], conn) -> bool:
+        """
+        Takes a session-level advisory lock without waiting, on a checked out connection.
+
+        The lock is held by the connection's session until advisory_unlock() or
+        advisory_unlock_all() is called or the connection closes, across commits, so the connection must not go back to the pool
+        while it holds locks.
+
+        Args:
+            key (Tuple[int, int]): The two 32-bit integers identifying the lock.
+            conn: The connection to hold the lock on.
+
+        Returns:
+            bool: Whether the lock was taken; False if another session holds it.
+        """
+        try:
+            rows = await self.backend.fetch(conn, "SELECT pg_try_advisory_lock(%s, %s)", key)
+            await self.backend.commit(conn)
+        except Exception:
+            # Leaves the shared connection usable for the next claim instead of in an aborted transaction.
+            await self.backend.rollback(conn)
+            raise
+        return bool(rows[0][0])
+
+    async def advisory_unlock(self, key: Tuple[int, int], conn) -> None:
+        """Releases a session-level advisory lock taken with try_advisory_lock() on a checked out connection."""
+        try:
+            await self.backend.fetch(conn, "SELECT pg_advisory_unlock(%s, %s)", key)
+            await self.backend.commit(conn)
+        except Exception:
+            await self.backend.rollback(conn)
+            raise
+
+    async def advisory_unlock_all(self, conn) -> None:
+        """Releases every session-level advisory lock held by a checked out connection."""
+        try:
+            await self.backend.fetch(conn, "SELECT pg_advisory_unlock_all()")
+            await self.backend.commit(conn)
+        except Exception:
+            await self.backend.rollback(conn)
+            raise
+
+    async def copy_out(self, query: str, pipe: BytePipe, params: Tuple = None, snapshot: str = None, conn=None,
+                       copy_format: str = "text") -> int:
+        """
+        Streams the result of a query into a BytePipe using COPY ... TO STDOUT, and finishes
+        the pipe once the stream is complete.
 
-        def _execute(conn, query, params):
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                try:
-                    cursor.execute(query, params)
-                    if query.lower().startswith("select"):
-                        return cursor.fetchall()
-                    else:
-                        conn.commit()
-                        return []
-                except Exception as e:
-                    logger.error(f"Error executing query: {query} with params: {params}. Error: {e}")
-                    conn.rollback()
-                    raise
-
-        return await asyncio.to_thread(_execute, self.connection, query, params)
+        Args:
+            query (str): The SELECT query whose result should be copied out.
+            pipe (BytePipe): The pipe receiving the COPY stream.
+            params (Tuple, optional): Parameters bound into the query. Defaults to None.
+            snapshot (str, optional): An exported snapshot id to read from. Defaults to None.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool.
+            copy_format (str, optional): The COPY format, "text" or "binary". Defaults to "text".
+
+        Returns:
+            int: The number of rows copied.
+        """
+        async def _copy_out(conn):
+            try:
+                rows = await self.backend.copy_out(conn, query, params, pipe, snapshot, copy_format)
+                await self.backend.commit(conn)
+                return rows
+            except Exception as e:
+                logger.error(f"Error copying out query: {query}. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+
+        return await self._run(_copy_out, conn=conn)
+
+    async def copy_in(self, table_name: str, columns: List[str], pipe: BytePipe, commit: bool = True, conn=None,
+                      copy_format: str = "text") -> int:
+        """
+        Loads rows from a BytePipe into a table using COPY ... FROM STDIN.
+
+        A binary stream has to match the column types of the table exactly; the text format
+        also accepts values of compatible types.
+
+        Args:
+            table_name (str): The name of the table to load into.
+            columns (List[str]): The column names, in the order they appear in the stream.
+            pipe (BytePipe): The pipe producing the COPY stream.
+            commit (bool, optional): Whether to commit once the stream is exhausted. Defaults to True.
+                Callers that need to decide on the outcome themselves pass False together with
+                a checked out conn and call commit() or rollback() afterwards.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool.
+            copy_format (str, optional): The COPY format, "text" or "binary". Defaults to "text".
+
+        Returns:
+            int: The number of rows copied.
+        """
+        async def _copy_in(conn):
+            try:
+                rows = await self.backend.copy_in(conn, table_name, columns, pipe, copy_format)
+                if commit:
+                    await self.backend.commit(conn)
+                return rows
+            except Exception as e:
+                logger.error(f"Error copying into table '{table_name}'. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+
+        return await self._run(_copy_in, conn=conn)
+
+    async def create_staging_table(self, table_name: str, conn) -> str:
+        """
+        Creates a temporary table with the columns of table_name, dropped when the transaction
+        on conn commits or rolls back.
+
+        Args:
+            table_name (str): The table to copy the column definitions from.
+            conn: A checked out connection; the staging table only exists in its session.
+
+        Returns:
+            str: The name of the staging table.
+        """
+        staging_table = f"pg_db_sync_stage_{uuid.uuid4().hex[:16]}"
+
+        await self.backend.execute(conn, f"CREATE TEMP TABLE {quote_ident(staging_table)} "
+                                         f"(LIKE {quote_ident(table_name)}) ON COMMIT DROP")
+        return staging_table
+
+    async def merge_staging_table(self, staging_table: str, table_name: str, columns: List[str],
+                                  key_columns: List[str], conn) -> int:
+        """
+        Applies a staging table to its target in one set-based statement: rows with a known
+        key are updated, the others inserted. Uses MERGE on PostgreSQL 15+ and
+        INSERT ... ON CONFLICT DO UPDATE (which needs a unique key on the target) before that.
+
+        Args:
+            staging_table (str): The staging table created by create_staging_table.
+            table_name (str): The table to apply the rows to.
+            columns (List[str]): The columns to write.
+            key_columns (List[str]): The columns identifying a row.
+            conn: The connection holding the staging table; the caller commits.
+
+        Returns:
+            int: The number of rows inserted or updated.
+        """
+        column_list = ", ".join(quote_ident(col) for col in columns)
+
+        if await self.backend.server_version(conn) >= 150000:
+            join = " AND ".join(f"t.{quote_ident(col)} = s.{quote_ident(col)}" for col in key_columns)
+            updates = ", ".join(f"{quote_ident(col)} = s.{quote_ident(col)}" for col in columns if col not in key_columns)
+            values = ", ".join(f"s.{quote_ident(col)}" for col in columns)
+            query = f"MERGE INTO {quote_ident(table_name)} t USING {quote_ident(staging_table)} s ON {join}"
+            if updates:
+                query += f" WHEN MATCHED THEN UPDATE SET {updates}"
+            query += f" WHEN NOT MATCHED THEN INSERT ({column_list}) VALUES ({values})"
+        else:
+            query = (f"INSERT INTO {quote_ident(table_name)} ({column_list}) "
+                     f"SELECT {column_list} FROM {quote_ident(staging_table)} "
+                     f"{on_conflict_clause(columns, key_columns)}")
+        return await self.backend.execute(conn, query)
+
+    async def has_unique_key(self, table_name: str, key_columns: List[str]) -> bool:
+        """
+        Checks whether a table has a unique index on exactly key_columns (in any order), which
+        INSERT ... ON CONFLICT needs to match rows. Tables created before primary keys were
+        copied along have none.
+
+        Both sides are sorted by code point (COLLATE "C", like Python's sorted()); the
+        database collation could order mixed-case names or underscores differently.
+        """
+        rows = await self.execute_query("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_catalog.pg_index i
+                WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indpred IS NULL AND i.indexprs IS NULL
+                  AND (SELECT array_agg(a.attname::text ORDER BY a.attname::text COLLATE "C") FROM pg_catalog.pg_attribute a
+                       WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)) = %s::text[]
+            )
+        """, (quote_ident(table_name), sorted(key_columns)))
+        return bool(rows[0][0])
+
+    async def create_load_table(self, table_name: str) -> str:
+        """
+        Creates an empty unlogged table with the columns of table_name, to load a replacement
+        of its rows into. Unlike a staging table it is visible to every connection, so it can
+        be loaded in parallel chunks; drop it with drop_table.
+
+        Returns:
+            str: The name of the load table.
+        """
+        load_table = f"pg_db_sync_load_{uuid.uuid4().hex[:16]}"
+        await self.execute_query(f"CREATE UNLOGGED TABLE {quote_ident(load_table)} (LIKE {quote_ident(table_name)})")
+        return load_table
+
+    async def replace_table_rows(self, table_name: str, load_table: str, columns: List[str],
+                                 key_columns: List[str] = None) -> int:
+        """
+        Replaces every row of a table with the rows of a load table in one transaction, so the
+        table is never seen empty or partly loaded, and optionally adds the unique key it lacks.
+
+        Args:
+            table_name (str): The table to replace the rows of.
+            load_table (str): The table created by create_load_table holding the new rows.
+            columns (List[str]): The columns to copy.
+            key_columns (List[str], optional): Columns to add a unique key on. Defaults to None.
+
+        Returns:
+            int: The number of rows now in the table.
+        """
+        column_list = ", ".join(quote_ident(col) for col in columns)
+        async with self.connection() as conn:
+            try:
+                await self.backend.execute(conn, f"TRUNCATE TABLE {quote_ident(table_name)}")
+                rows = await self.backend.execute(conn, f"INSERT INTO {quote_ident(table_name)} ({column_list}) "
+                                                        f"SELECT {column_list} FROM {quote_ident(load_table)}")
+                if key_columns:
+                    # UNIQUE rather than PRIMARY KEY, which fails if the table has a primary key on other columns.
+                    await self.backend.execute(conn, f"ALTER TABLE {quote_ident(table_name)} ADD UNIQUE "
+                                                     f"({', '.join(quote_ident(col) for col in key_columns)})")
+                await self.backend.commit(conn)
+            except Exception as e:
+                logger.error(f"Error replacing the rows of table '{table_name}'. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+        logger.info(f"Replaced the rows of table '{table_name}' with {rows} loaded rows")
+        return rows
+
+    async def drop_table(self, table_name: str) -> None:
+        """Drops a table if it exists."""
+        await self.execute_query(f"DROP TABLE IF EXISTS {quote_ident(table_name)}")
+
+    async def truncate_table(self, table_name: str) -> None:
+        """Removes every row from a table."""
+        await self.execute_query(f"TRUNCATE TABLE {quote_ident(table_name)};")
+        logger.info(f"Table '{table_name}' truncated.")
 
     async def fetch_all_tables(self, schema: str = "public") -> List[str]:
         """
@@ -86,12 +430,8 @@ class DatabaseUtility:
             # Start with the raw connection query that was successful
             logger.debug(f"Using raw connection to query tables in schema '{schema}'")
             
-            def _raw_execute(conn, schema):
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", (schema,))
-                    return [row[0] for row in cursor.fetchall()]
-            
-            tables = await asyncio.to_thread(_raw_execute, self.connection, schema)
+            rows = await self._run(self.backend.fetch, "SELECT tablename FROM pg_tables WHERE schemaname = %s", (schema,))
+            tables = [row[0] for row in rows]
             logger.debug(f"Raw connection query found tables: {tables}")
             
             if tables:
@@ -150,18 +490,367 @@ class DatabaseUtility:
                 logger.error(f"Emergency query also failed: {inner_e}")
             return []
 
-    async def fetch_table_data(self, table_name: str) -> List[Dict]:
+    async def get_table_sizes(self, schema: str = "public") -> Dict[str, Dict[str, int]]:
         """
-        Fetches all data from a specified table.
+        Fetches the estimated row count and on-disk size of every table in a schema with one
+        catalog query.
 
         Args:
-            table_name (str): The name of the table to fetch data from.
+            schema (str, optional): The schema to search in. Defaults to "public".
+
+        Returns:
+            Dict[str, Dict[str, int]]: Per table name, 'rows' (from pg_class.reltuples, 0 when the
+                table was never analyzed), 'bytes' (pg_total_relation_size, including indexes
+                and TOAST) and 'pages' (pg_class.relpages, the heap size in blocks).
+        """
+        rows = await self._run(self.backend.fetch, """
+            SELECT
+                c.relname,
+                GREATEST(c.reltuples, 0)::bigint AS row_estimate,
+                pg_catalog.pg_total_relation_size(c.oid) AS total_bytes,
+                c.relpages
+            FROM
+                pg_catalog.pg_class c
+            JOIN
+                pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+            WHERE
+                n.nspname = %s
+                AND c.relkind IN ('r', 'p')
+        """, (schema,))
+        sizes = {row[0]: {"rows": row[1], "bytes": row[2], "pages": row[3]} for row in rows}
+        logger.debug(f"Fetched size statistics for {len(sizes)} tables in schema '{schema}'")
+        return sizes
+
+    async def introspect_schema(self, schema: str = "public", tables: List[str] = None) -> SchemaModel:
+        """
+        Loads the columns, primary keys, foreign keys, indexes and size statistics of every
+        table in a schema with a single catalog query.
+
+        Each kind of object is aggregated per table in one pass over its catalog, so the cost
+        stays flat however many tables there are, where get_table_columns needs a round trip
+        per table.
+
+        Args:
+            schema (str, optional): The schema to load. Defaults to "public".
+            tables (List[str], optional): The tables to load. Defaults to every table of the schema.
+
+        Returns:
+            SchemaModel: The tables found; requested tables that do not exist are left out.
+        """
+        params = (schema,)
+        table_filter = ""
+        if tables is not None:
+            table_filter = "AND c.relname = ANY(%s::text[])"
+            params += (list(tables),)
+        start = time.monotonic()
+        rows = await self._run(self.backend.fetch, f"""
+            WITH tables AS (
+                SELECT c.oid, c.relname, GREATEST(c.reltuples, 0)::bigint AS row_estimate,
+                       pg_catalog.pg_total_relation_size(c.oid) AS total_bytes, c.relpages
+                FROM pg_catalog.pg_class c
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind IN ('r', 'p') {table_filter}
+            ),
+            columns AS (
+                SELECT a.attrelid, json_agg(json_build_object(
+                           'name', a.attname,
+                           'type', pg_catalog.format_type(a.atttypid, a.atttypmod),
+                           'type_oid', a.atttypid::bigint,
+                           'not_null', a.attnotnull,
+                           'primary_key', (SELECT k.position FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+                                           WHERE k.attnum = a.attnum)
+                       ) ORDER BY a.attnum) AS columns
+                FROM pg_catalog.pg_attribute a
+                JOIN tables t ON t.oid = a.attrelid
+                LEFT JOIN pg_catalog.pg_index i ON i.indrelid = a.attrelid AND i.indisprimary
+                WHERE a.attnum > 0 AND NOT a.attisdropped
+                GROUP BY a.attrelid
+            ),
+            foreign_keys AS (
+                SELECT con.conrelid, json_agg(json_build_object(
+                           'name', con.conname,
+                           'columns', (SELECT json_agg(a.attname ORDER BY k.position)
+                                       FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, position)
+                                       JOIN pg_catalog.pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum),
+                           'referenced_schema', rn.nspname,
+                           'referenced_table', rc.relname,
+                           'referenced_columns', (SELECT json_agg(a.attname ORDER BY k.position)
+                                                  FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, position)
+                                                  JOIN pg_catalog.pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum)
+                       ) ORDER BY con.conname) AS foreign_keys
+                FROM pg_catalog.pg_constraint con
+                JOIN tables t ON t.oid = con.conrelid
+                JOIN pg_catalog.pg_class rc ON rc.oid = con.confrelid
+                JOIN pg_catalog.pg_namespace rn ON rn.oid = rc.relnamespace
+                WHERE con.contype = 'f'
+                GROUP BY con.conrelid
+            ),
+            indexes AS (
+                SELECT i.indrelid, json_agg(json_build_object(
+                           'name', ic.relname,
+                           'columns', (SELECT json_agg(a.attname ORDER BY k.position)
+                                       FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+                                       JOIN pg_catalog.pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum),
+                           'unique', i.indisunique,
+                           'primary', i.indisprimary,
+                           'definition', pg_catalog.pg_get_indexdef(i.indexrelid)
+                       ) ORDER BY ic.relname) AS indexes
+                FROM pg_catalog.pg_index i
+                JOIN tables t ON t.oid = i.indrelid
+                JOIN pg_catalog.pg_class ic ON ic.oid = i.indexrelid
+                GROUP BY i.indrelid
+            )
+            SELECT t.relname, t.row_estimate, t.total_bytes, t.relpages,
+                   c.columns::text, f.foreign_keys::text, x.indexes::text
+            FROM tables t
+            LEFT JOIN columns c ON c.attrelid = t.oid
+            LEFT JOIN foreign_keys f ON f.conrelid = t.oid
+            LEFT JOIN indexes x ON x.indrelid = t.oid
+            ORDER BY t.relname
+        """, params)
+        # The aggregates are sent as text so both backends hand them over alike.
+        model = SchemaModel(schema, [
+            TableSchema(row[0], json.loads(row[4] or "[]"), json.loads(row[5] or "[]"), json.loads(row[6] or "[]"),
+                        row[1], row[2], row[3])
+            for row in rows
+        ])
+        logger.info(f"Introspected {len(model)} tables in schema '{schema}' in {time.monotonic() - start:.2f}s")
+        return model
+
+    async def get_catalog_fingerprint(self, schema: str = "public") -> str:
+        """
+        Returns a fingerprint of the table definitions in a schema, which changes with any DDL
+        on them (tables, columns, constraints, indexes) but not with data changes, VACUUM or
+        ANALYZE.
+
+        Every catalog row carries the id of the transaction that last wrote it (xmin); DDL
+        rewrites the rows it touches, while statistics are updated in place. The count and
+        the sum of the xmins per catalog therefore change exactly when the definitions do.
+
+        Args:
+            schema (str, optional): The schema to fingerprint. Defaults to "public".
+
+        Returns:
+            str: An opaque fingerprint; equal fingerprints mean unchanged definitions.
+        """
+        rows = await self._run(self.backend.fetch, """
+            SELECT md5(concat_ws('|',
+                (SELECT count(*) || ':' || coalesce(sum(c.xmin::text::bigint), 0)
+                 FROM pg_catalog.pg_class c WHERE c.relnamespace = n.oid),
+                (SELECT count(*) || ':' || coalesce(sum(a.xmin::text::bigint), 0)
+                 FROM pg_catalog.pg_attribute a JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+                 WHERE c.relnamespace = n.oid),
+                (SELECT count(*) || ':' || coalesce(sum(con.xmin::text::bigint), 0)
+                 FROM pg_catalog.pg_constraint con WHERE con.connamespace = n.oid),
+                (SELECT count(*) || ':' || coalesce(sum(i.xmin::text::bigint), 0)
+                 FROM pg_catalog.pg_index i JOIN pg_catalog.pg_class c ON c.oid = i.indrelid
+                 WHERE c.relnamespace = n.oid)))
+            FROM pg_catalog.pg_namespace n
+            WHERE n.nspname = %s
+        """, (schema,))
+        return rows[0][0] if rows else ""
+
+    async def get_modification_counters(self, schema: str = "public") -> Dict[str, str]:
+        """
+        Fetches a signature of the writes each table received, from pg_stat_user_tables.
+
+        The signature combines the cumulative insert, update and delete counters with the
+        table's relfilenode, which TRUNCATE changes without counting any rows. It moves with
+        every committed write (once the writing backend has flushed its statistics), so an
+        unchanged signature means an unchanged table. Partitioned parents have no counters of
+        their own and are left out.
+
+        Args:
+            schema (str, optional): The schema to read. Defaults to "public".
+
+        Returns:
+            Dict[str, str]: The signature per table name; empty on a standby, where changes
+                replayed from the primary are not counted, or when track_counts is off.
+        """
+        rows = await self._run(self.backend.fetch, "SELECT pg_is_in_recovery(), current_setting('track_counts')::boolean")
+        if rows[0][0] or not rows[0][1]:
+            logger.warning("Table modification counters are not maintained on this server (standby or track_counts off)")
+            return {}
+        rows = await self._run(self.backend.fetch, """
+            SELECT s.relname, concat_ws(':', s.n_tup_ins, s.n_tup_upd, s.n_tup_del, c.relfilenode)
+            FROM pg_catalog.pg_stat_user_tables s
+            JOIN pg_catalog.pg_class c ON c.oid = s.relid
+            WHERE s.schemaname = %s
+        """, (schema,))
+        return {row[0]: row[1] for row in rows}
+
+    async def get_histogram_bounds(self, table_name: str, column: str, schema: str = "public") -> List[str]:
+        """
+        Fetches the histogram bounds ANALYZE collected for a column, as text. The bounds are
+        rendered with RENDER_SETTINGS, as they are used as split points on both servers.
+
+        Args:
+            table_name (str): The name of the table.
+            column (str): The name of the column.
+            schema (str, optional): The schema of the table. Defaults to "public".
+
+        Returns:
+            List[str]: The sorted bucket bounds, or an empty list when there are no statistics.
+        """
+        rows = await self._run(self.backend.fetch, """
+            SELECT histogram_bounds::text::text[]
+            FROM pg_catalog.pg_stats
+            WHERE schemaname = %s AND tablename = %s AND attname = %s
+        """, (schema, table_name, column), None, RENDER_SETTINGS)
+        return list(rows[0][0]) if rows and rows[0][0] else []
+
+    async def get_column_range(self, table_name: str, column: str) -> Tuple[Any, Any]:
+        """
+        Fetches the minimum and maximum value of a column, e.g. an indexed primary key.
+
+        Args:
+            table_name (str): The name of the table.
+            column (str): The name of the column.
+
+        Returns:
+            Tuple[Any, Any]: The (min, max) pair; both are None for an empty table.
+        """
+        rows = await self._run(self.backend.fetch, f"SELECT min({quote_ident(column)}), max({quote_ident(column)}) "
+                                                   f"FROM {quote_ident(table_name)}")
+        return tuple(rows[0])
+
+    async def get_max_value(self, table_name: str, column: str, snapshot: str = None) -> Optional[str]:
+        """
+        Fetches the maximum value of a column as text, e.g. the current high-water mark of an
+        updated_at or bigserial column.
+
+        Args:
+            table_name (str): The name of the table.
+            column (str): The name of the column.
+            snapshot (str, optional): An exported snapshot id to read from. Defaults to None.
+
+        Returns:
+            Optional[str]: The maximum value, or None for an empty table.
+        """
+        rows = await self._run(self.backend.fetch, f"SELECT max({quote_ident(column)})::text FROM {quote_ident(table_name)}",
+                               None, snapshot)
+        return rows[0][0]
+
+    async def get_range_checksum(self, table_name: str, columns: List[str], where: str = None, params: Tuple = None,
+                                 snapshot: str = None) -> Tuple[int, Optional[str]]:
+        """
+        Fetches the row count and a checksum of the rows of a table, or of a range of it.
+
+        The checksum sums the leading 64 bits of the md5 of every row's text form, so it does
+        not depend on the physical row order and needs no sort; equal ranges on two servers
+        yield equal checksums as long as both render the values alike. The settings that affect
+        rendering are pinned for the query (RENDER_SETTINGS), so only differences in the server
+        versions or their types' output functions remain.
+
+        Args:
+            table_name (str): The name of the table.
+            columns (List[str]): The columns to include, in a fixed order.
+            where (str, optional): A condition restricting the rows, e.g. a key range. Defaults to None.
+            params (Tuple, optional): Parameters for the condition. Defaults to None.
+            snapshot (str, optional): An exported snapshot id to read from. Defaults to None.
 
         Returns:
-            List[Dict]: A list of dictionaries representing the table data.
+            Tuple[int, Optional[str]]: The row count and the checksum (None for no rows).
+        """
+        row = ", ".join(quote_ident(col) for col in columns)
+        query = (f"SELECT count(*), sum(('x' || left(md5(ROW({row})::text), 16))::bit(64)::bigint)::text "
+                 f"FROM {quote_ident(table_name)}")
+        if where:
+            query += f" WHERE {where}"
+
+        rows = await self._run(self.backend.fetch, query, params, snapshot, RENDER_SETTINGS)
+        return tuple(rows[0])
+
+    async def get_key_quantiles(self, table_name: str, column: str, count: int, where: str = None,
+                                params: Tuple = None, snapshot: str = None) -> List[str]:
         """
-        query = f"SELECT * FROM {table_name};"
-        return await self.execute_query(query)
+        Fetches the values splitting a column into count equally populated ranges, as text.
+
+        Unlike get_histogram_bounds this reads the rows, so it is exact and can be restricted
+        to a range, but it costs a scan of that range.
+
+        Args:
+            table_name (str): The name of the table.
+            column (str): The name of the column, usually the leading primary key column.
+            count (int): The number of ranges.
+            where (str, optional): A condition restricting the rows. Defaults to None.
+            params (Tuple, optional): Parameters for the condition. Defaults to None.
+            snapshot (str, optional): An exported snapshot id to read from. Defaults to None.
+
+        Returns:
+            List[str]: The count - 1 ascending split points, without duplicates.
+        """
+        fractions = [i / count for i in range(1, count)]
+        query = (f"SELECT percentile_disc(%s::float8[]) WITHIN GROUP (ORDER BY {quote_ident(column)})::text[] "
+                 f"FROM {quote_ident(table_name)}")
+        if where:
+            query += f" WHERE {where}"
+
+        rows = await self._run(self.backend.fetch, query, (fractions,) + tuple(params or ()), snapshot, RENDER_SETTINGS)
+        return list(dict.fromkeys(rows[0][0] or []))
+
+    async def delete_rows(self, table_name: str, where: str = None, params: Tuple = None,
+                          commit: bool = True, conn=None) -> int:
+        """
+        Deletes the rows of a table matching a condition, e.g. a key range about to be reloaded.
+
+        Args:
+            table_name (str): The name of the table.
+            where (str, optional): A condition restricting the rows. Defaults to every row.
+            params (Tuple, optional): Parameters for the condition. Defaults to None.
+            commit (bool, optional): Whether to commit right away. Defaults to True.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool.
+
+        Returns:
+            int: The number of rows deleted.
+        """
+        query = f"DELETE FROM {quote_ident(table_name)}"
+        if where:
+            query += f" WHERE {where}"
+
+        async def _delete(conn):
+            try:
+                deleted = await self.backend.execute(conn, query, params)
+                if commit:
+                    await self.backend.commit(conn)
+                return deleted
+            except Exception as e:
+                logger.error(f"Error deleting from table '{table_name}'. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+
+        return await self._run(_delete, conn=conn)
+
+    async def stream_table_data(self, table_name: str, batch_size: int = 1000, columns: List[str] = None,
+                                where: str = None, params: Tuple = None, snapshot: str = None) -> AsyncIterator[List[Dict]]:
+        """
+        Streams the rows of a table in batches through a server-side cursor.
+
+        Only one batch is held in memory at a time, regardless of the table size. The
+        connection is occupied by the cursor until the generator is exhausted or closed.
+
+        Args:
+            table_name (str): The name of the table to fetch data from.
+            batch_size (int, optional): The number of rows fetched per round trip. Defaults to 1000.
+            columns (List[str], optional): The columns to select. Defaults to all columns.
+            where (str, optional): A condition restricting the rows, e.g. a chunk range. Defaults to None.
+            params (Tuple, optional): Parameters for the condition. Defaults to None.
+            snapshot (str, optional): An exported snapshot id to read from. Defaults to None.
+
+        Yields:
+            List[Dict]: The next batch of rows.
+        """
+        select_list = ", ".join(quote_ident(col) for col in columns) if columns else "*"
+        query = f"SELECT {select_list} FROM {quote_ident(table_name)}"
+        if where:
+            query += f" WHERE {where}"
+        async with self.connection() as conn:
+            async with aclosing(self.backend.stream(conn, query, params, batch_size, snapshot)) as batches:
+                total = 0
+                async for rows in batches:
+                    total += len(rows)
+                    logger.debug(f"Fetched {total} rows from table '{table_name}' so far...")
+                    yield rows
 
     async def create_table(self, table_name: str, columns: List[Dict[str, str]]) -> None:
         """
@@ -170,75 +859,78 @@ class DatabaseUtility:
         Args:
             table_name (str): The name of the table to create.
             columns (List[Dict[str, str]]): A list of column definitions, each a dictionary with 'name' and 'type'.
+                Columns with a 'primary_key' position make up the table's primary key.
         """
-        column_definitions = ", ".join([f"{col['name']} {col['type']}" for col in columns])
-        query = f"CREATE TABLE IF NOT EXISTS {table_name} ({column_definitions});"
+        column_definitions = [f"{quote_ident(col['name'])} {col['type']}" for col in columns]
+        key_columns = primary_key_columns(columns)
+        if key_columns:
+            column_definitions.append(f"PRIMARY KEY ({', '.join(quote_ident(col) for col in key_columns)})")
+        query = f"CREATE TABLE IF NOT EXISTS {quote_ident(table_name)} ({', '.join(column_definitions)});"
         await self.execute_query(query)
         logger.info(f"Table '{table_name}' created successfully.")
 
-    async def insert_data(self, table_name: str, data: List[Dict]) -> None:
+    async def insert_data(self, table_name: str, data: List[Dict], batch_size: int = 1000,
+                          conflict_columns: List[str] = None, commit: bool = True, conn=None) -> int:
         """
-        Inserts data into a specified table.
+        Inserts data into a specified table in multi-row batches.
+
+        Each batch is written as a single multi-row INSERT and committed on its own, and
+        the throughput of every batch is logged so the batch size can be tuned. This is the
+        fallback write path; SyncManager only uses it when the COPY transfer is disabled
+        or fails.
 
         Args:
             table_name (str): The name of the table to insert data into.
             data (List[Dict]): A list of dictionaries, each representing a row of data.
+            batch_size (int, optional): The number of rows per INSERT statement and commit. Defaults to 1000.
+            conflict_columns (List[str], optional): Unique key columns; when given, rows that already
+                exist are updated instead (INSERT ... ON CONFLICT DO UPDATE). Defaults to None.
+            commit (bool, optional): Whether to commit each batch. Defaults to True; otherwise the
+                batches are left in the transaction of conn.
+            conn (optional): The connection to run on. Defaults to one checked out of the pool per batch.
+
+        Returns:
+            int: The number of rows inserted or updated.
         """
         if not data:
             logger.warning(f"No data to insert into table '{table_name}'.")
-            return
+            return 0
+        # Convert the keys to a list to ensure it's not an iterator
+        columns = list(data[0].keys())
+        logger.debug(f"Columns for insert into '{table_name}': {columns}")
 
-        try:
-            # Convert the keys to a list to ensure it's not an iterator
-            columns = list(data[0].keys())
-            logger.debug(f"Columns for insert into '{table_name}': {columns}")
-            
-            placeholders = ", ".join(["%s"] * len(columns))
-            column_names = ", ".join(columns)
-            query = f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders});"
-
-            total_inserts = len(data)
-            logger.info(f"Inserting {total_inserts} rows into table '{table_name}'")
-            insert_count = 0
-            for row in data:
-                # Convert values to a list in the same order as columns
-                values = [row[col] for col in columns]
-                await self.execute_query(query, tuple(values))
-                insert_count += 1
-                
-                # Log progress for large inserts
-                if insert_count % 100 == 0:
-                    logger.debug(f"Inserted {insert_count} rows of {total_inserts} into table '{table_name}' so far...")
-                    
-            logger.info(f"Inserted {insert_count} rows into table '{table_name}'.")
-        except Exception as e:
-            logger.error(f"Error inserting data into table '{table_name}': {str(e)}")
-            # Add specific handling for the odict_iterator error
-            if "odict_iterator" in str(e):
-                logger.debug(f"Data format issue detected. First row sample: {str(data[0])[:200]}...")
-                
-                # Try alternative approach with explicit column extraction
-                try:
-                    logger.debug(f"Attempting alternative insertion approach for table '{table_name}'")
-                    # Get columns from the first item's keys
-                    sample_row = next(iter(data))
-                    columns = list(sample_row.keys())
-                    
-                    # Create parametrized query
-                    column_names = ", ".join(columns)
-                    placeholders = ", ".join(["%s"] * len(columns))
-                    query = f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders});"
-                    
-                    # Insert data with explicit value extraction
-                    count = 0
-                    for row in data:
-                        values = tuple(row.get(col) for col in columns)
-                        await self.execute_query(query, values)
-                        count += 1
-                    
-                    logger.info(f"Alternative approach: Inserted {count} rows into table '{table_name}'.")
-                except Exception as alt_e:
-                    logger.error(f"Alternative insertion also failed: {str(alt_e)}")
+        column_names = ", ".join(quote_ident(col) for col in columns)
+        query = f"INSERT INTO {quote_ident(table_name)} ({column_names}) VALUES %s"
+        if conflict_columns:
+            query += " " + on_conflict_clause(columns, conflict_columns)
+
+        async def _insert_batch(conn, values):
+            try:
+                await self.backend.execute_values(conn, query, values)
+                if commit:
+                    await self.backend.commit(conn)
+            except Exception as e:
+                logger.error(f"Error inserting batch into table '{table_name}'. Error: {e}")
+                await self.backend.rollback(conn)
+                raise
+
+        total_inserts = len(data)
+        logger.info(f"Inserting {total_inserts} rows into table '{table_name}' in batches of {batch_size}")
+        insert_count = 0
+        rates = []
+        for offset in range(0, total_inserts, batch_size):
+            values = [tuple(row[col] for col in columns) for row in data[offset:offset + batch_size]]
+            start = time.monotonic()
+            await self._run(_insert_batch, values, conn=conn)
+            elapsed = time.monotonic() - start
+            insert_count += len(values)
+            rates.append(len(values) / elapsed if elapsed > 0 else float(len(values)))
+            logger.debug(f"Inserted batch of {len(values)} rows into '{table_name}' in {elapsed:.3f}s "
+                         f"({rates[-1]:.0f} rows/s), {insert_count} of {total_inserts} so far")
+
+        logger.info(f"Inserted {insert_count} rows into table '{table_name}' "
+                    f"(batch rate min/avg/max: {min(rates):.0f}/{sum(rates) / len(rates):.0f}/{max(rates):.0f} rows/s).")
+        return insert_count
 
     async def table_exists(self, table_name: str, schema: str = "public") -> bool:
         """
@@ -252,16 +944,10 @@ class DatabaseUtility:
             bool: True if the table exists, False otherwise.
         """
         try:
-            # Use raw connection query to check table existence
-            def _raw_table_check(conn, schema, table_name):
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT COUNT(*) FROM pg_tables WHERE schemaname = %s AND tablename = %s", 
-                                  (schema, table_name))
-                    result = cursor.fetchone()
-                    return result[0] > 0
-            
             logger.debug(f"Checking if table '{table_name}' exists in schema '{schema}'")
-            exists = await asyncio.to_thread(_raw_table_check, self.connection, schema, table_name)
+            rows = await self._run(self.backend.fetch, "SELECT COUNT(*) FROM pg_tables WHERE schemaname = %s AND tablename = %s",
+                                   (schema, table_name))
+            exists = rows[0][0] > 0
             logger.debug(f"Table '{table_name}' exists: {exists}")
             return exists
             
@@ -292,62 +978,52 @@ class DatabaseUtility:
             schema (str, optional): The schema to check in. Defaults to "public".
 
         Returns:
-            List[Dict]: A list of dictionaries, each with 'name' and 'type' keys.
+            List[Dict]: A list of dictionaries, each with 'name', 'type', 'type_oid' and 'primary_key'
+                keys. 'primary_key' is the 1-based position of the column in the primary key, or None
+                when the column is not part of it (or the fallback queries had to be used, which
+                also leave out 'type_oid').
         """
         logger.debug(f"Fetching columns for table '{table_name}' in schema '{schema}'")
         try:
-            # Use raw connection query to get column information
-            def _raw_get_columns(conn, schema, table_name):
-                with conn.cursor() as cursor:
-                    # Query using system catalogs
-                    cursor.execute("""
-                        SELECT 
-                            a.attname AS column_name,
-                            pg_catalog.format_type(a.atttypid, a.atttypmod) AS data_type
-                        FROM 
-                            pg_catalog.pg_attribute a
-                        JOIN 
-                            pg_catalog.pg_class c ON a.attrelid = c.oid
-                        JOIN 
-                            pg_catalog.pg_namespace n ON c.relnamespace = n.oid
-                        WHERE 
-                            n.nspname = %s
-                            AND c.relname = %s
-                            AND a.attnum > 0
-                            AND NOT a.attisdropped
-                        ORDER BY
-                            a.attnum
-                    """, (schema, table_name))
-                    columns = []
-                    for row in cursor.fetchall():
-                        columns.append({"name": row[0], "type": row[1]})
-                    return columns
-            
-            columns = await asyncio.to_thread(_raw_get_columns, self.connection, schema, table_name)
+            # Query using system catalogs
+            rows = await self._run(self.backend.fetch, """
+                SELECT 
+                    a.attname AS column_name,
+                    pg_catalog.format_type(a.atttypid, a.atttypmod) AS data_type,
+                    a.atttypid AS type_oid,
+                    (SELECT k.position FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+                     WHERE k.attnum = a.attnum) AS pk_position
+                FROM 
+                    pg_catalog.pg_attribute a
+                JOIN 
+                    pg_catalog.pg_class c ON a.attrelid = c.oid
+                JOIN 
+                    pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+                LEFT JOIN
+                    pg_catalog.pg_index i ON i.indrelid = c.oid AND i.indisprimary
+                WHERE 
+                    n.nspname = %s
+                    AND c.relname = %s
+                    AND a.attnum > 0
+                    AND NOT a.attisdropped
+                ORDER BY
+                    a.attnum
+            """, (schema, table_name))
+            columns = [{"name": row[0], "type": row[1], "type_oid": row[2], "primary_key": row[3]} for row in rows]
             logger.debug(f"Found {len(columns)} columns for table '{table_name}': {columns}")
             
             if not columns:
                 # Fallback to alternative query if needed
                 logger.debug(f"No columns found using primary method, trying alternative approach")
                 
-                def _alt_get_columns(conn, table_name):
-                    with conn.cursor() as cursor:
-                        cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
-                        column_names = [desc[0] for desc in cursor.description]
-                        columns = []
-                        for name in column_names:
-                            # Get type info for each column
-                            cursor.execute(f"""
-                                SELECT data_type 
-                                FROM information_schema.columns 
-                                WHERE table_name = %s AND column_name = %s
-                            """, (table_name, name))
-                            type_result = cursor.fetchone()
-                            data_type = type_result[0] if type_result else 'text'
-                            columns.append({"name": name, "type": data_type})
-                        return columns
-                
-                alt_columns = await asyncio.to_thread(_alt_get_columns, self.connection, table_name)
+                # Look the table up by its name alone, in any schema
+                rows = await self._run(self.backend.fetch, """
+                    SELECT column_name, data_type
+                    FROM information_schema.columns
+                    WHERE table_name = %s
+                    ORDER BY ordinal_position
+                """, (table_name,))
+                alt_columns = [{"name": row[0], "type": row[1], "primary_key": None} for row in rows]
                 logger.debug(f"Alternative approach found columns: {alt_columns}")
                 return alt_columns
             
@@ -365,7 +1041,7 @@ class DatabaseUtility:
                 """
                 result = await self.execute_query(query, (schema, table_name))
                 logger.debug(f"Fallback columns found: {result}")
-                return [{"name": row['column_name'], "type": row['data_type']} for row in result]
+                return [{"name": row['column_name'], "type": row['data_type'], "primary_key": None} for row in result]
             except Exception as inner_e:
                 logger.error(f"Emergency column query also failed: {inner_e}")
                 return []
@@ -0,0 +1,170 @@
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# Kinds of column values in a TupleData block.
+NULL_VALUE = "n"
+UNCHANGED_TOAST = "u"
+TEXT_VALUE = "t"
+
+class Relation:
+    def __init__(self, relid: int, namespace: str, name: str, replica_identity: str, columns: List[Dict]):
+        """
+        Describes a table as announced by the server before its first change in a session.
+
+        Args:
+            relid (int): The OID of the table on the source.
+            namespace (str): The schema of the table.
+            name (str): The name of the table.
+            replica_identity (str): 'd' (default, the primary key), 'n' (nothing), 'f' (full) or 'i' (index).
+            columns (List[Dict]): One dictionary per column with 'name', 'type_oid', 'type_modifier'
+                and 'key' (whether the column is part of the replica identity).
+        """
+        self.relid = relid
+        self.namespace = namespace
+        self.name = name
+        self.replica_identity = replica_identity
+        self.columns = columns
+
+    @property
+    def key_columns(self) -> List[str]:
+        return [col['name'] for col in self.columns if col['key']]
+
+class Begin:
+    def __init__(self, final_lsn: int, commit_time: int, xid: int):
+        self.final_lsn = final_lsn
+        self.commit_time = commit_time
+        self.xid = xid
+
+class Commit:
+    def __init__(self, commit_lsn: int, end_lsn: int, commit_time: int):
+        self.commit_lsn = commit_lsn
+        self.end_lsn = end_lsn
+        self.commit_time = commit_time
+
+class Change:
+    def __init__(self, kind: str, relid: int, new_tuple: Optional[List[Tuple[str, Optional[str]]]] = None,
+                 old_tuple: Optional[List[Tuple[str, Optional[str]]]] = None, old_key_only: bool = False):
+        """
+        An inserted, updated or deleted row.
+
+        Args:
+            kind (str): 'insert', 'update' or 'delete'.
+            relid (int): The OID of the table, announced earlier by a Relation message.
+            new_tuple (optional): The new row as (kind, text value) pairs, for inserts and updates.
+            old_tuple (optional): The old key (or full old row) for deletes and key-changing updates.
+            old_key_only (bool, optional): Whether old_tuple only holds the replica identity ('K'),
+                with every other column sent as null, rather than the full old row ('O').
+        """
+        self.kind = kind
+        self.relid = relid
+        self.new_tuple = new_tuple
+        self.old_tuple = old_tuple
+        self.old_key_only = old_key_only
+
+class Truncate:
+    def __init__(self, relids: List[int], cascade: bool, restart_identity: bool):
+        self.relids = relids
+        self.cascade = cascade
+        self.restart_identity = restart_identity
+
+class PgOutputDecoder:
+    """
+    Decodes the messages of the pgoutput logical decoding plugin (protocol version 1).
+
+    Messages that do not affect the target (Origin, Type, Message) are decoded to None.
+    """
+
+    def decode(self, payload: bytes):
+        self._buffer = bytes(payload)
+        self._offset = 0
+        kind = self._read_byte()
+        if kind == "B":
+            return Begin(self._read_lsn(), self._read_int64(), self._read_oid())
+        if kind == "C":
+            self._read_int8()  # flags, currently unused
+            return Commit(self._read_lsn(), self._read_lsn(), self._read_int64())
+        if kind == "R":
+            return self._decode_relation()
+        if kind == "I":
+            relid = self._read_oid()
+            self._read_byte()  # 'N'
+            return Change("insert", relid, new_tuple=self._read_tuple())
+        if kind == "U":
+            relid = self._read_oid()
+            old_tuple = None
+            old_kind = self._read_byte()
+            if old_kind in ("K", "O"):
+                old_tuple = self._read_tuple()
+                self._read_byte()  # 'N'
+            return Change("update", relid, new_tuple=self._read_tuple(), old_tuple=old_tuple,
+                          old_key_only=old_kind == "K")
+        if kind == "D":
+            relid = self._read_oid()
+            old_kind = self._read_byte()  # 'K' or 'O'
+            return Change("delete", relid, old_tuple=self._read_tuple(), old_key_only=old_kind == "K")
+        if kind == "T":
+            count = self._read_int32()
+            options = self._read_int8()
+            relids = [self._read_oid() for _ in range(count)]
+            return Truncate(relids, bool(options & 1), bool(options & 2))
+        return None
+
+    def _decode_relation(self) -> Relation:
+        relid = self._read_oid()
+        namespace = self._read_string()
+        name = self._read_string()
+        replica_identity = self._read_byte()
+        columns = []
+        for _ in range(self._read_int16()):
+            flags = self._read_int8()
+            columns.append({
+                "name": self._read_string(),
+                "type_oid": self._read_oid(),
+                "type_modifier": self._read_int32(),
+                "key": bool(flags & 1),
+            })
+        return Relation(relid, namespace, name, replica_identity, columns)
+
+    def _read_tuple(self) -> List[Tuple[str, Optional[str]]]:
+        values = []
+        for _ in range(self._read_int16()):
+            kind = self._read_byte()
+            if kind == TEXT_VALUE:
+                length = self._read_int32()
+                values.append((kind, self._buffer[self._offset:self._offset + length].decode()))
+                self._offset += length
+            else:
+                values.append((kind, None))
+        return values
+
+    def _unpack(self, fmt: str):
+        value, = struct.unpack_from(fmt, self._buffer, self._offset)
+        self._offset += struct.calcsize(fmt)
+        return value
+
+    def _read_byte(self) -> str:
+        return chr(self._unpack("!B"))
+
+    def _read_int8(self) -> int:
+        return self._unpack("!b")
+
+    def _read_int16(self) -> int:
+        return self._unpack("!h")
+
+    def _read_int32(self) -> int:
+        return self._unpack("!i")
+
+    def _read_int64(self) -> int:
+        return self._unpack("!q")
+
+    def _read_oid(self) -> int:
+        return self._unpack("!I")
+
+    def _read_lsn(self) -> int:
+        return self._unpack("!Q")
+
+    def _read_string(self) -> str:
+        end = self._buffer.index(b"\0", self._offset)
+        value = self._buffer[self._offset:end].decode()
+        self._offset = end + 1
+        return value
@@ -0,0 +1,330 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from utils.logger import Logger
+
+logger = Logger("db_pool")
+
+class ConnectionPool:
+    def __init__(self, connection_params: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 3600.0, health_check_interval: float = 30.0):
+        """
+        A pool of psycopg2 connections shared by every DatabaseUtility pointing at the same database.
+
+        Connections are handed out by acquire()/release() or the connection() context manager.
+        A connection that sat idle for longer than health_check_interval is pinged before it is
+        handed out, and connections older than max_lifetime are closed and replaced.
+
+        Args:
+            connection_params (Dict[str, Any]): Keyword arguments for psycopg2.connect.
+            min_size (int, optional): Connections opened up front and kept around. Defaults to 1.
+            max_size (int, optional): Upper bound of open connections; acquire() waits beyond it. Defaults to 10.
+            max_lifetime (float, optional): Seconds after which a connection is recycled. Defaults to 3600.
+            health_check_interval (float, optional): Idle seconds after which a connection is pinged
+                before reuse. Defaults to 30.
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.connection_params = connection_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.closed = False
+
+        self._idle: List[Tuple[Any, float]] = []  # (connection, returned_at), most recent last
+        self._created_at: Dict[Any, float] = {}
+        self._size = 0  # open connections, idle or checked out
+        self._loop = None
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # The pool outlives event loops (the startup sync runs before uvicorn starts its own),
+        # so the waiters' condition is bound to whichever loop is currently using the pool.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of open, idle and checked out connections."""
+        return {"size": self._size, "idle": len(self._idle), "in_use": self._size - len(self._idle)}
+
+    async def open(self) -> None:
+        """Opens connections until min_size is reached."""
+        while self._size < self.min_size:
+            self._size += 1
+            conn = await self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    async def _connect(self):
+        """Opens a new connection; the caller has already reserved its slot in _size."""
+        try:
+            conn = await asyncio.to_thread(psycopg2.connect, **self.connection_params)
+        except Exception:
+            self._size -= 1
+            await self._notify()
+            raise
+        self._created_at[conn] = time.monotonic()
+        logger.debug(f"Opened pooled connection to {self.connection_params.get('dbname')} ({self.stats()})")
+        return conn
+
+    async def _notify(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            condition.notify()
+
+    def _expired(self, conn) -> bool:
+        return time.monotonic() - self._created_at.get(conn, 0) > self.max_lifetime
+
+    async def _discard(self, conn) -> None:
+        """Closes a connection and frees its slot."""
+        self._created_at.pop(conn, None)
+        self._size -= 1
+        try:
+            await asyncio.to_thread(conn.close)
+        except Exception as e:
+            logger.debug(f"Error closing pooled connection: {e}")
+        await self._notify()
+
+    async def _healthy(self, conn, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+
+        def _ping(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+
+        try:
+            await asyncio.to_thread(_ping, conn)
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed its health check: {e}")
+            return False
+
+    async def acquire(self):
+        """
+        Checks a connection out of the pool, opening a new one if the pool is below max_size
+        and waiting for a release otherwise.
+
+        Returns:
+            connection: A psycopg2 connection with no transaction in progress.
+        """
+        while True:
+            if self.closed:
+                raise Exception("Connection pool is closed.")
+            condition = self._get_condition()
+            async with condition:
+                while not self._idle and self._size >= self.max_size:
+                    await condition.wait()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    conn = None
+
+            if conn is None:
+                return await self._connect()
+            if self._expired(conn):
+                logger.debug("Recycling pooled connection that exceeded its lifetime")
+                await self._discard(conn)
+                continue
+            if not await self._healthy(conn, returned_at):
+                await self._discard(conn)
+                continue
+            return conn
+
+    async def release(self, conn) -> None:
+        """
+        Returns a connection to the pool. Open transactions are rolled back, and broken or
+        expired connections are closed instead of being reused.
+        """
+        if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                await asyncio.to_thread(conn.rollback)
+            except Exception as e:
+                logger.warning(f"Error rolling back pooled connection: {e}")
+                await self._discard(conn)
+                return
+
+        if conn.closed or self.closed or self._expired(conn):
+            await self._discard(conn)
+            return
+
+        condition = self._get_condition()
+        async with condition:
+            self._idle.append((conn, time.monotonic()))
+            condition.notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Checks out a connection for the duration of an async with block."""
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def close(self) -> None:
+        """Closes idle connections; connections still checked out are closed when released."""
+        self.closed = True
+        idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            await self._discard(conn)
+        logger.info(f"Connection pool for {self.connection_params.get('dbname')} closed.")
+
+class AsyncpgConnection:
+    def __init__(self, raw):
+        """
+        An asyncpg connection with psycopg2's transaction behaviour: the first statement opens
+        a transaction that lasts until commit() or rollback(), so callers can treat connections
+        of either backend alike.
+
+        Args:
+            raw: The asyncpg connection.
+        """
+        self.raw = raw
+        self.transaction = None
+
+    async def begin(self, **options) -> None:
+        """Opens a transaction unless one is in progress; options go to asyncpg's transaction()."""
+        if self.transaction is None:
+            self.transaction = self.raw.transaction(**options)
+            await self.transaction.start()
+
+    async def commit(self) -> None:
+        transaction, self.transaction = self.transaction, None
+        if transaction is not None:
+            await transaction.commit()
+
+    async def rollback(self) -> None:
+        transaction, self.transaction = self.transaction, None
+        if transaction is not None:
+            await transaction.rollback()
+
+class AsyncpgPool:
+    def __init__(self, connection_params: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 3600.0, health_check_interval: float = 30.0):
+        """
+        A pool of native asyncio connections (asyncpg) with the interface of ConnectionPool.
+
+        asyncpg checks connections itself when they are released, so health_check_interval is
+        unused. asyncpg has no limit on a connection's age, so max_lifetime maps to
+        max_inactive_connection_lifetime and becomes an idle timeout: connections unused for
+        that long are closed, while connections in steady use are kept however old. An asyncpg
+        pool is bound to the event loop it was created on; it is recreated when another loop
+        uses it (the startup sync and the API run on different loops).
+
+        Args:
+            connection_params (Dict[str, Any]): Keyword arguments for psycopg2.connect.
+            min_size (int, optional): Connections opened up front and kept around. Defaults to 1.
+            max_size (int, optional): Upper bound of open connections. Defaults to 10.
+            max_lifetime (float, optional): Idle seconds after which a connection is closed. Defaults to 3600.
+            health_check_interval (float, optional): Unused, see above.
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self.connection_params = connection_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.closed = False
+        self._pool = None
+        self._loop = None
+
+    async def open(self) -> None:
+        """Creates the asyncpg pool on the running event loop."""
+        try:
+            import asyncpg
+        except ImportError:
+            raise ImportError("The asyncpg backend needs the asyncpg package: pip install asyncpg")
+
+        loop = asyncio.get_running_loop()
+        if self._pool is not None:
+            if self._loop is loop:
+                return
+            # The old loop is gone or busy elsewhere; its connections cannot be closed gracefully.
+            self._pool.terminate()
+        params = self.connection_params
+        self._pool = await asyncpg.create_pool(
+            host=params.get("host"), port=int(params.get("port") or 5432), user=params.get("user"),
+            password=params.get("password"), database=params.get("dbname"),
+            min_size=self.min_size, max_size=self.max_size,
+            max_inactive_connection_lifetime=self.max_lifetime)
+        self._loop = loop
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of open, idle and checked out connections."""
+        if self._pool is None:
+            return {"size": 0, "idle": 0, "in_use": 0}
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        return {"size": size, "idle": idle, "in_use": size - idle}
+
+    @asynccontextmanager
+    async def connection(self):
+        """Checks out a connection for the duration of an async with block; open transactions are rolled back."""
+        if self.closed:
+            raise Exception("Connection pool is closed.")
+        await self.open()
+        async with self._pool.acquire() as raw:
+            conn = AsyncpgConnection(raw)
+            try:
+                yield conn
+            finally:
+                try:
+                    await conn.rollback()
+                except Exception as e:
+                    logger.warning(f"Error rolling back pooled connection: {e}")
+
+    async def close(self) -> None:
+        """Closes the pool, waiting for checked out connections to be released."""
+        self.closed = True
+        if self._pool is not None:
+            if self._loop is asyncio.get_running_loop():
+                await self._pool.close()
+            else:
+                self._pool.terminate()
+            self._pool = None
+        logger.info(f"Connection pool for {self.connection_params.get('dbname')} closed.")
+
+POOL_CLASSES = {"psycopg2": ConnectionPool, "asyncpg": AsyncpgPool}
+
+_pools: Dict[Tuple, Any] = {}
+
+async def get_pool(connection_params: Dict[str, Any], backend: str = "psycopg2", **settings):
+    """
+    Returns the process-wide pool for the given connection parameters and backend, creating
+    it on first use.
+
+    Args:
+        connection_params (Dict[str, Any]): Keyword arguments for psycopg2.connect.
+        backend (str, optional): The driver, "psycopg2" or "asyncpg". Defaults to "psycopg2".
+        **settings: Pool keyword arguments, only used when the pool is created.
+
+    Returns:
+        The shared ConnectionPool or AsyncpgPool.
+    """
+    key = (backend,) + tuple(sorted((name, str(value)) for name, value in connection_params.items()))
+    pool = _pools.get(key)
+    if pool is None or pool.closed:
+        pool = POOL_CLASSES[backend](connection_params, **settings)
+        _pools[key] = pool
+        await pool.open()
+        logger.info(f"Created {backend} connection pool for {connection_params.get('dbname')} on "
+                    f"{connection_params.get('host')} (min={pool.min_size}, max={pool.max_size})")
+    return pool
+
+async def close_pools() -> None:
+    """Closes every pool created by get_pool."""
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        await pool.close()
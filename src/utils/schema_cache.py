@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from models.schema import SchemaModel
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+
+logger = Logger("schema_cache")
+
+# Shared by every SchemaCache in the process, so models survive from one sync run to the next.
+_memory: Dict[str, Tuple[str, SchemaModel]] = {}
+
+class SchemaCache:
+    def __init__(self, directory: str = None):
+        """
+        Caches introspected schema models in memory and, with a directory, on disk.
+
+        A cached model is reused as long as the catalog fingerprint of its schema is unchanged
+        (see DatabaseUtility.get_catalog_fingerprint), so unchanged schemas are never
+        introspected again, not even after a restart. Only the size statistics, which change
+        with the data, are re-read on every load.
+
+        Args:
+            directory (str, optional): Where cached models are written as JSON files. Defaults to
+                None, which keeps them in memory only.
+        """
+        self.directory = directory
+
+    async def load(self, db: DatabaseUtility, schema: str = "public", tables: List[str] = None) -> SchemaModel:
+        """
+        Returns the schema model of a database, from the cache when its fingerprint still matches.
+
+        Args:
+            db (DatabaseUtility): The database to introspect.
+            schema (str, optional): The schema to load. Defaults to "public".
+            tables (List[str], optional): The tables to load. Defaults to every table of the schema.
+
+        Returns:
+            SchemaModel: The tables found, with current size statistics.
+        """
+        key = cache_key(db.db_config, schema, tables)
+        # Read before introspecting: DDL committed in between leaves a stale fingerprint behind,
+        # which only causes one more introspection on the next load.
+        fingerprint = await db.get_catalog_fingerprint(schema)
+
+        entry = _memory.get(key)
+        if entry is None and self.directory:
+            entry = await asyncio.to_thread(self._read, key)
+        if entry is not None and entry[0] == fingerprint:
+            model = entry[1]
+            model.update_sizes(await db.get_table_sizes(schema))
+            _memory[key] = entry
+            logger.info(f"Schema '{schema}' of {db.db_config.get('dbname')} unchanged, "
+                        f"reusing the cached model of {len(model)} tables")
+            return model
+
+        if entry is not None:
+            logger.info(f"Schema '{schema}' of {db.db_config.get('dbname')} changed, introspecting it again")
+        model = await db.introspect_schema(schema, tables)
+        _memory[key] = (fingerprint, model)
+        if self.directory:
+            try:
+                await asyncio.to_thread(self._write, key, fingerprint, model)
+            except OSError as e:
+                logger.warning(f"Could not write the schema cache: {e}")
+        return model
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Tuple[str, SchemaModel]]:
+        try:
+            with open(self._path(key), "r") as f:
+                data = json.load(f)
+            return data["fingerprint"], SchemaModel.from_dict(data["model"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema cache file {self._path(key)}: {e}")
+            return None
+
+    def _write(self, key: str, fingerprint: str, model: SchemaModel) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Written to a temporary file first, so a crash never leaves a truncated cache file.
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "model": model.to_dict()}, f)
+        os.replace(temp_path, path)
+
+def cache_key(db_config: Dict, schema: str, tables: List[str] = None) -> str:
+    """Derives the cache file name from the database, the schema and the requested tables."""
+    identity = [db_config.get("host"), str(db_config.get("port")), db_config.get("dbname"), schema,
+                sorted(tables) if tables is not None else "*"]
+    return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from utils.database import DatabaseUtility
+from utils.logger import Logger
+
+logger = Logger("state_store")
+
+WATERMARKS_TABLE = "pg_db_sync_watermarks"
+CHANGE_COUNTERS_TABLE = "pg_db_sync_change_counters"
+
+class StateStore:
+    def __init__(self, target_db: DatabaseUtility):
+        """
+        Persists sync state in control tables on the target database, so it survives restarts
+        and is shared by every process syncing into the same target.
+
+        Args:
+            target_db (DatabaseUtility): The database holding the control tables.
+        """
+        self.target_db = target_db
+        self._ready = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_tables(self) -> None:
+        """Creates the control tables if they do not exist yet."""
+        async with self._lock:
+            if self._ready:
+                return
+            try:
+                await self._create_tables()
+            except Exception as e:
+                # CREATE TABLE IF NOT EXISTS can still collide with another process creating the same table.
+                logger.debug(f"Retrying control table creation: {e}")
+                await self._create_tables()
+            self._ready = True
+
+    async def _create_tables(self) -> None:
+        await self.target_db.execute_query(f"""
+            CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} (
+                source_table TEXT NOT NULL,
+                target_table TEXT NOT NULL,
+                watermark_column TEXT NOT NULL,
+                watermark TEXT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (source_table, target_table)
+            )
+        """)
+        await self.target_db.execute_query(f"""
+            CREATE TABLE IF NOT EXISTS {CHANGE_COUNTERS_TABLE} (
+                source_table TEXT NOT NULL,
+                target_table TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                skipped_runs INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source_table, target_table)
+            )
+        """)
+
+    async def get_watermark(self, source_table: str, target_table: str, watermark_column: str) -> Optional[str]:
+        """
+        Returns the high-water mark stored by the last successful incremental run, as text.
+
+        Args:
+            source_table (str): The name of the source table.
+            target_table (str): The name of the target table.
+            watermark_column (str): The column the watermark refers to.
+
+        Returns:
+            Optional[str]: The watermark, or None if there is none for this column yet.
+        """
+        await self.ensure_tables()
+        result = await self.target_db.execute_query(
+            f"SELECT watermark_column, watermark FROM {WATERMARKS_TABLE} WHERE source_table = %s AND target_table = %s",
+            (source_table, target_table))
+        if not result:
+            return None
+        if result[0]['watermark_column'] != watermark_column:
+            logger.warning(f"Watermark column of '{source_table}' changed from '{result[0]['watermark_column']}' "
+                           f"to '{watermark_column}', starting over")
+            return None
+        return result[0]['watermark']
+
+    async def set_watermark(self, source_table: str, target_table: str, watermark_column: str, watermark: str) -> None:
+        """Stores the high-water mark reached by an incremental run."""
+        await self.ensure_tables()
+        await self.target_db.execute_query(f"""
+            INSERT INTO {WATERMARKS_TABLE} (source_table, target_table, watermark_column, watermark)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (source_table, target_table) DO UPDATE
+            SET watermark_column = EXCLUDED.watermark_column, watermark = EXCLUDED.watermark, updated_at = now()
+        """, (source_table, target_table, watermark_column, watermark))
+        logger.debug(f"Stored watermark {watermark_column} = {watermark} for '{source_table}' -> '{target_table}'")
+
+    async def get_change_counters(self) -> Dict[Tuple[str, str], Tuple[str, int]]:
+        """
+        Returns the source modification signature recorded at the last successful sync of every
+        table pair, together with the number of runs that skipped the pair since.
+
+        Returns:
+            Dict[Tuple[str, str], Tuple[str, int]]: (signature, skipped_runs) per (source_table, target_table).
+        """
+        await self.ensure_tables()
+        result = await self.target_db.execute_query(
+            f"SELECT source_table, target_table, signature, skipped_runs FROM {CHANGE_COUNTERS_TABLE}")
+        return {(row['source_table'], row['target_table']): (row['signature'], row['skipped_runs']) for row in result}
+
+    async def get_change_counter(self, source_table: str, target_table: str) -> Optional[Tuple[str, int]]:
+        """Returns (signature, skipped_runs) of one table pair, see get_change_counters."""
+        await self.ensure_tables()
+        result = await self.target_db.execute_query(
+            f"SELECT signature, skipped_runs FROM {CHANGE_COUNTERS_TABLE} WHERE source_table = %s AND target_table = %s",
+            (source_table, target_table))
+        return (result[0]['signature'], result[0]['skipped_runs']) if result else None
+
+    async def set_change_counters(self, counters: Dict[Tuple[str, str], Tuple[str, int]]) -> None:
+        """Stores (signature, skipped_runs) for many table pairs at once."""
+        if not counters:
+            return
+        await self.ensure_tables()
+        rows = [{"source_table": source_table, "target_table": target_table, "signature": signature,
+                 "skipped_runs": skipped_runs}
+                for (source_table, target_table), (signature, skipped_runs) in counters.items()]
+        await self.target_db.insert_data(CHANGE_COUNTERS_TABLE, rows, batch_size=1000,
+                                         conflict_columns=["source_table", "target_table"])
+        logger.debug(f"Stored modification counters of {len(rows)} tables")
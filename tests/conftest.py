@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The application imports its modules relative to src, as main.py does when run from there.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
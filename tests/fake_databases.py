@@ -0,0 +1,73 @@
+"""In-memory stand-ins for DatabaseUtility and StateStore, for the tests of the sync logic."""
+from contextlib import asynccontextmanager
+
+class FakeDatabase:
+    """Answers the DatabaseUtility calls of a sync from in-memory tables; unset calls fail."""
+
+    def __init__(self, name="db", tables=None, unique_keys=None, counters=None):
+        self.db_config = {"host": "localhost", "port": 5432, "dbname": name}
+        self.pool = None
+        # Table name to column definitions, as get_table_columns returns them.
+        self.tables = dict(tables or {})
+        # Table name to the column lists of its unique keys.
+        self.unique_keys = {table: [list(key) for key in keys] for table, keys in (unique_keys or {}).items()}
+        self.counters = dict(counters or {})
+        self.created = []
+        self.max_values = {}
+
+    async def get_table_columns(self, table_name):
+        return self.tables[table_name]
+
+    async def fetch_all_tables(self):
+        return list(self.tables)
+
+    async def create_table(self, table_name, columns):
+        self.created.append(table_name)
+        if table_name not in self.tables:
+            self.tables[table_name] = columns
+            keys = sorted((col for col in columns if col.get('primary_key')), key=lambda col: col['primary_key'])
+            if keys:
+                self.unique_keys.setdefault(table_name, []).append([col['name'] for col in keys])
+
+    async def has_unique_key(self, table_name, key_columns):
+        return any(sorted(key) == sorted(key_columns) for key in self.unique_keys.get(table_name, []))
+
+    async def get_modification_counters(self):
+        return dict(self.counters)
+
+    async def get_max_value(self, table_name, column, snapshot=None):
+        return self.max_values.get(table_name)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield object()
+
+class FakeStateStore:
+    """Keeps watermarks and change counters in dicts, like the control tables of StateStore."""
+
+    def __init__(self, counters=None):
+        self.watermarks = {}
+        self.counters = dict(counters or {})
+
+    async def get_watermark(self, source_table, target_table, watermark_column):
+        stored = self.watermarks.get((source_table, target_table))
+        if stored is None or stored[0] != watermark_column:
+            return None
+        return stored[1]
+
+    async def set_watermark(self, source_table, target_table, watermark_column, watermark):
+        self.watermarks[(source_table, target_table)] = (watermark_column, watermark)
+
+    async def get_change_counters(self):
+        return dict(self.counters)
+
+    async def get_change_counter(self, source_table, target_table):
+        return self.counters.get((source_table, target_table))
+
+    async def set_change_counters(self, counters):
+        self.counters.update(counters)
+
+def columns(*names, key=()):
+    """Column definitions as get_table_columns returns them, with key as the primary key columns."""
+    return [{"name": name, "type": "integer", "primary_key": key.index(name) + 1 if name in key else None}
+            for name in names]
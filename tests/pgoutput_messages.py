@@ -0,0 +1,48 @@
+"""Builds pgoutput messages byte by byte, as the server sends them, for the decoder and applier tests."""
+import struct
+
+def _string(value: str) -> bytes:
+    return value.encode() + b"\0"
+
+def tuple_data(values) -> bytes:
+    """Encodes a TupleData block; values are text, None for null or "u" for an unchanged TOAST value."""
+    data = struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            data += b"n"
+        elif value == "u":
+            data += b"u"
+        else:
+            encoded = value.encode()
+            data += b"t" + struct.pack("!i", len(encoded)) + encoded
+    return data
+
+def begin(final_lsn: int, commit_time: int, xid: int) -> bytes:
+    return b"B" + struct.pack("!QqI", final_lsn, commit_time, xid)
+
+def commit(commit_lsn: int, end_lsn: int, commit_time: int) -> bytes:
+    return b"C" + struct.pack("!bQQq", 0, commit_lsn, end_lsn, commit_time)
+
+def relation(relid: int, namespace: str, name: str, replica_identity: str, columns) -> bytes:
+    """Encodes a Relation message; columns are (name, type_oid, is_key) triples."""
+    data = b"R" + struct.pack("!I", relid) + _string(namespace) + _string(name) + replica_identity.encode()
+    data += struct.pack("!h", len(columns))
+    for name, type_oid, key in columns:
+        data += struct.pack("!b", 1 if key else 0) + _string(name) + struct.pack("!Ii", type_oid, -1)
+    return data
+
+def insert(relid: int, new) -> bytes:
+    return b"I" + struct.pack("!I", relid) + b"N" + tuple_data(new)
+
+def update(relid: int, new, old=None, old_kind: str = "K") -> bytes:
+    data = b"U" + struct.pack("!I", relid)
+    if old is not None:
+        data += old_kind.encode() + tuple_data(old)
+    return data + b"N" + tuple_data(new)
+
+def delete(relid: int, old, old_kind: str = "K") -> bytes:
+    return b"D" + struct.pack("!I", relid) + old_kind.encode() + tuple_data(old)
+
+def truncate(relids, cascade: bool = False, restart_identity: bool = False) -> bytes:
+    options = (1 if cascade else 0) | (2 if restart_identity else 0)
+    return b"T" + struct.pack("!ib", len(relids), options) + b"".join(struct.pack("!I", relid) for relid in relids)
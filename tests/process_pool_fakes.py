@@ -0,0 +1,93 @@
+"""
+A file-backed stand-in for DatabaseUtility that pool processes can open on their own, and the
+initializer that makes them use it; importable by spawned processes, which share sys.path.
+"""
+import asyncio
+import json
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import process_pool
+from utils.copy_codecs import BINARY_HEADER, BINARY_TRAILER, BinaryCopyDecoder, encode_binary_row
+
+INT4 = 23
+CONDITION = re.compile(r'"id" (<|>=) %s::integer')
+
+class Transaction:
+    def __init__(self):
+        self.writes = []
+
+class FileDatabase:
+    """
+    Copies tables of integer rows kept as JSON files in db_config["path"] with binary COPY.
+    Writes become visible in a file per committed COPY; db_config["copy_delay"] holds each
+    COPY open for a while after its stream ended, so progress reports arrive mid-copy.
+    """
+
+    def __init__(self, db_config, pool_settings=None, backend="files"):
+        self.db_config = db_config
+        self.pool_settings = pool_settings or {}
+        self.backend = SimpleNamespace(name=backend)
+        self.pool = None
+
+    async def connect(self):
+        os.makedirs(self.db_config["path"], exist_ok=True)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield Transaction()
+
+    def write_table(self, table_name, rows):
+        with open(os.path.join(self.db_config["path"], f"{table_name}.json"), "w") as f:
+            json.dump(rows, f)
+
+    def read_table(self, table_name):
+        """Returns the rows of a table, gathered from every file written for it, in key order."""
+        rows = []
+        for name in os.listdir(self.db_config["path"]):
+            if name == f"{table_name}.json" or name.startswith(f"{table_name}."):
+                with open(os.path.join(self.db_config["path"], name)) as f:
+                    rows += json.load(f)
+        return sorted(rows)
+
+    async def copy_out(self, query, pipe, params=None, snapshot=None, conn=None, copy_format="text"):
+        table_name = re.search(r'FROM "(\w+)"', query).group(1)
+        if table_name == "missing":
+            raise RuntimeError('relation "missing" does not exist')
+        bounds = list(zip(CONDITION.findall(query), params or ()))
+        rows = [row for row in self.read_table(table_name)
+                if all(row[0] < int(bound) if op == "<" else row[0] >= int(bound) for op, bound in bounds)]
+        await pipe.awrite(BINARY_HEADER + b"".join(encode_binary_row(row, [INT4] * len(row)) for row in rows)
+                          + BINARY_TRAILER)
+        await pipe.afinish()
+        return len(rows)
+
+    async def copy_in(self, table_name, columns, pipe, commit=True, conn=None, copy_format="text"):
+        decoder = BinaryCopyDecoder([INT4] * len(columns))
+        rows = []
+        async for block in pipe.chunks():
+            rows += decoder.feed(block)
+        await asyncio.sleep(self.db_config.get("copy_delay", 0))
+        conn.writes.append((table_name, rows))
+        return len(rows)
+
+    async def commit(self, conn):
+        for table_name, rows in conn.writes:
+            with open(os.path.join(self.db_config["path"], f"{table_name}.{uuid.uuid4().hex}.json"), "w") as f:
+                json.dump(rows, f)
+        conn.writes.clear()
+
+    async def rollback(self, conn):
+        conn.writes.clear()
+
+def init_process(*args):
+    """The pool initializer of ChunkProcessPool, with FileDatabase in place of DatabaseUtility."""
+    process_pool.DatabaseUtility = FileDatabase
+    process_pool._init_process(*args)
+
+def double_values(row):
+    """A row transform for the tests: keeps the key and doubles every other column."""
+    return [row[0]] + [value * 2 for value in row[1:]]
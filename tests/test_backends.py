@@ -0,0 +1,63 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from utils.backends import DatabaseBackend, _rowcount, get_backend, to_dollar_params
+
+def test_placeholders_are_numbered_in_order():
+    assert to_dollar_params("SELECT * FROM t WHERE a = %s AND b > %s", (1, 2)) == (
+        "SELECT * FROM t WHERE a = $1 AND b > $2", (1, 2))
+
+def test_string_parameters_are_passed_as_text():
+    query, params = to_dollar_params("SELECT %s::regclass, %s", ("public.t", 5))
+    assert query == "SELECT $1::text::regclass, $2"
+    assert params == ("public.t", 5)
+
+@pytest.mark.parametrize("value", [None, b"\x00\xff", bytearray(b"ab"), Decimal("1.50"), 3.5, True,
+                                   datetime.date(2024, 1, 1)])
+def test_other_parameters_are_left_to_the_server(value):
+    query, params = to_dollar_params("INSERT INTO t VALUES (%s)", [value])
+    assert query == "INSERT INTO t VALUES ($1)"
+    assert params == (value,)
+
+def test_escaped_percent_signs_become_single():
+    assert to_dollar_params("SELECT 'a%%b' LIKE %s, 10 %% 3", ("a%",)) == ("SELECT 'a%b' LIKE $1::text, 10 % 3", ("a%",))
+
+def test_queries_without_parameters_are_left_alone():
+    # Like psycopg2, which only interpolates when parameters are given.
+    assert to_dollar_params("SELECT '%s', '%%'") == ("SELECT '%s', '%%'", ())
+
+def test_placeholders_in_literals_take_a_parameter_like_psycopg2():
+    # psycopg2 does not parse SQL either, so "%s" in a literal has to be written "%%s" there too.
+    assert to_dollar_params("SELECT '%s', %s", ("a", "b")) == ("SELECT '$1::text', $2::text", ("a", "b"))
+    assert to_dollar_params("SELECT '%%s', %s", ("a",)) == ("SELECT '%s', $1::text", ("a",))
+
+def test_missing_parameters_fail():
+    with pytest.raises(IndexError):
+        to_dollar_params("SELECT %s, %s", (1,))
+
+def test_any_iterable_of_parameters_is_accepted():
+    assert to_dollar_params("SELECT %s", iter([1])) == ("SELECT $1", (1,))
+
+@pytest.mark.parametrize("status, rows", [("INSERT 0 5", 5), ("UPDATE 12", 12), ("DELETE 0", 0), ("CREATE TABLE", -1),
+                                          (None, -1)])
+def test_rowcount_from_command_status(status, rows):
+    assert _rowcount(status) == rows
+
+def test_backends_by_name():
+    assert get_backend("psycopg2").name == "psycopg2"
+    assert get_backend("asyncpg").name == "asyncpg"
+    with pytest.raises(ValueError):
+        get_backend("mysql")
+
+def test_backends_implement_every_driver_operation():
+    with pytest.raises(TypeError):
+        DatabaseBackend()
+
+    class PartialBackend(DatabaseBackend):
+        async def fetch(self, conn, query, params=None, snapshot=None, settings=None):
+            return []
+
+    with pytest.raises(TypeError, match="copy_in"):
+        PartialBackend()
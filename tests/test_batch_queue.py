@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from utils.batch_queue import BatchQueue, estimate_size
+
+def batch(rows, width=10):
+    return [{"id": i, "value": "x" * width} for i in range(rows)]
+
+def test_estimate_counts_text_by_length_and_other_values_as_eight_bytes():
+    assert estimate_size([]) == 0
+    assert estimate_size(batch(3)) == 3 * (8 + 10)
+    assert estimate_size([(1, b"abcd", None, "é")]) == 8 + 4 + 8 + 1
+
+def queue_limits(max_rows, max_bytes, batches, consume_delay=0.001):
+    """Runs a producer against a slow consumer and returns the rows and bytes held after every put()."""
+    async def main():
+        queue = BatchQueue(max_rows, max_bytes)
+        held = []
+
+        async def produce():
+            for item in batches:
+                await queue.put(item)
+                held.append((queue.rows, queue.bytes))
+            await queue.close()
+
+        async def consume():
+            received = []
+            while (item := await queue.get()) is not None:
+                await asyncio.sleep(consume_delay)
+                received.append(item)
+            return received
+
+        _, received = await asyncio.wait_for(asyncio.gather(produce(), consume()), 5)
+        return held, received
+    return asyncio.run(main())
+
+def test_queued_bytes_never_exceed_the_limit():
+    batches = [batch(5) for _ in range(20)]
+    held, received = queue_limits(1000, 3 * estimate_size(batches[0]), batches)
+    assert received == batches
+    assert max(size for _, size in held) <= 3 * estimate_size(batches[0])
+
+def test_queued_rows_never_exceed_the_limit():
+    batches = [batch(4) for _ in range(20)]
+    held, received = queue_limits(10, 1 << 30, batches)
+    assert received == batches
+    assert max(rows for rows, _ in held) <= 10
+
+def test_an_oversized_batch_is_taken_into_an_empty_queue_alone():
+    batches = [batch(2), batch(50, width=100), batch(2)]
+    held, received = queue_limits(10, 200, batches)
+    assert received == batches
+    # The large batch only went in once the queue was empty, and nothing joined it.
+    assert (50, estimate_size(batches[1])) in held
+
+def test_close_with_an_error_raises_it_in_the_consumer():
+    async def main():
+        queue = BatchQueue()
+        await queue.put(batch(1))
+        await queue.close(ValueError("source failed"))
+        return await queue.get()
+    with pytest.raises(ValueError, match="source failed"):
+        asyncio.run(main())
+
+def test_close_releases_a_blocked_producer():
+    async def main():
+        queue = BatchQueue(max_rows=1)
+        await queue.put(batch(1))
+        producer = asyncio.create_task(queue.put(batch(1)))
+        await asyncio.sleep(0.01)
+        assert not producer.done()
+        await queue.close()
+        return await asyncio.gather(producer, return_exceptions=True)
+    [result] = asyncio.run(main())
+    assert isinstance(result, Exception) and "closed" in str(result)
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+
+from utils.byte_pipe import BytePipe
+
+def blocks(count, size=4):
+    return [bytes([i % 256]) * size for i in range(count)]
+
+def test_thread_ends_pass_blocks_in_order():
+    pipe = BytePipe(max_chunks=2, chunk_size=4)
+    data = blocks(20)
+
+    def produce():
+        for block in data:
+            pipe.writer.write(block)
+        pipe.finish()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    received = []
+    while block := pipe.reader.read():
+        received.append(block)
+    producer.join(5)
+    assert b"".join(received) == b"".join(data)
+    assert pipe.bytes == 80
+
+def test_small_loop_writes_are_gathered_into_blocks():
+    async def main():
+        pipe = BytePipe(max_chunks=8, chunk_size=10)
+        for _ in range(7):
+            await pipe.awrite(b"abc")
+        await pipe.afinish()
+        return [block async for block in pipe.chunks()]
+    assert asyncio.run(main()) == [b"abc" * 4, b"abc" * 3]
+
+def test_fast_producer_waits_for_a_slow_consumer():
+    async def main():
+        pipe = BytePipe(max_chunks=2, chunk_size=4)
+        in_flight = []
+
+        async def produce():
+            for block in blocks(10):
+                await pipe.awrite(block)
+                in_flight.append(pipe._chunks.qsize())
+            await pipe.afinish()
+
+        async def consume():
+            received = []
+            async for block in pipe.chunks():
+                await asyncio.sleep(0.01)
+                received.append(block)
+            return received
+
+        _, received = await asyncio.wait_for(asyncio.gather(produce(), consume()), 5)
+        return in_flight, received
+    in_flight, received = asyncio.run(main())
+    assert max(in_flight) <= 2
+    assert received == blocks(10)
+
+def test_thread_writer_blocks_while_the_loop_reader_lags():
+    async def main():
+        pipe = BytePipe(max_chunks=1, chunk_size=4)
+        written = []
+
+        def produce():
+            for block in blocks(5):
+                pipe.writer.write(block)
+                pipe.writer.flush()
+                written.append(block)
+            pipe.finish()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        await asyncio.sleep(0.3)
+        # One block queued, one waiting in put(): the writer is held up, not buffering.
+        assert len(written) <= 2
+        received = [block async for block in pipe.chunks()]
+        await asyncio.to_thread(producer.join, 5)
+        return received
+    assert asyncio.run(main()) == blocks(5)
+
+def test_reader_stopping_early_fails_the_writer():
+    async def main():
+        pipe = BytePipe(max_chunks=1, chunk_size=4)
+
+        async def produce():
+            for block in blocks(100):
+                await pipe.awrite(block)
+            await pipe.afinish()
+
+        async def consume():
+            async for _ in pipe.chunks():
+                break
+            pipe.close_reader()
+
+        return await asyncio.wait_for(asyncio.gather(produce(), consume(), return_exceptions=True), 5)
+    produced, _ = asyncio.run(main())
+    assert isinstance(produced, BrokenPipeError)
+
+def test_reader_stopping_early_fails_a_thread_writer():
+    pipe = BytePipe(max_chunks=1, chunk_size=4)
+    errors = []
+
+    def produce():
+        try:
+            for block in blocks(100):
+                pipe.writer.write(block)
+                pipe.writer.flush()
+        except BrokenPipeError as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    assert pipe.reader.read() == blocks(1)[0]
+    pipe.close_reader()
+    producer.join(5)
+    assert not producer.is_alive() and len(errors) == 1
+    assert pipe.reader.read() == b""
+
+def test_failing_writer_ends_the_stream_for_the_reader():
+    async def main():
+        pipe = BytePipe(max_chunks=2, chunk_size=4)
+
+        async def produce():
+            # Like CopyTransfer's producer, which aborts the pipe however the source ends.
+            try:
+                await pipe.awrite(b"abcd")
+                await asyncio.sleep(0.05)
+                raise RuntimeError("source failed")
+            finally:
+                pipe.abort()
+
+        async def consume():
+            return [block async for block in pipe.chunks()]
+
+        return await asyncio.wait_for(asyncio.gather(produce(), consume(), return_exceptions=True), 5)
+    produced, received = asyncio.run(main())
+    assert isinstance(produced, RuntimeError)
+    assert received == [b"abcd"]
+
+def test_failing_loop_writer_ends_the_stream_for_a_thread_reader():
+    async def main():
+        pipe = BytePipe(max_chunks=2, chunk_size=4)
+
+        def consume():
+            received = []
+            while block := pipe.reader.read():
+                received.append(block)
+            return received
+
+        consumer = asyncio.create_task(asyncio.to_thread(consume))
+        try:
+            await pipe.awrite(b"abcd")
+            raise RuntimeError("source failed")
+        except RuntimeError:
+            pipe.abort()
+        return await asyncio.wait_for(consumer, 5)
+    assert asyncio.run(main()) == [b"abcd"]
+
+def test_transform_rewrites_blocks_and_adds_its_tail():
+    class Upper:
+        def feed(self, data):
+            return data.upper()
+
+        def finish(self):
+            return b"!"
+
+    async def main():
+        pipe = BytePipe(max_chunks=4, chunk_size=3, transform=Upper())
+        await pipe.awrite(b"abcdef")
+        await pipe.afinish()
+        return b"".join([block async for block in pipe.chunks()])
+    assert asyncio.run(main()) == b"ABCDEF!"
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from chunk_planner import ChunkPlanner, ctid_range_chunks, histogram_split_points, key_range_chunks, leading_key_column
+
+KEY = {"name": "id", "type": "bigint", "primary_key": 1}
+
+def contains(chunk, value, parse=int):
+    """Evaluates a chunk's range condition for one value of its column."""
+    bounds = [parse(param) for param in chunk.params]
+    if len(bounds) == 2:
+        return bounds[0] <= value < bounds[1]
+    if " < " in chunk.where:
+        return value < bounds[0]
+    return value >= bounds[0]
+
+def assert_partition(chunks, values, parse=int):
+    for value in values:
+        assert sum(contains(chunk, value, parse) for chunk in chunks) == 1, value
+
+class FakeSource:
+    def __init__(self, histogram=(), column_range=(None, None), server_version=160000):
+        self.histogram = list(histogram)
+        self.column_range = column_range
+        self.server_version = server_version
+
+    async def get_histogram_bounds(self, table_name, column):
+        return self.histogram
+
+    async def get_column_range(self, table_name, column):
+        return self.column_range
+
+    async def get_server_version(self):
+        return self.server_version
+
+def plan(source, chunk_count, columns=(KEY,), pages=0):
+    return asyncio.run(ChunkPlanner(source).plan("t", list(columns), chunk_count, pages))
+
+def test_histogram_split_points_are_evenly_spaced():
+    histogram = [str(i) for i in range(0, 101)]
+    assert histogram_split_points(histogram, 4) == ["25", "50", "75"]
+
+def test_duplicate_histogram_bounds_are_dropped():
+    histogram = ["1", "1", "1", "1", "2", "2", "9"]
+    points = histogram_split_points(histogram, 6)
+    assert points == ["1", "2"]
+    assert_partition(key_range_chunks(KEY, points), range(-5, 20))
+
+def test_more_chunks_than_histogram_buckets():
+    points = histogram_split_points(["10", "20", "30"], 8)
+    assert points == list(dict.fromkeys(points)) and points == sorted(points, key=int)
+    assert_partition(key_range_chunks(KEY, points), range(0, 40))
+
+def test_key_ranges_are_disjoint_and_open_ended():
+    chunks = key_range_chunks(KEY, ["10", "20", "30"])
+    assert [chunk.where for chunk in chunks] == [
+        '"id" < %s::bigint', '"id" >= %s::bigint AND "id" < %s::bigint',
+        '"id" >= %s::bigint AND "id" < %s::bigint', '"id" >= %s::bigint']
+    assert [chunk.params for chunk in chunks] == [("10",), ("10", "20"), ("20", "30"), ("30",)]
+    # Keys outside the sampled statistics land in the first and last chunks.
+    assert_partition(chunks, [-2 ** 63, -1, 9, 10, 19, 20, 29, 30, 2 ** 63 - 1])
+
+def test_a_single_split_point_gives_two_chunks():
+    chunks = key_range_chunks(KEY, ["5"])
+    assert [chunk.label for chunk in chunks] == ["id < 5", "id >= 5"]
+
+def test_ctid_ranges_cover_the_heap_and_blocks_added_since():
+    chunks = ctid_range_chunks(100, 4)
+    assert [chunk.params for chunk in chunks] == [("(25,0)",), ("(25,0)", "(50,0)"), ("(50,0)", "(75,0)"), ("(75,0)",)]
+    parse = lambda tid: tuple(int(part) for part in tid.strip("()").split(","))
+    tids = [(block, offset) for block in (0, 24, 25, 49, 50, 99, 100, 5000) for offset in (0, 1, 291)]
+    assert_partition(chunks, tids, parse)
+
+@pytest.mark.parametrize("pages, chunk_count", [(3, 8), (1, 2), (0, 4)])
+def test_small_heaps_do_not_repeat_bounds(pages, chunk_count):
+    chunks = ctid_range_chunks(pages, chunk_count)
+    bounds = [chunk.params[-1] for chunk in chunks[:-1]]
+    assert len(bounds) == len(set(bounds))
+    parse = lambda tid: tuple(int(part) for part in tid.strip("()").split(","))
+    assert_partition(chunks, [(block, offset) for block in range(0, pages + 2) for offset in (0, 1)], parse)
+
+def test_leading_key_column():
+    columns = [{"name": "b", "primary_key": 2}, {"name": "x", "primary_key": None}, {"name": "a", "primary_key": 1}]
+    assert leading_key_column(columns)["name"] == "a"
+    assert leading_key_column([{"name": "x"}]) is None
+
+def test_plan_uses_the_histogram():
+    chunks = plan(FakeSource(histogram=[str(i) for i in range(0, 1001, 10)]), 4)
+    assert [chunk.params for chunk in chunks] == [("250",), ("250", "500"), ("500", "750"), ("750",)]
+
+@pytest.mark.parametrize("low, high, chunk_count", [(1, 1000, 4), (-50, 49, 3), (7, 9, 8), (-2 ** 63, 2 ** 63 - 1, 16)])
+def test_integer_keys_without_statistics_split_between_min_and_max(low, high, chunk_count):
+    chunks = plan(FakeSource(column_range=(low, high)), chunk_count)
+    assert 2 <= len(chunks) <= chunk_count
+    bounds = [int(chunk.params[-1]) for chunk in chunks[:-1]]
+    assert bounds == sorted(set(bounds)) and low < bounds[0] and bounds[-1] <= high
+    assert_partition(chunks, {low - 1, low, (low + high) // 2, high, high + 1} | set(bounds))
+
+def test_integer_split_points_are_even():
+    chunks = plan(FakeSource(column_range=(1, 1000)), 4)
+    assert [chunk.params for chunk in chunks] == [("251",), ("251", "501"), ("501", "751"), ("751",)]
+
+def test_integer_split_points_are_exact_for_large_keys():
+    low, high = 2 ** 62, 2 ** 63 - 1
+    chunks = plan(FakeSource(column_range=(low, high)), 3)
+    assert [int(chunk.params[-1]) for chunk in chunks[:-1]] == [low + 2 ** 62 // 3, low + 2 ** 63 // 3]
+
+@pytest.mark.parametrize("source", [FakeSource(), FakeSource(column_range=(5, 5))])
+def test_empty_or_single_key_tables_are_not_split(source):
+    chunks = plan(source, 4)
+    assert len(chunks) == 1 and chunks[0].where is None
+
+def test_non_integer_keys_without_statistics_are_not_split():
+    chunks = plan(FakeSource(column_range=("a", "z")), 4, columns=[{"name": "code", "type": "text", "primary_key": 1}])
+    assert len(chunks) == 1 and chunks[0].where is None
+
+def test_tables_without_a_key_are_split_by_block():
+    chunks = plan(FakeSource(), 4, columns=[{"name": "x", "type": "text"}], pages=400)
+    assert [chunk.label for chunk in chunks] == [
+        "ctid < (100,0)", "(100,0) <= ctid < (200,0)", "(200,0) <= ctid < (300,0)", "ctid >= (300,0)"]
+
+@pytest.mark.parametrize("pages, server_version", [(0, 160000), (3, 160000), (400, 130000)])
+def test_tables_without_a_key_stay_whole_when_not_splittable(pages, server_version):
+    # relpages is 0 until the first VACUUM or ANALYZE, and TID Range Scans need PostgreSQL 14.
+    chunks = plan(FakeSource(server_version=server_version), 4, columns=[{"name": "x", "type": "text"}], pages=pages)
+    assert len(chunks) == 1 and chunks[0].where is None
+
+def test_one_chunk_is_the_whole_table():
+    chunks = plan(FakeSource(histogram=["1", "2", "3", "4"]), 1)
+    assert len(chunks) == 1 and chunks[0].where is None
@@ -0,0 +1,161 @@
+import datetime
+import struct
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from utils.copy_codecs import (BINARY_HEADER, BINARY_TRAILER, BinaryCopyDecoder, BinaryCopyTransformer, RawValue,
+                               encode_binary_row, get_codec)
+
+# Field bytes as sent by PostgreSQL 16 for COPY ... TO STDOUT (FORMAT binary).
+NUMERICS = [
+    ("0", "0000000000000000"),
+    ("1", "00010000000000000001"),
+    ("-1", "00010000400000000001"),
+    ("0.5", "0001ffff000000011388"),
+    ("123.4500", "0002000000000004007b1194"),
+    ("-98765.4321", "00030001400000040009223d10e1"),
+    ("1E+20", "00010005000000000001"),
+    ("1E-20", "0001fffb000000140001"),
+    ("100000", "0001000100000000000a"),
+    ("0.00001", "0001fffe0000000503e8"),
+    ("12345678901234567890.123456789", "000800040000000904d2162e23340d801ed204d2162e2328"),
+]
+
+def stream(*rows: bytes) -> bytes:
+    return BINARY_HEADER + b"".join(rows) + BINARY_TRAILER
+
+@pytest.mark.parametrize("text, data", NUMERICS)
+def test_numeric_matches_the_server(text, data):
+    codec = get_codec(1700)
+    assert codec.encode(Decimal(text)) == bytes.fromhex(data)
+    decoded = codec.decode(bytes.fromhex(data))
+    assert decoded == Decimal(text)
+    # The scale survives; positive exponents come back as integers, like the server prints them.
+    assert decoded.as_tuple().exponent == min(0, Decimal(text).as_tuple().exponent)
+
+def test_numeric_keeps_its_scale():
+    codec = get_codec(1700)
+    assert str(codec.decode(codec.encode(Decimal("123.4500")))) == "123.4500"
+    assert str(codec.decode(codec.encode(Decimal("-0.000")))) == "0.000"
+
+def test_numeric_with_negative_exponent_has_no_fraction():
+    # 5E+3 has a positive exponent, i.e. a negative scale, which PostgreSQL stores as dscale 0.
+    codec = get_codec(1700)
+    data = codec.encode(Decimal("5E+3"))
+    assert struct.unpack_from("!hhHh", data)[3] == 0
+    assert codec.decode(data) == 5000
+
+def test_negative_zero_is_unsigned():
+    assert get_codec(1700).encode(Decimal("-0")) == bytes.fromhex("0000000000000000")
+
+def test_numeric_nan():
+    codec = get_codec(1700)
+    assert codec.encode(Decimal("NaN")) == bytes.fromhex("00000000c0000000")
+    assert codec.decode(bytes.fromhex("00000000c0000000")).is_nan()
+
+@pytest.mark.parametrize("text, data", [("Infinity", "00000000d0000020"), ("-Infinity", "00000000f0000020")])
+def test_numeric_infinity(text, data):
+    codec = get_codec(1700)
+    assert codec.decode(bytes.fromhex(data)) == Decimal(text)
+    assert codec.encode(Decimal(text))[:6] == bytes.fromhex(data)[:6]
+    assert codec.decode(codec.encode(Decimal(text))) == Decimal(text)
+
+@pytest.mark.parametrize("value", [Decimal(0), Decimal("3.14159"), Decimal("-1E+100"), Decimal("9" * 60 + ".5")])
+def test_numeric_round_trip(value):
+    codec = get_codec(1700)
+    assert codec.decode(codec.encode(value)) == value
+
+def test_timestamp_matches_the_server():
+    codec = get_codec(1114)
+    value = datetime.datetime(2024, 2, 29, 13, 45, 1, 123456)
+    assert codec.encode(value) == bytes.fromhex("0002b5843c0b9380")
+    assert codec.decode(bytes.fromhex("0002b5843c0b9380")) == value
+
+def test_timestamptz_is_utc():
+    codec = get_codec(1184)
+    value = codec.decode(bytes.fromhex("fffffffffff0bdc0"))
+    assert value == datetime.datetime(1999, 12, 31, 23, 59, 59, tzinfo=datetime.timezone.utc)
+    offset = datetime.timezone(datetime.timedelta(hours=2))
+    assert codec.encode(datetime.datetime(2000, 1, 1, 1, 59, 59, tzinfo=offset)) == bytes.fromhex("fffffffffff0bdc0")
+
+def test_date_matches_the_server():
+    codec = get_codec(1082)
+    assert codec.decode(bytes.fromhex("ffffd533")) == datetime.date(1970, 1, 1)
+    assert codec.encode(datetime.date(1970, 1, 1)) == bytes.fromhex("ffffd533")
+
+@pytest.mark.parametrize("oid, data", [(1114, "7fffffffffffffff"), (1184, "8000000000000000"), (1082, "80000000")])
+def test_infinite_timestamps_and_dates_stay_raw(oid, data):
+    value = get_codec(oid).decode(bytes.fromhex(data))
+    assert isinstance(value, RawValue)
+    assert encode_binary_row([value], [oid]) == b"\x00\x01" + struct.pack("!i", len(value)) + bytes.fromhex(data)
+
+def test_jsonb_uuid_bool_and_integers():
+    assert get_codec(3802).decode(bytes.fromhex("017b2261223a20317d")) == '{"a": 1}'
+    assert get_codec(3802).encode('{"a": 1}') == bytes.fromhex("017b2261223a20317d")
+    value = uuid.UUID("12345678-1234-5678-1234-567812345678")
+    assert get_codec(2950).decode(get_codec(2950).encode(value)) == value
+    assert get_codec(16).encode(True) == b"\x01" and get_codec(16).decode(b"\x00") is False
+    assert get_codec(20).decode(get_codec(20).encode(-2 ** 63)) == -2 ** 63
+
+@pytest.mark.parametrize("oid, data", [
+    (1007, "000000010000000000000017000000020000000100000004000000010000000400000002"),  # int4[] {1,2}
+    (1186, "00000001ad2748000000000100000000"),  # interval '1 day 02:00'
+])
+def test_types_without_codec_survive_as_raw_values(oid, data):
+    field = bytes.fromhex(data)
+    row = b"\x00\x01" + struct.pack("!i", len(field)) + field
+    decoded = BinaryCopyDecoder([oid]).feed(stream(row))
+    assert decoded == [[RawValue(field)]]
+    assert isinstance(decoded[0][0], RawValue)
+    assert encode_binary_row(decoded[0], [oid]) == row
+
+def test_encoding_a_value_of_a_type_without_codec_fails():
+    with pytest.raises(ValueError):
+        encode_binary_row([[1, 2]], [1007])
+
+ROWS = [[1, "alpha", None, Decimal("1.50")], [2, "", datetime.date(2024, 1, 1), Decimal("-7")], [3, "é" * 300, None, None]]
+OIDS = [23, 25, 1082, 1700]
+
+def encoded_stream(rows=ROWS):
+    return stream(*(encode_binary_row(row, OIDS) for row in rows))
+
+def test_decoder_handles_any_split():
+    data = encoded_stream()
+    for size in (1, 2, 3, 7, 19, 64, len(data)):
+        decoder = BinaryCopyDecoder(OIDS)
+        rows = []
+        for offset in range(0, len(data), size):
+            rows.extend(decoder.feed(data[offset:offset + size]))
+        assert rows == ROWS
+        assert decoder.finished
+
+def test_decoder_skips_the_header_extension():
+    header = BINARY_HEADER[:-4] + struct.pack("!i", 3) + b"ext"
+    data = header + encoded_stream()[len(BINARY_HEADER):]
+    assert BinaryCopyDecoder(OIDS).feed(data) == ROWS
+
+def test_decoder_rejects_text_streams():
+    with pytest.raises(ValueError):
+        BinaryCopyDecoder(OIDS).feed(b"1\talpha\t\\N\t1.50\n" * 2)
+
+def test_transformer_rewrites_and_drops_rows():
+    def transform(row):
+        if row[0] == 2:
+            return None
+        return [row[0] * 10, row[1].upper(), row[2], row[3]]
+
+    data = encoded_stream()
+    transformer = BinaryCopyTransformer(OIDS, transform)
+    output = b"".join(transformer.feed(data[offset:offset + 5]) for offset in range(0, len(data), 5))
+    output += transformer.finish()
+    assert output.startswith(BINARY_HEADER) and output.endswith(BINARY_TRAILER)
+    expected = [[10, "ALPHA", None, Decimal("1.50")], [30, "É" * 300, None, None]]
+    assert BinaryCopyDecoder(OIDS).feed(output) == expected
+    assert output == encoded_stream(expected)
+
+def test_transformer_leaves_out_the_trailer_of_an_incomplete_stream():
+    transformer = BinaryCopyTransformer(OIDS, lambda row: row)
+    output = transformer.feed(encoded_stream()[:-2]) + transformer.finish()
+    assert output == encoded_stream()[:-len(BINARY_TRAILER)]
@@ -0,0 +1,59 @@
+import asyncio
+import re
+from contextlib import asynccontextmanager
+
+import pytest
+
+from utils.database import DatabaseUtility
+
+def collation_order(name):
+    """Sorts like a linguistic collation such as en_US: case and punctuation only break ties."""
+    return re.sub(r"[^a-z0-9]", "", name.lower()), name
+
+class IndexedDatabase(DatabaseUtility):
+    """Answers has_unique_key's catalog query for one unique index, sorting like the server would."""
+
+    def __init__(self, index_columns):
+        super().__init__({"host": "localhost", "port": 5432, "dbname": "db"})
+        self.index_columns = index_columns
+
+    async def execute_query(self, query, params=None, conn=None):
+        if 'ORDER BY a.attname::text COLLATE "C"' in query:
+            aggregated = sorted(self.index_columns)
+        else:
+            aggregated = sorted(self.index_columns, key=collation_order)
+        return [[aggregated == params[1]]]
+
+@pytest.mark.parametrize("key_columns", [["Account_id", "account", "Zone"], ["user_id", "UserName"]])
+def test_unique_key_lookup_does_not_depend_on_the_collation(key_columns):
+    db = IndexedDatabase(list(reversed(key_columns)))
+    assert asyncio.run(db.has_unique_key("t", key_columns))
+    assert not asyncio.run(db.has_unique_key("t", key_columns[:1]))
+
+class CatalogBackend:
+    """Returns canned rows for every fetch and records the parameters it was given."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = []
+
+    async def fetch(self, conn, query, params=None):
+        self.params.append(params)
+        return self.rows
+
+class OneConnectionPool:
+    @asynccontextmanager
+    async def connection(self):
+        yield object()
+
+def fingerprint(rows, schema="public"):
+    db = DatabaseUtility({"host": "localhost", "port": 5432, "dbname": "db"})
+    db.backend, db.pool = CatalogBackend(rows), OneConnectionPool()
+    return asyncio.run(db.get_catalog_fingerprint(schema)), db.backend.params
+
+def test_catalog_fingerprint_of_a_schema():
+    assert fingerprint([["0cc175b9"]], "sales") == ("0cc175b9", [("sales",)])
+
+def test_catalog_fingerprint_of_a_missing_schema_is_empty():
+    # Never equal to the md5 of an existing schema, so a cached model of it is not reused.
+    assert fingerprint([]) == ("", [("public",)])
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import re
+
+import pytest
+
+from diff_engine import DiffEngine
+
+COLUMNS = [{"name": "id", "type": "bigint", "primary_key": 1}, {"name": "v", "type": "text", "primary_key": None}]
+CONDITION = re.compile(r'"id" (<|>=) %s::bigint')
+
+def in_range(where, params, key):
+    """Evaluates a range condition built by the diff engine, nested or not, for one key."""
+    if not where:
+        return True
+    operators = CONDITION.findall(where)
+    assert len(operators) == len(params)
+    return all(key < int(bound) if op == "<" else key >= int(bound) for op, bound in zip(operators, params))
+
+class RangeDatabase:
+    """Checksums key ranges of an in-memory table and records the statistics and quantiles asked for."""
+
+    def __init__(self, rows, histogram=()):
+        self.rows = dict(rows)
+        self.histogram = [str(bound) for bound in histogram]
+        self.checksums = 0
+        self.quantiles = []
+
+    def keys(self, where, params):
+        return sorted(key for key in self.rows if in_range(where, params or (), key))
+
+    async def get_range_checksum(self, table_name, columns, where=None, params=None, snapshot=None):
+        self.checksums += 1
+        keys = self.keys(where, params)
+        digest = hashlib.md5(repr([(key, self.rows[key]) for key in keys]).encode()).hexdigest()
+        return len(keys), digest
+
+    async def get_histogram_bounds(self, table_name, column):
+        return self.histogram
+
+    async def get_key_quantiles(self, table_name, column, count, where=None, params=None, snapshot=None):
+        self.quantiles.append((where, params))
+        keys = self.keys(where, params)
+        bounds = [str(keys[i * len(keys) // count]) for i in range(1, count)] if keys else []
+        return list(dict.fromkeys(bounds))
+
+def table(count):
+    return {key: f"row {key}" for key in range(count)}
+
+def diff(source, target, **settings):
+    engine = DiffEngine(source, target, **settings)
+    return asyncio.run(engine.changed_ranges("t", "t", COLUMNS))
+
+def covered(ranges, key):
+    return sum(in_range(chunk.where, chunk.params, key) for chunk in ranges)
+
+def test_equal_tables_need_one_comparison():
+    source, target = RangeDatabase(table(1000)), RangeDatabase(table(1000))
+    assert diff(source, target, leaf_rows=10) == []
+    assert source.checksums == target.checksums == 1
+
+def test_a_changed_row_narrows_down_to_a_leaf_range():
+    source, target = RangeDatabase(table(1000), histogram=range(0, 1001, 10)), RangeDatabase(table(1000))
+    target.rows[637] = "stale"
+    ranges = diff(source, target, fanout=4, leaf_rows=10)
+    assert covered(ranges, 637) == 1
+    assert sum(len(source.keys(chunk.where, chunk.params)) for chunk in ranges) <= 10
+    assert all(covered(ranges, key) == 0 for key in range(1000) if abs(key - 637) > 10)
+
+def test_every_difference_is_covered_by_exactly_one_range():
+    source, target = RangeDatabase(table(2000), histogram=range(0, 2000, 50)), RangeDatabase(table(2000))
+    changed = {3, 500, 1001, 1999}
+    for key in changed:
+        target.rows[key] = "stale"
+    del target.rows[750]
+    target.rows[5000] = "only on the target"
+    target.rows[-5] = "only on the target"
+    ranges = diff(source, target, fanout=8, leaf_rows=20)
+    for key in changed | {750, 5000, -5}:
+        assert covered(ranges, key) == 1, key
+    for key in range(2000):
+        assert covered(ranges, key) <= 1
+
+def test_keys_on_split_points_fall_into_the_upper_range():
+    # The histogram splits at 250, 500 and 750; the changed rows sit exactly on those bounds.
+    source, target = RangeDatabase(table(1000), histogram=[0, 250, 500, 750, 999]), RangeDatabase(table(1000))
+    for key in (250, 500, 750):
+        target.rows[key] = "stale"
+    ranges = diff(source, target, fanout=4, leaf_rows=5, max_depth=1)
+    assert [chunk.params for chunk in ranges] == [("250", "500"), ("500", "750"), ("750",)]
+    for key in (250, 500, 750):
+        assert covered(ranges, key) == 1
+
+def test_a_side_without_rows_is_copied_whole():
+    source, target = RangeDatabase(table(1000), histogram=range(0, 1001, 10)), RangeDatabase({})
+    ranges = diff(source, target, leaf_rows=10)
+    assert [(chunk.where, chunk.params) for chunk in ranges] == [(None, ())]
+    assert source.checksums == 1 and not source.quantiles
+
+def test_empty_sub_ranges_on_one_side_are_not_split_further():
+    # The target lost every row from 500 on: those ranges are empty there and are copied as they are.
+    source, target = RangeDatabase(table(1000), histogram=range(0, 1001, 10)), RangeDatabase(table(500))
+    ranges = diff(source, target, fanout=4, leaf_rows=10)
+    assert all(covered(ranges, key) == 1 for key in range(500, 1000))
+    assert all(covered(ranges, key) == 0 for key in range(500))
+    assert len(ranges) == 2
+
+def test_histogram_splits_the_first_level_and_quantiles_the_rest():
+    source, target = RangeDatabase(table(1000), histogram=range(0, 1001, 10)), RangeDatabase(table(1000))
+    target.rows[637] = "stale"
+    diff(source, target, fanout=4, leaf_rows=10)
+    # The histogram splits at 250, 500 and 750, so the first quantiles are those of [500, 750).
+    first_where, first_params = source.quantiles[0]
+    assert first_params == ("500", "750")
+    assert all(in_range(where, params, 637) for where, params in source.quantiles)
+
+@pytest.mark.parametrize("histogram", [[], [0, 999]])
+def test_without_a_usable_histogram_the_first_level_uses_quantiles(histogram):
+    source, target = RangeDatabase(table(1000), histogram=histogram), RangeDatabase(table(1000))
+    target.rows[10] = "stale"
+    ranges = diff(source, target, fanout=4, leaf_rows=10)
+    assert source.quantiles[0] == (None, None)
+    assert covered(ranges, 10) == 1
+
+def test_ranges_stop_splitting_at_max_depth():
+    source, target = RangeDatabase(table(1000), histogram=range(0, 1001, 10)), RangeDatabase(table(1000))
+    target.rows[637] = "stale"
+    [chunk] = diff(source, target, fanout=4, leaf_rows=10, max_depth=1)
+    assert chunk.params == ("500", "750")
+
+def test_a_range_that_cannot_be_split_is_copied_whole():
+    # No quantiles come back, as for a range of duplicate leading key values, so there is nothing to split at.
+    source, target = RangeDatabase({7: "a", 8: "b"}), RangeDatabase({7: "a", 8: "c"})
+
+    async def no_quantiles(*args, **kwargs):
+        return []
+
+    source.get_key_quantiles = no_quantiles
+    assert [(chunk.where, chunk.params) for chunk in diff(source, target, leaf_rows=1)] == [(None, ())]
+
+def test_fanout_is_at_least_two():
+    assert DiffEngine(None, None, fanout=1).fanout == 2
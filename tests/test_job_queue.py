@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from job_queue import JobQueue, QueueFullError
+from scheduler import SyncScheduler
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_jobs_run_one_at_a_time_in_order():
+    async def main():
+        order = []
+        async def run(job):
+            job.start()
+            order.append(job.tables)
+            await asyncio.sleep(0.01)
+        queue = JobQueue(run)
+        queue.start()
+        jobs = [queue.submit(["a"])[0], queue.submit(["b"])[0], queue.submit()[0]]
+        await queue._queue.join()
+        await queue.stop()
+        return order, jobs
+    order, jobs = asyncio.run(main())
+    assert order == [["a"], ["b"], None]
+    assert [job.status for job in jobs] == ["succeeded"] * 3
+    assert all(job.submitted_at <= job.started_at <= job.finished_at for job in jobs)
+
+def test_requests_for_the_same_tables_are_coalesced():
+    async def main():
+        release = asyncio.Event()
+        async def run(job):
+            job.start()
+            await release.wait()
+        queue = JobQueue(run)
+        queue.start()
+        running, _ = queue.submit(["b", "a"])
+        await settle()
+        assert running.status == "running"
+        results = [queue.submit(["a", "b", "a"]), queue.submit(["c"]), queue.submit(["c"]), queue.submit(), queue.submit([])]
+        release.set()
+        await queue._queue.join()
+        # A finished job is not reused.
+        after, queued = queue.submit(["a", "b"])
+        await queue.stop()
+        return running, results, after, queued
+    running, results, after, queued = asyncio.run(main())
+    assert results[0] == (running, False)
+    assert results[1][1] and results[2] == (results[1][0], False)
+    assert results[3][1] and results[4] == (results[3][0], False)
+    assert queued and after is not running
+
+def test_a_full_queue_rejects_new_jobs():
+    async def main():
+        release = asyncio.Event()
+        async def run(job):
+            job.start()
+            await release.wait()
+        queue = JobQueue(run, max_queued=2)
+        queue.start()
+        queue.submit(["running"])
+        await settle()
+        queue.submit(["a"])
+        queue.submit(["b"])
+        with pytest.raises(QueueFullError):
+            queue.submit(["c"])
+        # Coalescing still works when the queue is full, and a rejected job is not tracked.
+        assert not queue.submit(["a"])[1]
+        assert len(queue.jobs) == 3
+        release.set()
+        await queue._queue.join()
+        assert queue.submit(["c"])[1]
+        await queue.stop()
+    asyncio.run(main())
+
+def test_failures_are_recorded_and_the_worker_continues():
+    async def main():
+        async def run(job):
+            job.start()
+            if job.tables == ["bad"]:
+                raise RuntimeError("relation does not exist")
+        queue = JobQueue(run)
+        queue.start()
+        bad, _ = queue.submit(["bad"])
+        good, _ = queue.submit(["good"])
+        await queue._queue.join()
+        await queue.stop()
+        return bad, good
+    bad, good = asyncio.run(main())
+    assert (bad.status, bad.error) == ("failed", "relation does not exist")
+    assert (good.status, good.error) == ("succeeded", None)
+
+def test_history_keeps_the_latest_finished_jobs():
+    async def main():
+        async def run(job):
+            job.start()
+        queue = JobQueue(run, history=2)
+        queue.start()
+        ids = []
+        for table in "abcde":
+            ids.append(queue.submit([table])[0].id)
+            await queue._queue.join()
+        await queue.stop()
+        return queue, ids
+    queue, ids = asyncio.run(main())
+    # Pruning happens on submit, so the last job joins the two kept before it.
+    assert list(queue.jobs) == ids[2:]
+    assert queue.get(ids[0]) is None
+    assert queue.get(ids[-1]).status == "succeeded"
+
+def test_jobs_wait_for_a_scheduled_run_before_running():
+    async def main():
+        scheduler = SyncScheduler(lambda: asyncio.sleep(0))
+        release = asyncio.Event()
+        scheduled = asyncio.create_task(scheduler.run_once("schedule", release.wait))
+        await settle()
+
+        async def run(job):
+            async def sync():
+                job.start()
+            await scheduler.run_once(f"job {job.id}", sync)
+        queue = JobQueue(run)
+        queue.start()
+        job, _ = queue.submit()
+        await settle()
+        waiting = job.to_dict()
+        release.set()
+        await scheduled
+        await queue._queue.join()
+        await queue.stop()
+        return waiting, job
+    waiting, job = asyncio.run(main())
+    assert waiting["status"] == "waiting"
+    assert waiting["started_at"] is None and "tables" not in waiting
+    assert job.status == "succeeded" and job.started_at is not None
+
+def test_stop_cancels_the_running_job():
+    async def main():
+        async def run(job):
+            job.start()
+            await asyncio.sleep(60)
+        queue = JobQueue(run)
+        queue.start()
+        job, _ = queue.submit()
+        await settle()
+        await queue.stop()
+        return job
+    job = asyncio.run(main())
+    assert (job.status, job.error) == ("failed", "cancelled")
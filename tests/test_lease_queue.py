@@ -0,0 +1,294 @@
+import asyncio
+
+import pytest
+
+from lease_queue import CHUNKS_TABLE, LeaseLostError, LeaseQueue
+from models.chunk import TableChunk
+from sync_worker import SyncWorker
+
+class Transaction:
+    """A target connection whose changes are applied on commit and dropped on rollback."""
+
+    def __init__(self):
+        self.changes = []
+
+class LeaseTarget:
+    """
+    Keeps the run and chunk tables of LeaseQueue in memory, applying each of its statements
+    the way the SQL does, with a clock the tests move by hand.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.runs = {}
+        self.chunks = {}
+        self.next_id = 1
+
+    async def execute_query(self, query, params=None, conn=None):
+        statement = " ".join(query.split())
+        if statement.startswith(("CREATE", "DELETE FROM pg_db_sync_runs WHERE expires_at")):
+            return []
+        if statement.startswith("INSERT INTO pg_db_sync_runs"):
+            run_id, snapshot, seconds = params
+            self.runs[run_id] = {"snapshot": snapshot, "expires_at": self.now + seconds}
+        elif statement.startswith("UPDATE pg_db_sync_runs"):
+            seconds, run_id = params
+            self.runs[run_id]["expires_at"] = self.now + seconds
+        elif statement.startswith("DELETE FROM pg_db_sync_runs"):
+            self.runs.pop(params[0], None)
+            self.chunks = {id: chunk for id, chunk in self.chunks.items() if chunk["run_id"] != params[0]}
+        elif "CASE WHEN attempts" in statement:
+            max_attempts, error, id, attempt = params
+            chunk = self.chunks[id]
+            if chunk["attempts"] == attempt and chunk["status"] == "leased":
+                chunk.update(status="pending" if chunk["attempts"] < max_attempts else "failed",
+                             lease_expires_at=None, error=error)
+        elif "'lease expired'" in statement:
+            run_id, max_attempts = params
+            for chunk in self.chunks.values():
+                if (chunk["run_id"] == run_id and chunk["status"] == "leased" and chunk["lease_expires_at"] < self.now
+                        and chunk["attempts"] >= max_attempts):
+                    chunk.update(status="failed", error=f"{chunk['error'] or 'lease expired'} (attempt {chunk['attempts']})")
+        elif statement.startswith("SELECT source_table"):
+            return self._poll(params[0])
+        else:
+            raise AssertionError(f"Unexpected statement: {statement}")
+        return []
+
+    async def insert_data(self, table_name, data, batch_size=1000, conflict_columns=None, commit=True, conn=None):
+        assert table_name == CHUNKS_TABLE
+        for row in data:
+            self.chunks[self.next_id] = dict(row, id=self.next_id, status="pending", worker=None, attempts=0,
+                                             lease_expires_at=None, rows_written=None, error=None)
+            self.next_id += 1
+        return len(data)
+
+    async def execute_returning(self, query, params=None, commit=True, conn=None):
+        statement = " ".join(query.split())
+        if "SET status = 'leased'" in statement:
+            return self._claim(*params)
+        if statement.startswith(f"UPDATE {CHUNKS_TABLE} SET lease_expires_at"):
+            seconds, id, attempt = params
+            chunk = self.chunks.get(id)
+            if chunk is None or chunk["attempts"] != attempt or chunk["status"] != "leased":
+                return []
+            chunk["lease_expires_at"] = self.now + seconds
+            return [{"id": id}]
+        if "SET status = 'done'" in statement:
+            rows, id, attempt = params
+            chunk = self.chunks.get(id)
+            if chunk is None or chunk["attempts"] != attempt or chunk["status"] != "leased":
+                return []
+            change = dict(status="done", rows_written=rows, lease_expires_at=None, error=None)
+            if conn is None:
+                chunk.update(change)
+            else:
+                assert not commit
+                conn.changes.append((chunk, change))
+            return [{"id": id}]
+        raise AssertionError(f"Unexpected statement: {statement}")
+
+    async def commit(self, conn):
+        for chunk, change in conn.changes:
+            chunk.update(change)
+        conn.changes.clear()
+
+    async def rollback(self, conn):
+        conn.changes.clear()
+
+    def _claim(self, worker, seconds, *rest):
+        run_id, max_attempts = rest if len(rest) == 2 else (None, rest[0])
+        candidates = [chunk for chunk in self.chunks.values()
+                      if self.runs[chunk["run_id"]]["expires_at"] > self.now
+                      and (run_id is None or chunk["run_id"] == run_id)
+                      and (chunk["status"] == "pending"
+                           or (chunk["status"] == "leased" and chunk["lease_expires_at"] < self.now))
+                      and chunk["attempts"] < max_attempts]
+        if not candidates:
+            return []
+        chunk = min(candidates, key=lambda chunk: (-chunk["priority"], chunk["id"]))
+        chunk.update(status="leased", worker=worker, attempts=chunk["attempts"] + 1,
+                     lease_expires_at=self.now + seconds)
+        return [dict(chunk, snapshot=self.runs[chunk["run_id"]]["snapshot"])]
+
+    def _poll(self, run_id):
+        tables = {}
+        for chunk in self.chunks.values():
+            if chunk["run_id"] != run_id:
+                continue
+            state = tables.setdefault((chunk["source_table"], chunk["target_table"]), {
+                "source_table": chunk["source_table"], "target_table": chunk["target_table"], "open": 0,
+                "leased": 0, "attempts": 0, "failed": 0, "rows_written": 0, "error": None})
+            state["open"] += chunk["status"] in ("pending", "leased")
+            state["leased"] += chunk["status"] == "leased"
+            state["attempts"] += chunk["attempts"]
+            state["failed"] += chunk["status"] == "failed"
+            state["rows_written"] += chunk["rows_written"] or 0 if chunk["status"] == "done" else 0
+            if chunk["status"] == "failed":
+                state["error"] = max(filter(None, (state["error"], chunk["error"])))
+        return list(tables.values())
+
+COLUMNS = [{"name": "id", "type": "integer", "primary_key": 1}]
+
+def queue_with_chunks(target, chunks=2, priorities=None, **settings):
+    async def main():
+        queue = LeaseQueue(target, lease_seconds=10, **settings)
+        run_id = await queue.create_run("snap-1")
+        for i, priority in enumerate(priorities or [0] * chunks):
+            await queue.add_chunks(run_id, f"t{i}", f"t{i}", COLUMNS, [TableChunk('"id" < %s', (i,), f"id < {i}")],
+                                   ["id"], priority=priority)
+        return queue, run_id
+    return asyncio.run(main())
+
+def test_claims_take_distinct_chunks_largest_table_first():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, priorities=[1, 5, 3])
+    leases = [asyncio.run(queue.claim(f"w{i}")) for i in range(4)]
+    assert [lease.source_table for lease in leases[:3]] == ["t1", "t2", "t0"]
+    assert leases[3] is None
+    lease = leases[0]
+    assert (lease.run_id, lease.attempt, lease.snapshot, lease.key_columns) == (run_id, 1, "snap-1", ["id"])
+    assert lease.chunk.params == (1,) and lease.columns == COLUMNS
+
+def test_chunks_of_an_expired_run_are_not_claimed():
+    target = LeaseTarget()
+    queue, _ = queue_with_chunks(target)
+    target.now += 11
+    assert asyncio.run(queue.claim("w")) is None
+
+def test_heartbeat_keeps_a_lease_from_being_reclaimed():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, chunks=1)
+    lease = asyncio.run(queue.claim("w1"))
+    for _ in range(3):
+        target.now += 8
+        asyncio.run(queue.renew_run(run_id))
+        assert asyncio.run(queue.heartbeat(lease))
+        assert asyncio.run(queue.claim("w2")) is None
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_loses_it():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, chunks=1)
+    first = asyncio.run(queue.claim("w1"))
+    target.now += 11
+    asyncio.run(queue.renew_run(run_id))
+    second = asyncio.run(queue.claim("w2"))
+    assert second.id == first.id and second.attempt == 2
+    assert not asyncio.run(queue.heartbeat(first))
+    with pytest.raises(LeaseLostError):
+        asyncio.run(queue.complete(first, 10))
+    asyncio.run(queue.complete(second, 10))
+    assert target.chunks[first.id]["status"] == "done" and target.chunks[first.id]["rows_written"] == 10
+
+def test_completion_is_part_of_the_copy_transaction():
+    target = LeaseTarget()
+    queue, _ = queue_with_chunks(target, chunks=1)
+    lease = asyncio.run(queue.claim("w1"))
+    conn = Transaction()
+    asyncio.run(queue.complete(lease, 5, conn))
+    assert target.chunks[lease.id]["status"] == "leased"
+    asyncio.run(target.rollback(conn))
+    assert target.chunks[lease.id]["status"] == "leased"
+    asyncio.run(queue.complete(lease, 5, conn))
+    asyncio.run(target.commit(conn))
+    assert target.chunks[lease.id]["status"] == "done"
+
+def test_failed_chunks_are_retried_until_max_attempts():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, chunks=1, max_attempts=2)
+    for attempt, status in ((1, "pending"), (2, "failed")):
+        lease = asyncio.run(queue.claim("w"))
+        assert lease.attempt == attempt
+        asyncio.run(queue.fail(lease, RuntimeError("boom")))
+        assert target.chunks[lease.id]["status"] == status
+    assert asyncio.run(queue.claim("w")) is None
+    state = asyncio.run(queue.poll(run_id))[("t0", "t0")]
+    assert (state["open"], state["failed"], state["error"]) == (0, 1, "boom")
+
+def test_poll_fails_chunks_whose_last_lease_expired():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, chunks=1, max_attempts=1)
+    asyncio.run(queue.claim("w"))
+    target.now += 11
+    state = asyncio.run(queue.poll(run_id))[("t0", "t0")]
+    assert (state["open"], state["failed"], state["error"]) == (0, 1, "lease expired (attempt 1)")
+
+class ChunkCopier:
+    """Stands in for SyncManager.sync_chunk, committing through on_complete like a COPY transaction."""
+
+    def __init__(self, target, error=None, before_complete=None):
+        self.target = target
+        self.error = error
+        self.before_complete = before_complete
+
+    async def sync_chunk(self, source_table, target_table, columns, chunk, key_columns=None, replace=False,
+                         snapshot=None, on_complete=None):
+        if self.error is not None:
+            raise self.error
+        conn = Transaction()
+        try:
+            if self.before_complete is not None:
+                await self.before_complete()
+            await on_complete(conn, 3)
+            await self.target.commit(conn)
+        except BaseException:
+            await self.target.rollback(conn)
+            raise
+        return 3
+
+def process(target, queue, copier):
+    worker = SyncWorker(queue, copier)
+    lease = asyncio.run(queue.claim(worker.worker_id))
+    asyncio.run(worker.process(lease))
+    return worker, target.chunks[lease.id]
+
+def test_worker_marks_its_chunk_done():
+    target = LeaseTarget()
+    queue, _ = queue_with_chunks(target, chunks=1)
+    worker, chunk = process(target, queue, ChunkCopier(target))
+    assert (chunk["status"], chunk["rows_written"], worker.chunks_done) == ("done", 3, 1)
+
+def test_worker_releases_a_failed_chunk_for_another_attempt():
+    target = LeaseTarget()
+    queue, _ = queue_with_chunks(target, chunks=1)
+    worker, chunk = process(target, queue, ChunkCopier(target, error=RuntimeError("copy failed")))
+    assert (chunk["status"], chunk["error"], worker.chunks_done) == ("pending", "copy failed", 0)
+
+def test_worker_discards_a_chunk_whose_lease_was_taken_over():
+    target = LeaseTarget()
+    queue, run_id = queue_with_chunks(target, chunks=1)
+
+    async def taken_over():
+        target.now += 11
+        await queue.renew_run(run_id)
+        await queue.claim("other")
+
+    worker, chunk = process(target, queue, ChunkCopier(target, before_complete=taken_over))
+    # Neither done nor released: the new holder's attempt is left alone.
+    assert (chunk["status"], chunk["worker"], chunk["attempts"], worker.chunks_done) == ("leased", "other", 2, 0)
+
+def test_distributed_run_copies_through_a_worker():
+    async def main():
+        target = LeaseTarget()
+        queue = LeaseQueue(target, poll_interval=0.01, heartbeat_interval=0.01)
+        async with queue.run("snap") as run:
+            worker = SyncWorker(queue, ChunkCopier(target), run_id=run.run_id)
+            task = asyncio.create_task(worker.run())
+            rows = await asyncio.wait_for(run.copy("t", "t", COLUMNS, [TableChunk(), TableChunk()]), 5)
+            worker.stop()
+            await task
+        return rows, target.runs
+    rows, runs = asyncio.run(main())
+    assert rows == 6 and runs == {}
+
+def test_distributed_run_fails_tables_nobody_claims():
+    async def main():
+        target = LeaseTarget()
+        queue = LeaseQueue(target, poll_interval=0.01, claim_timeout=0.05)
+        async with queue.run() as run:
+            with pytest.raises(Exception, match="No worker claimed a chunk"):
+                await asyncio.wait_for(run.copy("t", "t", COLUMNS, [TableChunk()]), 5)
+            # Tables queued afterwards fail right away.
+            with pytest.raises(Exception, match="No worker claimed a chunk"):
+                await run.copy("u", "u", COLUMNS, [TableChunk()])
+    asyncio.run(main())
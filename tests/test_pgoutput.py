@@ -0,0 +1,108 @@
+import contextlib
+
+import psycopg2.extras
+
+from pgoutput_messages import begin, commit, delete, insert, relation, truncate, update
+from replication import ChangeApplier
+from utils.pgoutput import Begin, Change, Commit, PgOutputDecoder, Relation, Truncate
+
+RELID = 16384
+
+def decode(message):
+    return PgOutputDecoder().decode(message)
+
+def test_begin():
+    message = decode(begin(0x16B374D848, 725000000000000, 771))
+    assert isinstance(message, Begin)
+    assert (message.final_lsn, message.commit_time, message.xid) == (0x16B374D848, 725000000000000, 771)
+
+def test_commit():
+    message = decode(commit(0x16B374D848, 0x16B374D878, 725000000000000))
+    assert isinstance(message, Commit)
+    assert (message.commit_lsn, message.end_lsn, message.commit_time) == (0x16B374D848, 0x16B374D878, 725000000000000)
+
+def test_relation():
+    message = decode(relation(RELID, "public", "orders", "d", [("id", 20, True), ("note", 25, False)]))
+    assert isinstance(message, Relation)
+    assert (message.relid, message.namespace, message.name, message.replica_identity) == (RELID, "public", "orders", "d")
+    assert message.columns == [
+        {"name": "id", "type_oid": 20, "type_modifier": -1, "key": True},
+        {"name": "note", "type_oid": 25, "type_modifier": -1, "key": False},
+    ]
+    assert message.key_columns == ["id"]
+
+def test_insert():
+    message = decode(insert(RELID, ["1", None, "héllo"]))
+    assert isinstance(message, Change)
+    assert (message.kind, message.relid, message.old_tuple) == ("insert", RELID, None)
+    assert message.new_tuple == [("t", "1"), ("n", None), ("t", "héllo")]
+
+def test_update_without_old_tuple():
+    message = decode(update(RELID, ["1", "u"]))
+    assert (message.kind, message.old_tuple, message.old_key_only) == ("update", None, False)
+    assert message.new_tuple == [("t", "1"), ("u", None)]
+
+def test_update_with_key_only_old_tuple():
+    message = decode(update(RELID, ["2", "x"], old=["1", None], old_kind="K"))
+    assert message.old_key_only
+    assert message.old_tuple == [("t", "1"), ("n", None)]
+    assert message.new_tuple == [("t", "2"), ("t", "x")]
+
+def test_update_with_full_old_tuple():
+    message = decode(update(RELID, ["1", "y"], old=["1", "x"], old_kind="O"))
+    assert not message.old_key_only
+    assert message.old_tuple == [("t", "1"), ("t", "x")]
+
+def test_delete():
+    key_only = decode(delete(RELID, ["1", None], old_kind="K"))
+    full = decode(delete(RELID, ["1", "x"], old_kind="O"))
+    assert (key_only.kind, key_only.new_tuple, key_only.old_key_only) == ("delete", None, True)
+    assert (full.old_tuple, full.old_key_only) == ([("t", "1"), ("t", "x")], False)
+
+def test_truncate():
+    message = decode(truncate([RELID, RELID + 1], cascade=True, restart_identity=True))
+    assert isinstance(message, Truncate)
+    assert (message.relids, message.cascade, message.restart_identity) == ([RELID, RELID + 1], True, True)
+    assert decode(truncate([RELID])).cascade is False
+
+def test_messages_without_effect_decode_to_none():
+    assert decode(b"O" + b"\0" * 8 + b"origin\0") is None
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return contextlib.nullcontext(self)
+
+    def commit(self):
+        self.commits += 1
+
+def apply(monkeypatch, messages, table_mapping=None):
+    conn = FakeConnection()
+    monkeypatch.setattr(psycopg2.extras, "execute_batch",
+                        lambda cursor, query, params: cursor.executed.extend((query, tuple(p)) for p in params))
+    applier = ChangeApplier(conn, table_mapping or {"orders": "orders_copy"})
+    decoder = PgOutputDecoder()
+    return conn, [applier.handle(decoder.decode(message)) for message in messages]
+
+def test_transaction_is_applied_and_committed_once(monkeypatch):
+    columns = [("id", 20, True), ("note", 25, False)]
+    conn, results = apply(monkeypatch, [
+        begin(100, 0, 1), relation(RELID, "public", "orders", "d", columns), insert(RELID, ["1", "a"]),
+        delete(RELID, ["1", None]), truncate([RELID]), commit(100, 120, 0),
+    ])
+    assert results == [None, None, None, None, None, 120]
+    assert conn.commits == 1
+    assert [query.split(" ")[0] for query, _ in conn.executed] == ["INSERT", "DELETE", "TRUNCATE"]
+    assert conn.executed[-1] == ('TRUNCATE TABLE "orders_copy"', ())
+
+def test_unmapped_and_other_schema_tables_are_ignored(monkeypatch):
+    columns = [("id", 20, True)]
+    conn, results = apply(monkeypatch, [
+        begin(100, 0, 1), relation(RELID, "public", "other", "d", columns), insert(RELID, ["1"]),
+        relation(RELID + 1, "audit", "orders", "d", columns), insert(RELID + 1, ["1"]), commit(100, 120, 0),
+    ])
+    assert conn.executed == []
+    assert results[-1] == 120
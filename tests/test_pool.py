@@ -0,0 +1,222 @@
+import asyncio
+
+import psycopg2.extensions
+import pytest
+
+from utils import pool as pool_module
+from utils.pool import ConnectionPool
+
+class FakeConnection:
+    """The parts of a psycopg2 connection the pool uses, with a switch to break it."""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.in_transaction = False
+        self.fail_rollback = False
+        self.pings = 0
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        if self.in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.pings += 1
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.in_transaction = True
+
+class Connections(list):
+    """The connections psycopg2.connect opened, in order, and the patched connect itself."""
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Patches psycopg2.connect to open FakeConnections; set connect.fail_next to make the next one fail."""
+    opened = Connections()
+
+    def connect(**params):
+        if getattr(connect, "fail_next", False):
+            connect.fail_next = False
+            raise psycopg2.OperationalError("could not connect to server")
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(pool_module.psycopg2, "connect", connect)
+    opened.connect = connect
+    return opened
+
+def make_pool(**settings):
+    return ConnectionPool({"dbname": "db"}, **settings)
+
+def test_invalid_sizes_are_rejected():
+    for sizes in ({"min_size": -1}, {"max_size": 0}, {"min_size": 3, "max_size": 2}):
+        with pytest.raises(ValueError):
+            make_pool(**sizes)
+
+def test_open_fills_the_pool_up_to_min_size(connections):
+    pool = make_pool(min_size=2, max_size=4)
+    asyncio.run(pool.open())
+    assert len(connections) == 2
+    assert pool.stats() == {"size": 2, "idle": 2, "in_use": 0}
+
+def test_acquire_waits_for_a_release_beyond_max_size(connections):
+    pool = make_pool(min_size=0, max_size=2)
+
+    async def main():
+        first, second = await pool.acquire(), await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.05)
+        blocked = not waiter.done()
+        await pool.release(first)
+        third = await asyncio.wait_for(waiter, 5)
+        return blocked, first, third
+    blocked, first, third = asyncio.run(main())
+    assert blocked and third is first
+    assert len(connections) == 2
+
+def test_released_connections_are_reused_most_recent_first(connections):
+    pool = make_pool(min_size=0)
+
+    async def main():
+        first, second = await pool.acquire(), await pool.acquire()
+        await pool.release(first)
+        await pool.release(second)
+        return second, await pool.acquire()
+    second, reused = asyncio.run(main())
+    assert reused is second and len(connections) == 2
+
+def test_release_rolls_back_an_open_transaction(connections):
+    pool = make_pool(min_size=0)
+
+    async def main():
+        async with pool.connection() as conn:
+            conn.in_transaction = True
+        async with pool.connection() as again:
+            return conn, again
+    conn, again = asyncio.run(main())
+    assert again is conn and conn.rollbacks == 1 and not conn.in_transaction
+
+def test_connection_whose_rollback_fails_is_closed(connections):
+    pool = make_pool(min_size=0)
+
+    async def main():
+        async with pool.connection() as conn:
+            conn.in_transaction = conn.fail_rollback = True
+        async with pool.connection() as again:
+            return conn, again
+    conn, again = asyncio.run(main())
+    assert conn.closed and again is not conn
+    assert pool.stats()["size"] == 1
+
+def test_idle_connection_is_pinged_and_replaced_if_broken(connections):
+    pool = make_pool(min_size=0, health_check_interval=0)
+
+    async def main():
+        async with pool.connection() as conn:
+            pass
+        async with pool.connection() as healthy:
+            pass
+        conn.broken = True
+        async with pool.connection() as replaced:
+            return conn, healthy, replaced
+    conn, healthy, replaced = asyncio.run(main())
+    assert healthy is conn and conn.pings == 2
+    # The ping's transaction is rolled back before the connection is handed out.
+    assert conn.rollbacks == 1
+    assert replaced is not conn and conn.closed and pool.stats()["size"] == 1
+
+def test_recently_used_connection_is_not_pinged(connections):
+    pool = make_pool(min_size=0, health_check_interval=60)
+
+    async def main():
+        async with pool.connection() as conn:
+            pass
+        async with pool.connection():
+            pass
+        return conn
+    assert asyncio.run(main()).pings == 0
+
+def test_closed_connection_is_replaced_without_a_ping(connections):
+    pool = make_pool(min_size=0, health_check_interval=60)
+
+    async def main():
+        async with pool.connection() as conn:
+            pass
+        conn.closed = 2
+        async with pool.connection() as replaced:
+            return conn, replaced
+    conn, replaced = asyncio.run(main())
+    assert replaced is not conn and conn.pings == 0 and len(connections) == 2
+
+def test_connections_past_their_lifetime_are_recycled(connections):
+    pool = make_pool(min_size=0, max_lifetime=0.05)
+
+    async def main():
+        idle = await pool.acquire()
+        await pool.release(idle)
+        busy = await pool.acquire()
+        assert busy is idle
+        await asyncio.sleep(0.1)
+        # Expired while checked out: closed on release instead of going back to the pool.
+        await pool.release(busy)
+        fresh = await pool.acquire()
+        await pool.release(fresh)
+        await asyncio.sleep(0.1)
+        # Expired while idle: replaced on acquire.
+        return busy, fresh, await pool.acquire()
+    busy, fresh, replacement = asyncio.run(main())
+    assert busy.closed and fresh.closed and not replacement.closed
+    assert len({id(busy), id(fresh), id(replacement)}) == 3
+    assert pool.stats() == {"size": 1, "idle": 0, "in_use": 1}
+
+def test_failed_connect_frees_its_slot(connections):
+    pool = make_pool(min_size=0, max_size=1)
+    connections.connect.fail_next = True
+
+    async def main():
+        with pytest.raises(psycopg2.OperationalError):
+            await pool.acquire()
+        return await asyncio.wait_for(pool.acquire(), 5)
+    assert asyncio.run(main()) is connections[0]
+    assert pool.stats() == {"size": 1, "idle": 0, "in_use": 1}
+
+def test_closed_pool_closes_its_connections(connections):
+    pool = make_pool(min_size=2)
+
+    async def main():
+        await pool.open()
+        busy = await pool.acquire()
+        await pool.close()
+        idle_closed = [conn.closed for conn in connections if conn is not busy]
+        busy_open = not busy.closed
+        await pool.release(busy)
+        with pytest.raises(Exception, match="closed"):
+            await pool.acquire()
+        return idle_closed, busy_open, busy
+    idle_closed, busy_open, busy = asyncio.run(main())
+    assert idle_closed == [1] and busy_open and busy.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from chunk_planner import key_range_chunks
+from fake_databases import FakeDatabase
+from models.progress import TableProgress
+from process_pool import ChunkProcessPool, database_settings
+from process_pool_fakes import FileDatabase, init_process
+from sync_manager import SyncManager
+
+COLUMNS = [{"name": "id", "type": "integer", "type_oid": 23, "primary_key": 1},
+           {"name": "v", "type": "integer", "type_oid": 23, "primary_key": None}]
+CHUNKS = key_range_chunks(COLUMNS[0], ["25", "50", "75"])
+ROWS = [[key, key + 1000] for key in range(100)]
+# Tables with a transform are copied with binary COPY only, without falling back to INSERTs.
+TRANSFORM = {"transform": "process_pool_fakes:double_values"}
+SETTINGS = {"table_locks": False, "table_options": {"t": TRANSFORM, "missing": TRANSFORM}}
+
+def file_pool(tmp_path, workers=2, copy_delay=0.0):
+    """A ChunkProcessPool whose processes copy between FileDatabases instead of connecting to PostgreSQL."""
+    source = FileDatabase({"dbname": "source", "path": str(tmp_path / "source")})
+    target = FileDatabase({"dbname": "target", "path": str(tmp_path / "target"), "copy_delay": copy_delay})
+    asyncio.run(source.connect())
+    asyncio.run(target.connect())
+    source.write_table("t", ROWS)
+    pool = ChunkProcessPool(source, target, SETTINGS, workers, report_interval=0.05)
+    # The pool's own initializer would open real connections; processes only start on first use.
+    pool.executor.shutdown()
+    pool.executor = ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_process,
+        initargs=(database_settings(source), database_settings(target), SETTINGS, pool.updates, 0.05))
+    return pool, target
+
+def test_chunks_are_copied_and_transformed_in_every_process(tmp_path):
+    pool, target = file_pool(tmp_path, copy_delay=0.2)
+
+    async def main():
+        pool.start()
+        try:
+            return await asyncio.wait_for(asyncio.gather(*(pool.copy("t", "t", COLUMNS, chunk) for chunk in CHUNKS)),
+                                          60)
+        finally:
+            await pool.close()
+    assert asyncio.run(main()) == [25, 25, 25, 25]
+    assert target.read_table("t") == [[key, 2 * (key + 1000)] for key in range(100)]
+    stats = pool.stats()
+    assert (stats["chunks"], stats["rows"], stats["processes"]) == (4, 100, 2)
+    assert stats["bytes"] > 0 and stats["seconds"] > 0
+
+def test_progress_is_reported_while_a_chunk_runs(tmp_path):
+    pool, _ = file_pool(tmp_path, workers=1, copy_delay=0.5)
+    progress = TableProgress("t", "t")
+    seen = []
+
+    async def main():
+        pool.start()
+        try:
+            copy = asyncio.create_task(pool.copy("t", "t", COLUMNS, CHUNKS[0], progress=progress))
+            while not copy.done():
+                seen.append(progress.streamed_bytes)
+                await asyncio.sleep(0.01)
+            return await copy
+        finally:
+            await pool.close()
+    rows = asyncio.run(main())
+    # Bytes arrive from the process while its COPY is still open; rows once it committed.
+    assert rows == 25 and progress.rows == 25
+    assert any(seen) and progress.streamed_bytes == pool.stats()["bytes"]
+
+def test_failing_chunk_fails_its_table_and_not_the_process(tmp_path):
+    pool, target = file_pool(tmp_path, workers=1)
+    sync = SyncManager(FakeDatabase(), FakeDatabase(), {"*": "*"}, **SETTINGS)
+
+    async def main():
+        sync.process_pool = pool
+        try:
+            with pytest.raises(Exception, match='RuntimeError: relation "missing" does not exist'):
+                await asyncio.wait_for(sync.copy_chunks("missing", "missing", COLUMNS, CHUNKS), 60)
+            # The same process copies the next table.
+            return await asyncio.wait_for(sync.copy_chunks("t", "t", COLUMNS, CHUNKS), 60)
+        finally:
+            await pool.close()
+    assert asyncio.run(main()) == [25, 25, 25, 25]
+    assert len(target.read_table("t")) == 100
+    assert pool.stats()["processes"] == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from pgoutput_messages import delete, insert, relation, update
+from replication import ChangeApplier
+from utils.pgoutput import PgOutputDecoder
+
+RELID = 16384
+
+@pytest.fixture
+def applier():
+    return ChangeApplier(target_conn=None, table_mapping={"docs": "docs"})
+
+def statements(applier, identity, message):
+    decoder = PgOutputDecoder()
+    rel = decoder.decode(relation(RELID, "public", "docs", identity,
+                                  [("id", 23, True), ("title", 25, False), ("body", 25, False)]))
+    return applier._statements(rel, "docs", decoder.decode(message))
+
+def test_insert_upserts_by_key(applier):
+    assert statements(applier, "d", insert(RELID, ["1", "a", "text"])) == [
+        ('INSERT INTO "docs" ("id", "title", "body") VALUES (%s, %s, %s) '
+         'ON CONFLICT ("id") DO UPDATE SET "title" = EXCLUDED."title", "body" = EXCLUDED."body"', ("1", "a", "text"))]
+
+def test_update_without_old_tuple_upserts(applier):
+    assert statements(applier, "d", update(RELID, ["1", "b", "text"])) == [
+        ('INSERT INTO "docs" ("id", "title", "body") VALUES (%s, %s, %s) '
+         'ON CONFLICT ("id") DO UPDATE SET "title" = EXCLUDED."title", "body" = EXCLUDED."body"', ("1", "b", "text"))]
+
+def test_update_with_unchanged_toast_leaves_the_column_out(applier):
+    assert statements(applier, "d", update(RELID, ["1", "b", "u"])) == [
+        ('UPDATE "docs" SET "id" = %s, "title" = %s '
+         'WHERE ctid = (SELECT ctid FROM "docs" WHERE "id" = %s LIMIT 1)', ("1", "b", "1"))]
+
+def test_key_change_with_unchanged_toast_keeps_the_value(applier):
+    # The key-only old tuple sends "body" as null; it must not end up in the target row.
+    result = statements(applier, "d", update(RELID, ["2", "a", "u"], old=["1", None, None], old_kind="K"))
+    assert result == [
+        ('UPDATE "docs" SET "id" = %s, "title" = %s '
+         'WHERE ctid = (SELECT ctid FROM "docs" WHERE "id" = %s LIMIT 1)', ("2", "a", "1"))]
+    assert not any(query.startswith(("INSERT", "DELETE")) for query, _ in result)
+
+def test_key_change_updates_in_place(applier):
+    assert statements(applier, "d", update(RELID, ["2", "a", "text"], old=["1", None, None], old_kind="K")) == [
+        ('UPDATE "docs" SET "id" = %s, "title" = %s, "body" = %s '
+         'WHERE ctid = (SELECT ctid FROM "docs" WHERE "id" = %s LIMIT 1)', ("2", "a", "text", "1"))]
+
+def test_full_identity_takes_unchanged_toast_from_the_old_row(applier):
+    result = statements(applier, "f", update(RELID, ["1", "b", "u"], old=["1", "a", "text"], old_kind="O"))
+    assert result == [
+        ('DELETE FROM "docs" WHERE ctid = (SELECT ctid FROM "docs" WHERE "id" IS NOT DISTINCT FROM %s AND '
+         '"title" IS NOT DISTINCT FROM %s AND "body" IS NOT DISTINCT FROM %s LIMIT 1)', ("1", "a", "text")),
+        ('INSERT INTO "docs" ("id", "title", "body") VALUES (%s, %s, %s)', ("1", "b", "text"))]
+
+def test_full_identity_with_unchanged_toast_in_the_old_row_updates_in_place(applier):
+    result = statements(applier, "f", update(RELID, ["1", "b", "u"], old=["1", "a", "u"], old_kind="O"))
+    assert result == [
+        ('UPDATE "docs" SET "id" = %s, "title" = %s WHERE ctid = (SELECT ctid FROM "docs" WHERE '
+         '"id" IS NOT DISTINCT FROM %s AND "title" IS NOT DISTINCT FROM %s LIMIT 1)', ("1", "b", "1", "a"))]
+
+def test_delete_matches_the_key(applier):
+    assert statements(applier, "d", delete(RELID, ["1", None, None])) == [
+        ('DELETE FROM "docs" WHERE ctid = (SELECT ctid FROM "docs" WHERE "id" = %s LIMIT 1)', ("1",))]
+
+def test_update_with_replica_identity_nothing_is_skipped(applier):
+    assert statements(applier, "n", update(RELID, ["1", "b", "text"])) == []
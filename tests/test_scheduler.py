@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+from scheduler import SyncScheduler
+
+def sleeper(seconds, calls=None):
+    async def sync():
+        if calls is not None:
+            calls.append(time.monotonic())
+        await asyncio.sleep(seconds)
+    return sync
+
+async def run_for(scheduler, seconds):
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(seconds)
+    scheduler.stop()
+    await asyncio.wait_for(task, 1)
+
+def test_ticks_keep_a_fixed_rate():
+    async def main():
+        calls = []
+        scheduler = SyncScheduler(sleeper(0.03, calls), interval=0.1)
+        start = time.monotonic()
+        await run_for(scheduler, 0.55)
+        return scheduler, [call - start for call in calls]
+    scheduler, offsets = asyncio.run(main())
+    # Aligned to the start time: run durations do not push later ticks back.
+    assert len(offsets) == 5
+    for tick, offset in enumerate(offsets, 1):
+        assert tick * 0.1 <= offset < tick * 0.1 + 0.04
+    assert scheduler.skipped_ticks == 0
+    assert [run["trigger"] for run in scheduler.runs] == ["schedule"] * 5
+
+def test_overrunning_runs_coalesce_missed_ticks():
+    async def main():
+        calls = []
+        scheduler = SyncScheduler(sleeper(0.25, calls), interval=0.1)
+        start = time.monotonic()
+        await run_for(scheduler, 0.6)
+        return scheduler, [call - start for call in calls]
+    scheduler, offsets = asyncio.run(main())
+    # Tick 1 runs until 0.35, ticks 2 and 3 are skipped and the next run starts at tick 4, not at once.
+    assert len(offsets) == 2
+    assert 0.1 <= offsets[0] < 0.14
+    assert 0.4 <= offsets[1] < 0.44
+    assert scheduler.skipped_ticks >= 2
+    runs = list(scheduler.runs)
+    assert runs[0]["started_at"] + runs[0]["duration"] <= runs[1]["started_at"]
+
+def test_ticks_during_a_manual_run_are_skipped():
+    async def main():
+        calls = []
+        scheduler = SyncScheduler(sleeper(0.01, calls), interval=0.1)
+        loop = asyncio.create_task(scheduler.run())
+        await scheduler.run_once(sync=sleeper(0.25))
+        await asyncio.sleep(0.1)
+        scheduler.stop()
+        await asyncio.wait_for(loop, 1)
+        return scheduler, calls
+    scheduler, calls = asyncio.run(main())
+    assert scheduler.skipped_ticks == 2
+    assert [run["trigger"] for run in scheduler.runs] == ["manual", "schedule"]
+    assert len(calls) == 1
+
+def test_runs_never_overlap():
+    async def main():
+        active = []
+        async def sync():
+            active.append(1)
+            assert len(active) == 1
+            await asyncio.sleep(0.02)
+            active.pop()
+        scheduler = SyncScheduler(sync)
+        await asyncio.gather(*(scheduler.run_once() for _ in range(4)))
+        return scheduler
+    assert len(asyncio.run(main()).runs) == 4
+
+def test_failed_runs_are_recorded_and_the_schedule_continues():
+    async def main():
+        async def sync():
+            raise RuntimeError("target is down")
+        scheduler = SyncScheduler(sync, interval=0.05)
+        with pytest.raises(RuntimeError):
+            await scheduler.run_once()
+        await run_for(scheduler, 0.13)
+        return scheduler
+    scheduler = asyncio.run(main())
+    runs = list(scheduler.runs)
+    assert [run["trigger"] for run in runs] == ["manual", "schedule", "schedule"]
+    assert all(run["status"] == "failed" and run["error"] == "target is down" for run in runs)
+
+def test_stats_report_the_current_run_and_history():
+    async def main():
+        scheduler = SyncScheduler(sleeper(0), history=3)
+        seen = []
+        async def sync():
+            seen.append(scheduler.stats()["running"])
+            await asyncio.sleep(0.02)
+        for _ in range(5):
+            await scheduler.run_once()
+        await scheduler.run_once("api", sync=sync)
+        return scheduler, seen
+    scheduler, seen = asyncio.run(main())
+    assert seen[0]["trigger"] == "api" and seen[0]["status"] == "running"
+    stats = scheduler.stats()
+    assert stats["running"] is None
+    assert [run["trigger"] for run in stats["runs"]] == ["manual", "manual", "api"]
+    assert all(run["status"] == "succeeded" for run in stats["runs"])
+    assert stats["max_duration"] == stats["runs"][-1]["duration"] >= 0.02
+    assert stats["average_duration"] == pytest.approx(sum(run["duration"] for run in stats["runs"]) / 3)
+
+def test_empty_stats():
+    stats = SyncScheduler(sleeper(0), interval=60).stats()
+    assert stats == {"interval": 60, "running": None, "skipped_ticks": 0, "average_duration": None,
+                     "max_duration": None, "runs": []}
+
+def test_stop_ends_the_wait_for_the_next_tick():
+    async def main():
+        scheduler = SyncScheduler(sleeper(0), interval=60)
+        start = time.monotonic()
+        await run_for(scheduler, 0.02)
+        return scheduler, time.monotonic() - start
+    scheduler, elapsed = asyncio.run(main())
+    assert elapsed < 0.5
+    assert not scheduler.runs
+
+def test_no_interval_disables_the_schedule():
+    scheduler = SyncScheduler(sleeper(0))
+    asyncio.run(asyncio.wait_for(scheduler.run(), 0.5))
+    assert not scheduler.runs
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from models.schema import SchemaModel, TableSchema
+from utils import schema_cache
+from utils.schema_cache import SchemaCache, cache_key
+
+class CatalogDatabase:
+    """Serves a schema model and a catalog fingerprint that tests change to simulate DDL."""
+
+    def __init__(self, name="db"):
+        self.db_config = {"host": "localhost", "port": 5432, "dbname": name}
+        self.fingerprint = "v1"
+        self.rows = 10
+        self.introspections = 0
+
+    async def get_catalog_fingerprint(self, schema="public"):
+        return self.fingerprint
+
+    async def introspect_schema(self, schema="public", tables=None):
+        self.introspections += 1
+        columns = [{"name": "id", "type": "integer", "type_oid": 23, "primary_key": 1, "not_null": True},
+                   {"name": f"added_in_{self.fingerprint}", "type": "text", "type_oid": 25, "primary_key": None,
+                    "not_null": False}]
+        return SchemaModel(schema, [TableSchema("t", columns, rows=self.rows, total_bytes=8192 * self.rows, pages=1)])
+
+    async def get_table_sizes(self, schema="public"):
+        return {"t": {"rows": self.rows, "bytes": 8192 * self.rows, "pages": 1}}
+
+@pytest.fixture(autouse=True)
+def empty_memory(monkeypatch):
+    monkeypatch.setattr(schema_cache, "_memory", {})
+
+def load(cache, db, **kwargs):
+    return asyncio.run(cache.load(db, **kwargs))
+
+def test_unchanged_schema_is_introspected_once_with_fresh_sizes():
+    db = CatalogDatabase()
+    load(SchemaCache(), db)
+    db.rows = 20
+    model = load(SchemaCache(), db)
+    assert db.introspections == 1
+    assert model.get("t").size() == {"rows": 20, "bytes": 8192 * 20, "pages": 1}
+
+def test_changed_fingerprint_introspects_again():
+    db = CatalogDatabase()
+    cache = SchemaCache()
+    load(cache, db)
+    db.fingerprint = "v2"
+    model = load(cache, db)
+    assert db.introspections == 2
+    assert [col["name"] for col in model.get("t").columns] == ["id", "added_in_v2"]
+    load(cache, db)
+    assert db.introspections == 2
+
+def test_cache_file_survives_a_restart(tmp_path, monkeypatch):
+    db = CatalogDatabase()
+    first = load(SchemaCache(str(tmp_path)), db)
+    monkeypatch.setattr(schema_cache, "_memory", {})
+    second = load(SchemaCache(str(tmp_path)), db)
+    assert db.introspections == 1
+    assert second.to_dict() == first.to_dict()
+    assert os.listdir(tmp_path) == [f"{cache_key(db.db_config, 'public')}.json"]
+
+def test_cache_file_of_an_older_schema_is_replaced(tmp_path, monkeypatch):
+    db = CatalogDatabase()
+    load(SchemaCache(str(tmp_path)), db)
+    monkeypatch.setattr(schema_cache, "_memory", {})
+    db.fingerprint = "v2"
+    load(SchemaCache(str(tmp_path)), db)
+    assert db.introspections == 2
+    with open(tmp_path / f"{cache_key(db.db_config, 'public')}.json") as f:
+        assert json.load(f)["fingerprint"] == "v2"
+
+@pytest.mark.parametrize("contents", ["{not json", '{"fingerprint": "v1"}', ""])
+def test_corrupt_cache_file_is_ignored_and_rewritten(tmp_path, contents):
+    db = CatalogDatabase()
+    path = tmp_path / f"{cache_key(db.db_config, 'public')}.json"
+    path.write_text(contents)
+    model = load(SchemaCache(str(tmp_path)), db)
+    assert db.introspections == 1 and "t" in model
+    with open(path) as f:
+        assert json.load(f)["fingerprint"] == "v1"
+
+def test_unwritable_directory_keeps_the_model_in_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    db = CatalogDatabase()
+    cache = SchemaCache(str(blocker / "cache"))
+    load(cache, db)
+    load(cache, db)
+    assert db.introspections == 1
+
+def test_cache_entries_are_kept_per_database_and_table_selection():
+    first, second = CatalogDatabase("first"), CatalogDatabase("second")
+    cache = SchemaCache()
+    load(cache, first)
+    load(cache, second)
+    load(cache, first, tables=["t"])
+    assert (first.introspections, second.introspections) == (2, 1)
+    assert cache_key(first.db_config, "public", ["a", "b"]) == cache_key(first.db_config, "public", ["b", "a"])
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from fake_databases import FakeDatabase, FakeStateStore, columns
+from models.chunk import TableChunk
+from sync_locks import SyncLocks, lock_id
+from sync_manager import SyncManager
+
+class LockServer:
+    """The advisory locks of one PostgreSQL server: which session holds each key."""
+
+    def __init__(self):
+        self.held = {}
+
+class LockingTarget(FakeDatabase):
+    """A target whose connections take advisory locks on a shared LockServer, like separate sessions."""
+
+    def __init__(self, server, name="target"):
+        super().__init__(name)
+        self.server = server
+        self.unlock_error = None
+
+    async def try_advisory_lock(self, key, conn):
+        await asyncio.sleep(0)  # A round trip, which lets other sessions run.
+        if self.server.held.get(key, conn) is not conn:
+            return False
+        self.server.held[key] = conn
+        return True
+
+    async def advisory_unlock(self, key, conn):
+        if self.unlock_error is not None:
+            raise self.unlock_error
+        if self.server.held.get(key) is conn:
+            del self.server.held[key]
+
+    async def advisory_unlock_all(self, conn):
+        self.server.held = {key: owner for key, owner in self.server.held.items() if owner is not conn}
+
+TABLES = {f"t{i}": columns("id", key=("id",)) for i in range(4)}
+
+class CopyingSyncManager(SyncManager):
+    """Takes a while to copy each table, failing the ones in fail, and records the tables it copied."""
+
+    def __init__(self, source, target, fail=(), on_copy=None, **settings):
+        super().__init__(source, target, {"*": "*"}, **settings)
+        self.state_store = FakeStateStore()
+        self.fail = fail
+        self.on_copy = on_copy
+        self.copied = []
+
+    async def plan_chunks(self, source_table, columns):
+        return [TableChunk()]
+
+    async def copy_chunks(self, source_table, target_table, columns, chunks, key_columns=None, replace=False):
+        if source_table in self.fail:
+            raise RuntimeError("copy failed")
+        await asyncio.sleep(0.05)
+        if self.on_copy is not None:
+            self.on_copy(self, source_table)
+        self.copied.append(source_table)
+        return [0] * len(chunks)
+
+def test_lock_ids_are_stable_signed_32_bit_integers():
+    digest = hashlib.sha1(b"t->t").digest()
+    assert lock_id("t->t") == int.from_bytes(digest[:4], "big", signed=True)
+    assert all(-2 ** 31 <= lock_id(name) < 2 ** 31 for name in ("a", "b->c", "x" * 1000))
+
+def test_lock_keys_are_scoped_to_the_database_pair_and_table_pair():
+    server = LockServer()
+    locks = SyncLocks(FakeDatabase("source"), LockingTarget(server))
+    same = SyncLocks(FakeDatabase("source"), LockingTarget(server))
+    other_source = SyncLocks(FakeDatabase("other"), LockingTarget(server))
+    assert locks.key("a", "b") == same.key("a", "b")
+    assert locks.key("a", "b")[0] == locks.key("c", "d")[0] != other_source.key("a", "b")[0]
+    assert len({locks.key("a", "b"), locks.key("b", "a"), locks.key("a", "a")}) == 3
+
+def test_without_a_session_every_table_is_claimed():
+    locks = SyncLocks(FakeDatabase("source"), FakeDatabase("target"))
+    assert asyncio.run(locks.try_lock("t", "t"))
+    asyncio.run(locks.unlock("t", "t"))
+
+def test_a_held_table_is_skipped_by_another_session():
+    server = LockServer()
+    first = SyncLocks(FakeDatabase("source"), LockingTarget(server))
+    second = SyncLocks(FakeDatabase("source"), LockingTarget(server))
+
+    async def main():
+        async with first.session(), second.session():
+            claims = [await first.try_lock("t", "t"), await second.try_lock("t", "t")]
+            await first.unlock("t", "t")
+            claims.append(await second.try_lock("t", "t"))
+        return claims
+    assert asyncio.run(main()) == [True, False, True]
+    assert server.held == {}
+
+def test_two_managers_never_copy_the_same_table():
+    server = LockServer()
+    source = FakeDatabase("source", tables=TABLES)
+    managers = [CopyingSyncManager(source, LockingTarget(server)) for _ in range(2)]
+
+    async def main():
+        await asyncio.gather(*(sync.sync() for sync in managers))
+    asyncio.run(main())
+    copied = managers[0].copied + managers[1].copied
+    assert sorted(copied) == sorted(TABLES)
+    assert server.held == {}
+
+def test_failed_table_is_unlocked_right_away():
+    server = LockServer()
+    source = FakeDatabase("source", tables=TABLES)
+    held_during_copies = []
+
+    def record_locks(sync, table):
+        held_during_copies.append(sync.locks.key("t0", "t0") in server.held)
+
+    sync = CopyingSyncManager(source, LockingTarget(server), fail=("t0",), on_copy=record_locks)
+    with pytest.raises(Exception, match=r"Failed to sync 1 of 4 tables: \['t0'\]"):
+        asyncio.run(sync.sync())
+    # t0 failed at once, and its lock was released while the other tables were still copying.
+    assert sorted(sync.copied) == ["t1", "t2", "t3"]
+    assert held_during_copies == [False] * 3
+    assert server.held == {}
+
+def test_locks_are_released_when_the_run_ends_even_if_unlocking_fails():
+    server = LockServer()
+    target = LockingTarget(server)
+    target.unlock_error = RuntimeError("connection lost")
+    sync = CopyingSyncManager(FakeDatabase("source", tables=TABLES), target, fail=("t0",))
+    with pytest.raises(Exception, match="Failed to sync"):
+        asyncio.run(sync.sync())
+    assert sorted(sync.copied) == ["t1", "t2", "t3"]
+    assert server.held == {}
+
+def test_a_table_synced_elsewhere_at_the_same_source_state_is_released_and_skipped():
+    server = LockServer()
+    sync = CopyingSyncManager(FakeDatabase("source"), LockingTarget(server))
+    counters = {("t", "t"): (("s", 1), 0)}
+    # Another process copied t at this run's source state and stored its counters.
+    sync.state_store.counters[("t", "t")] = (("s", 1), 0)
+
+    async def main():
+        async with sync.locks.session():
+            return await sync.claim_table("t", "t", counters), dict(server.held)
+    claimed, held = asyncio.run(main())
+    assert not claimed and held == {}
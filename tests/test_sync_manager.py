@@ -0,0 +1,303 @@
+import asyncio
+
+import pytest
+
+from fake_databases import FakeDatabase, FakeStateStore, columns
+from models.chunk import TableChunk
+from sync_manager import SyncManager, projected_makespan
+from utils.state_store import StateStore
+
+class RecordingSyncManager(SyncManager):
+    """Records the copies a sync would make instead of running them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state_store = FakeStateStore()
+        self.copies = []
+        self.reloads = []
+
+    async def plan_chunks(self, source_table, columns):
+        return [TableChunk()]
+
+    async def copy_chunks(self, source_table, target_table, columns, chunks, key_columns=None, replace=False):
+        self.copies.append((source_table, target_table, chunks, key_columns, replace))
+        return [0] * len(chunks)
+
+    async def reload_table(self, source_table, target_table, columns, key_columns=None):
+        self.reloads.append((source_table, target_table, key_columns))
+
+def manager(source, target, **settings):
+    settings.setdefault("table_locks", False)
+    return RecordingSyncManager(source, target, {"*": "*"}, **settings)
+
+def test_upsert_into_a_table_with_the_key():
+    source = FakeDatabase(tables={"t": columns("id", "v", key=("id",))})
+    sync = manager(source, FakeDatabase())
+    asyncio.run(sync.sync_table("t"))
+    assert [(copy[1], copy[3]) for copy in sync.copies] == [("t", ["id"])]
+    assert not sync.reloads
+
+def test_upsert_without_a_target_key_appends():
+    # Tables created by versions that copied no keys.
+    source = FakeDatabase(tables={"t": columns("id", "v", key=("id",))})
+    target = FakeDatabase(tables={"t": columns("id", "v")})
+    sync = manager(source, target)
+    asyncio.run(sync.sync_table("t"))
+    assert [(copy[1], copy[3], copy[4]) for copy in sync.copies] == [("t", None, False)]
+    assert not sync.reloads
+
+def test_missing_key_is_added_on_request():
+    source = FakeDatabase(tables={"t": columns("id", "v", key=("id",))})
+    target = FakeDatabase(tables={"t": columns("id", "v")})
+    sync = manager(source, target, add_missing_keys=True)
+    asyncio.run(sync.sync_table("t"))
+    assert sync.reloads == [("t", "t", ["id"])]
+    assert not sync.copies
+
+def test_incremental_sync_without_a_target_key_fails():
+    source = FakeDatabase(tables={"t": columns("id", "v", key=("id",))})
+    target = FakeDatabase(tables={"t": columns("id", "v")})
+    sync = manager(source, target, table_options={"t": {"watermark_column": "v"}})
+    with pytest.raises(ValueError, match="no unique key"):
+        asyncio.run(sync.sync_table("t"))
+    assert not sync.copies
+
+def test_diff_without_a_target_key_compares_ranges():
+    source = FakeDatabase(tables={"t": columns("id", "v", key=("id",))})
+    target = FakeDatabase(tables={"t": columns("id", "v")})
+    sync = manager(source, target, write_mode="diff")
+    compared = []
+
+    async def sync_table_diff(source_table, target_table, columns):
+        compared.append(source_table)
+
+    sync.sync_table_diff = sync_table_diff
+    asyncio.run(sync.sync_table("t"))
+    assert compared == ["t"] and not sync.reloads
+
+def incremental_manager(max_value):
+    source = FakeDatabase(tables={"t": columns("id", "version", key=("id",))})
+    source.max_values["t"] = max_value
+    return manager(source, FakeDatabase(), table_options={"t": {"watermark_column": "version"}})
+
+def test_first_incremental_run_copies_up_to_the_maximum():
+    sync = incremental_manager("10")
+    asyncio.run(sync.sync_table("t"))
+    [(_, _, [chunk], key_columns, replace)] = sync.copies
+    assert chunk.where == '"version" <= %s::integer' and chunk.params == ("10",)
+    assert key_columns == ["id"] and not replace
+    assert sync.state_store.watermarks == {("t", "t"): ("version", "10")}
+
+def test_later_incremental_runs_copy_past_the_stored_mark():
+    sync = incremental_manager("25")
+    sync.state_store.watermarks[("t", "t")] = ("version", "10")
+    asyncio.run(sync.sync_table("t"))
+    [(_, _, [chunk], key_columns, _)] = sync.copies
+    assert chunk.where == '"version" > %s::integer AND "version" <= %s::integer' and chunk.params == ("10", "25")
+    assert key_columns == ["id"]
+    assert sync.state_store.watermarks[("t", "t")] == ("version", "25")
+
+@pytest.mark.parametrize("max_value", ["10", None])
+def test_incremental_run_without_new_rows_copies_nothing(max_value):
+    sync = incremental_manager(max_value)
+    sync.state_store.watermarks[("t", "t")] = ("version", "10")
+    asyncio.run(sync.sync_table("t"))
+    assert not sync.copies
+    assert sync.state_store.watermarks[("t", "t")] == ("version", "10")
+
+def test_changed_watermark_column_starts_over():
+    sync = incremental_manager("25")
+    sync.state_store.watermarks[("t", "t")] = ("updated_at", "2024-01-01")
+    asyncio.run(sync.sync_table("t"))
+    [(_, _, [chunk], _, _)] = sync.copies
+    assert chunk.params == ("25",)
+
+def test_incremental_sync_of_a_keyless_table_reloads_it():
+    source = FakeDatabase(tables={"t": columns("id", "version")})
+    sync = manager(source, FakeDatabase(), table_options={"t": {"watermark_column": "version"}})
+    asyncio.run(sync.sync_table("t"))
+    assert sync.reloads == [("t", "t", None)] and not sync.copies
+    assert not sync.state_store.watermarks
+
+class WatermarkTarget(FakeDatabase):
+    """Runs StateStore's watermark queries against a dict standing in for its control table."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = {}
+
+    async def execute_query(self, query, params=None, conn=None):
+        if query.lstrip().startswith("CREATE TABLE"):
+            return []
+        if query.lstrip().startswith("SELECT watermark_column"):
+            row = self.rows.get(params)
+            return [{"watermark_column": row[0], "watermark": row[1]}] if row else []
+        source_table, target_table, watermark_column, watermark = params
+        self.rows[(source_table, target_table)] = (watermark_column, watermark)
+        return []
+
+def test_watermarks_are_kept_in_the_state_store_between_runs():
+    target = WatermarkTarget()
+    marks = []
+    for max_value in ("10", "25", "25"):
+        sync = incremental_manager(max_value)
+        sync.target_db = target
+        sync.state_store = StateStore(target)
+        asyncio.run(sync.sync_table("t"))
+        marks.append([chunk.params for _, _, [chunk], _, _ in sync.copies])
+    assert marks == [[("10",)], [("10", "25")], []]
+    assert target.rows == {("t", "t"): ("version", "25")}
+
+class StreamingSource(FakeDatabase):
+    """Streams numbered batches of two rows and records how far it got and whether it was closed."""
+
+    def __init__(self, batches):
+        super().__init__(tables={"t": columns("id", "v", key=("id",))})
+        self.batches = batches
+        self.streamed = 0
+        self.closed = False
+        self.selected = None
+
+    async def stream_table_data(self, table_name, batch_size=1000, columns=None, where=None, params=None,
+                                snapshot=None):
+        self.selected = columns
+        try:
+            for i in range(self.batches):
+                self.streamed += 1
+                yield [{"id": 2 * i, "v": 1}, {"id": 2 * i + 1, "v": 1}]
+        finally:
+            self.closed = True
+
+class WritingTarget(FakeDatabase):
+    def __init__(self, fail_at=None, delay=0):
+        super().__init__()
+        self.fail_at = fail_at
+        self.delay = delay
+        self.written = []
+
+    async def insert_data(self, table_name, data, batch_size=1000, conflict_columns=None, commit=True, conn=None):
+        await asyncio.sleep(self.delay)
+        if len(self.written) == self.fail_at:
+            raise RuntimeError("target failed")
+        self.written.append(data)
+        return len(data)
+
+def pipe(source, target, **pipeline):
+    sync = SyncManager(source, target, {"t": "t"}, table_locks=False, pipeline=pipeline)
+    return sync.pipe_batches("t", "t", source.tables["t"], TableChunk(), 2, ["id"])
+
+def test_pipeline_writes_every_batch_of_the_named_columns():
+    source, target = StreamingSource(10), WritingTarget(delay=0.001)
+    rows = asyncio.run(asyncio.wait_for(pipe(source, target, max_rows=4), 5))
+    assert rows == 20 and len(target.written) == 10
+    assert source.selected == ["id", "v"] and source.closed
+
+def test_failing_writer_cancels_the_reader():
+    # The reader would block on the full queue forever if the writer's failure did not stop it.
+    source, target = StreamingSource(1000), WritingTarget(fail_at=1)
+    with pytest.raises(RuntimeError, match="target failed"):
+        asyncio.run(asyncio.wait_for(pipe(source, target, max_rows=4), 5))
+    assert source.closed and source.streamed < 1000
+
+def test_failing_reader_fails_the_pipeline():
+    class FailingSource(StreamingSource):
+        async def stream_table_data(self, *args, **kwargs):
+            yield [{"id": 1, "v": 1}]
+            raise RuntimeError("source failed")
+
+    target = WritingTarget()
+    with pytest.raises(RuntimeError, match="source failed"):
+        asyncio.run(asyncio.wait_for(pipe(FailingSource(0), target), 5))
+
+def run_with_change_detection(source, target, state_store, fail=(), **detection):
+    """Runs one sync of every table against a shared state store and returns the tables copied."""
+    sync = manager(source, target, change_detection={"enabled": True, **detection})
+    sync.state_store = state_store
+
+    async def copy_chunks(source_table, target_table, columns, chunks, key_columns=None, replace=False):
+        if source_table in fail:
+            raise RuntimeError("copy failed")
+        sync.copies.append(source_table)
+        return [0] * len(chunks)
+
+    sync.copy_chunks = copy_chunks
+    try:
+        asyncio.run(sync.sync())
+    except Exception:
+        if not fail:
+            raise
+    return sorted(sync.copies)
+
+def change_detection_setup():
+    tables = {"a": columns("id", key=("id",)), "b": columns("id", key=("id",))}
+    return FakeDatabase(tables=tables, counters={"a": "1:0:0", "b": "1:0:0"}), FakeDatabase(tables=tables), FakeStateStore()
+
+def test_unchanged_tables_are_skipped():
+    source, target, state_store = change_detection_setup()
+    assert run_with_change_detection(source, target, state_store) == ["a", "b"]
+    assert run_with_change_detection(source, target, state_store) == []
+    source.counters["b"] = "2:0:0"
+    assert run_with_change_detection(source, target, state_store) == ["b"]
+    assert state_store.counters == {("a", "a"): ("1:0:0", 2), ("b", "b"): ("2:0:0", 0)}
+
+def test_unchanged_tables_are_verified_every_nth_run():
+    source, target, state_store = change_detection_setup()
+    runs = [run_with_change_detection(source, target, state_store, verify_every=3) for _ in range(7)]
+    assert runs == [["a", "b"], [], [], ["a", "b"], [], [], ["a", "b"]]
+
+def test_unchanged_table_missing_from_the_target_is_synced():
+    source, target, state_store = change_detection_setup()
+    run_with_change_detection(source, target, state_store)
+    del target.tables["b"]
+    assert run_with_change_detection(source, target, state_store) == ["b"]
+
+def test_tables_without_counters_are_always_synced():
+    source, target, state_store = change_detection_setup()
+    del source.counters["b"]
+    assert run_with_change_detection(source, target, state_store) == ["a", "b"]
+    assert run_with_change_detection(source, target, state_store) == ["b"]
+
+def test_failed_table_is_synced_again_next_run():
+    source, target, state_store = change_detection_setup()
+    assert run_with_change_detection(source, target, state_store, fail=("b",)) == ["a"]
+    assert ("b", "b") not in state_store.counters
+    assert run_with_change_detection(source, target, state_store) == ["b"]
+
+def test_unreadable_counters_sync_every_table():
+    source, target, state_store = change_detection_setup()
+    run_with_change_detection(source, target, state_store)
+
+    async def get_modification_counters():
+        raise RuntimeError("permission denied for pg_stat_user_tables")
+
+    source.get_modification_counters = get_modification_counters
+    assert run_with_change_detection(source, target, state_store) == ["a", "b"]
+
+def test_projected_makespan_of_largest_first_scheduling():
+    assert projected_makespan([], 4) == 0
+    assert projected_makespan([3, 5, 4], 1) == 12
+    assert projected_makespan([3, 5, 4], 8) == 5
+    assert projected_makespan([3, 3, 5, 3, 4], 0) == 18
+    # 5 and 4 go to separate workers, then each 3 to the less loaded one: 5+3 and 4+3+3.
+    # The best split, 5+4 and 3+3+3, is 9; LPT stays within 4/3 of it.
+    assert projected_makespan([3, 3, 5, 3, 4], 2) == 10
+
+class SizedDatabase(FakeDatabase):
+    def __init__(self, sizes):
+        super().__init__(tables={name: columns("id", key=("id",)) for name in sizes})
+        self.sizes = {name: {"rows": 0, "bytes": size, "pages": 0} for name, size in sizes.items() if size is not None}
+
+    async def get_table_sizes(self):
+        return self.sizes
+
+def test_largest_tables_are_synced_first():
+    source = SizedDatabase({"small": 10, "unknown": None, "large": 1000, "medium": 100})
+    sync = manager(source, FakeDatabase(), concurrency={"tables": 1})
+    asyncio.run(sync.sync())
+    assert [copy[0] for copy in sync.copies] == ["large", "medium", "small", "unknown"]
+
+def test_tables_are_synced_in_catalog_order_without_sizes():
+    source = FakeDatabase(tables={name: columns("id", key=("id",)) for name in ("b", "c", "a")})
+    sync = manager(source, FakeDatabase(), concurrency={"tables": 1})
+    asyncio.run(sync.sync())
+    assert [copy[0] for copy in sync.copies] == ["b", "c", "a"]